@@ -1,7 +1,7 @@
 from crewai_tools import BaseTool
 import json
 import os
-import requests
+import resilience
 import time
 from PIL import Image
 from io import BytesIO
@@ -37,13 +37,13 @@ class APITool(BaseTool):
     def _run(self, url: str, method="GET", headers=None, data=None, params=None):
         try:
             if method.upper() == "GET":
-                response = requests.get(url, headers=headers, params=params)
+                response = resilience.request("GET", url, headers=headers, params=params)
             elif method.upper() == "POST":
-                response = requests.post(url, headers=headers, json=data, params=params)
+                response = resilience.request("POST", url, headers=headers, json=data, params=params)
             elif method.upper() == "PUT":
-                response = requests.put(url, headers=headers, json=data, params=params)
+                response = resilience.request("PUT", url, headers=headers, json=data, params=params)
             elif method.upper() == "DELETE":
-                response = requests.delete(url, headers=headers, params=params)
+                response = resilience.request("DELETE", url, headers=headers, params=params)
             else:
                 return f"Неподдерживаемый метод: {method}"
             
@@ -98,7 +98,7 @@ class ImageTool(BaseTool):
     def _run(self, action: str, url=None, path=None, width=None, height=None):
         try:
             if action == "download" and url:
-                response = requests.get(url)
+                response = resilience.request("GET", url)
                 img = Image.open(BytesIO(response.content))
                 save_path = path or f"image_{int(time.time())}.jpg"
                 img.save(save_path)
@@ -0,0 +1,200 @@
+"""Кэш синтезированной речи.
+
+Ключ — SHA-256 от нормализованного текста, голоса, частоты дискретизации
+и версии модели TTS. Перед SQLite-хранилищем на диске стоит LRU-кэш в
+памяти, ограниченный по байтам (а не по числу записей: фраза «Готово»
+и абзац текста занимают очень разный объём).
+
+На диске звук хранится как 16-битный PCM, сжатый zlib: это вчетверо и
+больше меньше float32, а качество для речи не меняется. При превышении
+MAX_DISK_BYTES удаляются давно не использованные записи.
+
+LLM_TTS_CACHE=0 выключает кэш.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_FILE = "tts_cache.sqlite3"
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+MAX_DISK_BYTES = 200 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+
+def normalize_text(text):
+    """Текст в том виде, в котором он влияет на звучание: без лишних пробелов."""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def make_key(text, speaker, sample_rate, model_version):
+    """Считает ключ кэша по тексту, голосу, частоте и версии модели."""
+    raw = json.dumps([normalize_text(text), speaker, sample_rate, model_version], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def encode_pcm(audio):
+    """float32 [-1, 1] -> сжатый 16-битный PCM."""
+    pcm = (np.clip(np.asarray(audio, dtype=np.float32).reshape(-1), -1.0, 1.0) * 32767).astype('<i2')
+    return zlib.compress(pcm.tobytes(), COMPRESS_LEVEL)
+
+
+def decode_pcm(data):
+    """Сжатый 16-битный PCM -> float32."""
+    return np.frombuffer(zlib.decompress(data), dtype='<i2').astype(np.float32) / 32767
+
+
+class AudioCache:
+    """Двухуровневый кэш звука: LRU в памяти (по байтам) + SQLite на диске."""
+
+    def __init__(self, path=CACHE_FILE, max_memory_bytes=MAX_MEMORY_BYTES,
+                 max_disk_bytes=MAX_DISK_BYTES, enabled=True):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_bytes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio ("
+                " key TEXT PRIMARY KEY,"
+                " pcm BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS audio_accessed ON audio(accessed)"
+            )
+        return self._conn
+
+    def contains(self, key):
+        """Есть ли запись (без учёта в счётчиках и без чтения звука)."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if key in self._memory:
+                return True
+            try:
+                return self._db().execute("SELECT 1 FROM audio WHERE key = ?", (key,)).fetchone() is not None
+            except sqlite3.Error:
+                return False
+
+    def get(self, key):
+        """Возвращает звук (float32) или None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            try:
+                db = self._db()
+                row = db.execute("SELECT pcm FROM audio WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE audio SET accessed = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+                audio = decode_pcm(row[0])
+            except (sqlite3.Error, zlib.error) as e:
+                print(f"Ошибка чтения кэша озвучки: {e}")
+                self.misses += 1
+                return None
+            self._remember(key, audio)
+            self.disk_hits += 1
+            return audio
+
+    def put(self, key, audio):
+        """Сохраняет звук в памяти и на диске."""
+        if not self.enabled or audio is None or not len(audio):
+            return
+        audio = np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+        data = encode_pcm(audio)
+        now = time.time()
+        with self._lock:
+            self._remember(key, audio)
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO audio (key, pcm, size, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, data, len(data), now, now)
+                )
+                self._evict(db)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Ошибка записи кэша озвучки: {e}")
+
+    def _remember(self, key, audio):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= old.nbytes
+        if audio.nbytes > self.max_memory_bytes:
+            return
+        self._memory[key] = audio
+        self.memory_bytes += audio.nbytes
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+
+    def _evict(self, db):
+        """Удаляет самые давно использованные записи, пока не влезем в лимит."""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        rows = db.execute("SELECT key, size FROM audio ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            db.execute("DELETE FROM audio WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        """Полностью очищает кэш."""
+        with self._lock:
+            self._memory.clear()
+            self.memory_bytes = 0
+            try:
+                db = self._db()
+                db.execute("DELETE FROM audio")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Ошибка очистки кэша озвучки: {e}")
+
+    def status(self):
+        """Краткое описание состояния кэша."""
+        if not self.enabled:
+            return "Кэш озвучки выключен"
+        return (f"Кэш озвучки: в памяти {len(self._memory)} фраз "
+                f"({self.memory_bytes / 1024 / 1024:.1f} МБ), попаданий в памяти {self.memory_hits}, "
+                f"с диска {self.disk_hits}, промахов {self.misses}")
+
+
+_cache = None
+
+
+def get_audio_cache():
+    """Возвращает общий кэш озвучки."""
+    global _cache
+    if _cache is None:
+        _cache = AudioCache(enabled=os.getenv("LLM_TTS_CACHE", "1") == "1")
+    return _cache
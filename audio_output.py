@@ -0,0 +1,212 @@
+"""Непрерывное воспроизведение озвучки через один поток вывода звука.
+
+sd.play() на каждую фразу открывает новый поток вывода, а sd.wait()
+держит синтез следующей фразы до конца воспроизведения — между фразами
+слышны паузы. Здесь озвучка идёт конвейером:
+- синтез (поток tts_queue) кладёт отсчёты в кольцевой буфер AudioRing и
+  сразу берётся за следующую фразу, опережая воспроизведение не больше
+  чем на LOOKAHEAD фраз;
+- один постоянный sounddevice.OutputStream забирает отсчёты из буфера
+  в своём callback; когда буфер пуст, он выводит тишину.
+Фразы идут встык, а первая начинает звучать сразу после своего синтеза.
+
+Буфер рассчитан на одного писателя и одного читателя: писатель меняет
+только счётчик записанного, callback — только счётчик прочитанного, так
+что callback звукового потока никогда не ждёт блокировок.
+
+Провал (underrun) — буфер опустел посреди звучания, хотя озвучивать ещё
+есть что: об этом плеер узнаёт от очереди синтеза через busy().
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+SAMPLE_RATE = 48000
+# Ёмкость буфера, сек звука
+BUFFER_SECONDS = 60
+# На сколько фраз синтез может опережать воспроизведение
+LOOKAHEAD = 2
+# Отсчётов на один вызов callback (0 — на усмотрение драйвера)
+BLOCK_SIZE = 1024
+# Шаг ожидания места в буфере, сек
+POLL_INTERVAL = 0.02
+
+
+class AudioRing:
+    """Кольцевой буфер отсчётов float32 для одного писателя и одного читателя."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        # Счётчики только растут; позиция в буфере — остаток от деления
+        self.written = 0
+        self.read = 0
+
+    def available(self):
+        return self.written - self.read
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def write(self, samples):
+        """Копирует сколько поместится; возвращает число записанных отсчётов."""
+        count = min(len(samples), self.free())
+        start = self.written % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:count - first] = samples[first:count]
+        # Счётчик сдвигается после копирования: читатель не увидит недописанное
+        self.written += count
+        return count
+
+    def read_into(self, out):
+        """Заполняет out отсчётами, недостаток — тишиной; возвращает число отсчётов."""
+        count = min(len(out), self.available())
+        start = self.read % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        out[first:count] = self.buffer[:count - first]
+        out[count:] = 0
+        self.read += count
+        return count
+
+
+class AudioPlayer:
+    """Постоянный поток вывода звука, в который по очереди пишутся фразы."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, buffer_seconds=BUFFER_SECONDS,
+                 lookahead=LOOKAHEAD, blocksize=BLOCK_SIZE):
+        self.sample_rate = sample_rate
+        self.buffer_seconds = buffer_seconds
+        self.lookahead = lookahead
+        self.blocksize = blocksize
+        self.ring = AudioRing(int(sample_rate * buffer_seconds))
+        self.stream = None
+        self._lock = threading.Lock()
+        # Концы фраз в буфере (значения ring.written); меняет только писатель
+        self._ends = deque()
+        # clear(): callback перескакивает к этой позиции
+        self._skip_to = None
+        self._generation = 0
+        self._writing = False
+        # busy() -> есть ли ожидающие или синтезируемые фразы; вызывается из callback
+        self.busy = None
+        self._sounding = False
+        self._queued_at = None
+        self.segments = 0
+        self.underruns = 0
+        self.start_latency = None
+
+    def _ensure_stream(self):
+        with self._lock:
+            if self.stream is None:
+                import sounddevice as sd
+                self.stream = sd.OutputStream(
+                    samplerate=self.sample_rate, channels=1, dtype="float32",
+                    blocksize=self.blocksize, callback=self._callback
+                )
+                self.stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        skip = self._skip_to
+        if skip is not None:
+            self._skip_to = None
+            self.ring.read = max(self.ring.read, skip)
+        count = self.ring.read_into(outdata[:, 0])
+        if count and self._queued_at is not None:
+            self.start_latency = time.monotonic() - self._queued_at
+            self._queued_at = None
+        if count < frames and self._sounding:
+            # Звук оборвался, а фразы ещё впереди: синтез не успел, будет пауза
+            busy = self.busy
+            if self._writing or (busy is not None and busy()):
+                self.underruns += 1
+        # Провал считается один раз, пока звук не пойдёт снова
+        self._sounding = count == frames
+
+    def pending(self):
+        """Сколько записанных фраз ещё не доиграно."""
+        read = self.ring.read
+        while self._ends and self._ends[0] <= read:
+            self._ends.popleft()
+        return len(self._ends)
+
+    def play(self, audio, sample_rate=None):
+        """Ставит фразу в буфер; ждёт, только если синтез слишком опередил звук.
+
+        Возвращает False, если фраза сброшена вызовом clear().
+        """
+        if sample_rate and sample_rate != self.sample_rate:
+            self.wait()
+            self.close()
+            self.sample_rate = sample_rate
+            self.ring = AudioRing(int(sample_rate * self.buffer_seconds))
+        samples = np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+        self._ensure_stream()
+        generation = self._generation
+        while self.pending() >= self.lookahead:
+            if generation != self._generation:
+                return False
+            time.sleep(POLL_INTERVAL)
+        if not self.ring.available():
+            self._queued_at = time.monotonic()
+        self._writing = True
+        try:
+            offset = 0
+            while offset < len(samples):
+                if generation != self._generation:
+                    return False
+                written = self.ring.write(samples[offset:])
+                offset += written
+                if not written:
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            self._writing = False
+        self._ends.append(self.ring.written)
+        self.segments += 1
+        return True
+
+    def clear(self):
+        """Сбрасывает всё недоигранное; звук смолкает на следующем блоке."""
+        self._generation += 1
+        self._skip_to = self.ring.written
+
+    def buffered_seconds(self):
+        return self.ring.available() / self.sample_rate
+
+    def wait(self, timeout=None):
+        """Ждёт, пока буфер будет доигран."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.ring.available() and self.stream is not None:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def close(self):
+        with self._lock:
+            if self.stream is not None:
+                self.stream.stop()
+                self.stream.close()
+                self.stream = None
+
+    def status(self):
+        """Состояние вывода звука для команды «статистика»."""
+        text = (f"Вывод звука: в буфере {self.buffered_seconds():.1f} с, "
+                f"фраз {self.segments}, провалов {self.underruns}")
+        if self.start_latency is not None:
+            text += f", задержка начала звука {self.start_latency * 1000:.0f} мс"
+        return text
+
+
+_player = None
+
+
+def get_player():
+    """Возвращает общий поток вывода звука."""
+    global _player
+    if _player is None:
+        _player = AudioPlayer()
+    return _player
@@ -0,0 +1,207 @@
+"""Маршрутизация запросов между OpenAI-совместимыми серверами.
+
+При запуске все серверы из llm_providers.MODELS_CONFIG опрашиваются
+параллельно (GET /models). Для каждого ведётся скользящая оценка TTFT и
+доли ошибок; запрос уходит на самый быстрый исправный сервер, у которого
+есть нужная модель. Ошибка сразу отодвигает сервер в конце очереди, а после
+нескольких ошибок подряд его автомат защиты (resilience.CircuitBreaker)
+выводит сервер из ротации на COOLDOWN секунд — запросы к нему не ждут
+таймаута.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+import llm_providers
+import resilience
+
+# Вес нового замера в скользящем среднем
+EWMA_ALPHA = 0.3
+# Таймаут опроса сервера при запуске, сек
+PROBE_TIMEOUT = 2.0
+# Сколько секунд не отправлять запросы на сервер, когда сработал автомат защиты
+COOLDOWN = 30.0
+# Границы таймаута ожидания первого байта, сек (зависят от оценки TTFT)
+MIN_READ_TIMEOUT = 10.0
+MAX_READ_TIMEOUT = 60.0
+
+
+class Backend:
+    """Один сервер и статистика его работы."""
+
+    def __init__(self, name, title, base_url, api_key=None, request_params=None):
+        self.name = name
+        self.title = title
+        self.base_url = base_url
+        self.api_key = api_key
+        # Дополнительные поля запроса, которые понимает этот сервер (например, cache_prompt)
+        self.request_params = dict(request_params or {})
+        self.models = set()
+        self.ttft = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        # Автомат защиты общий для всех, кто обращается к этому адресу
+        self.breaker = resilience.get_breaker(base_url, reset_timeout=COOLDOWN)
+
+    @property
+    def healthy(self):
+        return self.breaker.available
+
+    @property
+    def down_until(self):
+        return self.breaker.opened_until
+
+    def serves(self, model):
+        """Есть ли модель на сервере (пустой список — сервер не опрошен)."""
+        return not self.models or model in self.models
+
+    def prepare_payload(self, payload):
+        """Добавляет к запросу поля, специфичные для сервера (не перезаписывая заданные)."""
+        if not self.request_params:
+            return payload
+        return {**self.request_params, **payload}
+
+    def score(self):
+        """Оценка ожидаемой задержки: чем меньше, тем лучше."""
+        ttft = self.ttft if self.ttft is not None else MAX_READ_TIMEOUT / 2
+        return ttft * (1 + self.in_flight) / max(0.05, 1.0 - self.error_rate)
+
+    def describe(self):
+        state = "доступен" if self.healthy else "недоступен"
+        ttft = "-" if self.ttft is None else f"{self.ttft * 1000:.0f} мс"
+        return (f"{self.title} ({self.base_url}): {state}, TTFT≈{ttft}, "
+                f"ошибок {self.error_rate:.0%}, моделей {len(self.models)}")
+
+
+class BackendRouter:
+    """Выбирает сервер для каждого запроса."""
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_models_config(cls, config=None):
+        """Создаёт маршрутизатор по таблице провайдеров ModelManager."""
+        backends = []
+        for name, provider in llm_providers.openai_compatible_providers(config).items():
+            env_vars = provider["env_vars"]
+            backends.append(Backend(
+                name, provider.get("name", name),
+                env_vars["OPENAI_API_BASE"], env_vars.get("OPENAI_API_KEY"),
+                provider.get("request_params")
+            ))
+        return cls(backends)
+
+    def probe_all(self, timeout=PROBE_TIMEOUT):
+        """Параллельно опрашивает все серверы; возвращает число доступных."""
+        if not self.backends:
+            return 0
+        with ThreadPoolExecutor(max_workers=len(self.backends)) as pool:
+            results = list(pool.map(lambda b: self.probe(b, timeout), self.backends))
+        return sum(results)
+
+    def probe(self, backend, timeout=PROBE_TIMEOUT):
+        """Запрашивает список моделей сервера и обновляет его статистику."""
+        started = time.perf_counter()
+        try:
+            models = llm_client.list_models(backend.base_url, api_key=backend.api_key, timeout=timeout)
+        except Exception:
+            self.record_failure(backend)
+            return False
+        with self._lock:
+            backend.models = set(models)
+        # Время ответа /models — начальная оценка задержки сервера
+        self.observe_ttft(backend, time.perf_counter() - started)
+        self.record_success(backend)
+        return True
+
+    def candidates(self, model=None):
+        """Серверы в порядке предпочтения для запроса к модели.
+
+        Сначала исправные серверы с этой моделью (по возрастанию оценки
+        задержки), затем выведенные из ротации — как последний шанс.
+        """
+        with self._lock:
+            pool = [b for b in self.backends if model is None or b.serves(model)]
+            if not pool:
+                pool = list(self.backends)
+            healthy = sorted((b for b in pool if b.healthy), key=Backend.score)
+            down = sorted((b for b in pool if not b.healthy), key=lambda b: b.down_until)
+        return healthy + down
+
+    def best(self, model=None):
+        """Самый подходящий сервер или None."""
+        candidates = self.candidates(model)
+        return candidates[0] if candidates else None
+
+    def read_timeout(self, backend):
+        """Таймаут ожидания данных: несколько оценок TTFT, но в разумных пределах."""
+        if backend.ttft is None:
+            return MAX_READ_TIMEOUT
+        return min(MAX_READ_TIMEOUT, max(MIN_READ_TIMEOUT, backend.ttft * 4))
+
+    def acquire(self, backend):
+        with self._lock:
+            backend.in_flight += 1
+
+    def release(self, backend):
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+
+    def record_ttft(self, backend, seconds):
+        self.observe_ttft(backend, seconds)
+        self.record_success(backend)
+
+    def record_success(self, backend):
+        with self._lock:
+            backend.error_rate *= (1 - EWMA_ALPHA)
+        backend.breaker.record_success()
+
+    def record_failure(self, backend):
+        with self._lock:
+            backend.error_rate = backend.error_rate * (1 - EWMA_ALPHA) + EWMA_ALPHA
+        backend.breaker.record_failure()
+
+    def observe_ttft(self, backend, seconds):
+        """Учитывает замер задержки сервера в скользящем среднем."""
+        with self._lock:
+            if backend.ttft is None:
+                backend.ttft = seconds
+            else:
+                backend.ttft = backend.ttft * (1 - EWMA_ALPHA) + seconds * EWMA_ALPHA
+
+    def models(self):
+        """Все модели исправных серверов."""
+        with self._lock:
+            names = set()
+            for backend in self.backends:
+                if backend.healthy:
+                    names.update(backend.models)
+        return sorted(names)
+
+    def describe(self):
+        return "\n".join(backend.describe() for backend in self.backends)
+
+
+def select_backend(model=None):
+    """Опрашивает серверы и возвращает лучший исправный (или None).
+
+    Для скриптов, которые работают с одним сервером на всё время запуска.
+    """
+    router = get_router()
+    if not router.probe_all():
+        return None
+    return router.best(model)
+
+
+_router = None
+
+
+def get_router():
+    """Возвращает общий маршрутизатор (создаётся по таблице провайдеров)."""
+    global _router
+    if _router is None:
+        _router = BackendRouter.from_models_config()
+    return _router
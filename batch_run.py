@@ -0,0 +1,384 @@
+"""Пакетный запуск заданий из JSONL-файла без участия пользователя.
+
+Запуск: python batch_run.py jobs.jsonl [--output results.jsonl] [--concurrency 4]
+        [--model saiga_mistral_7b_gguf] [--crew-concurrency 1] [--report-every 10]
+
+Каждая строка входного файла — одно задание:
+    {"id": "q1", "prompt": "Как настроить проект на Python?", "model": "...",
+     "params": {"temperature": 0.2, "max_tokens": 500}}
+    {"id": "q2", "messages": [{"role": "user", "content": "..."}]}
+    {"id": "t1", "task": "Создай CSV файл ..."}      — задача агента crewai (run.py)
+    {"id": "t2", "preset": "3"}                      — готовая задача из меню run.py
+Без id заданием считается номер строки.
+
+Запросы к модели расходятся по серверам маршрутизатора (backend_router):
+на каждый сервер одновременно идёт не больше --concurrency запросов, при
+ошибке запрос повторяется на следующем сервере. Задачи агентов выполняются
+на одном сервере (crewai берёт адрес из окружения) не больше
+--crew-concurrency одновременно.
+
+Результаты дописываются в выходной файл сразу по готовности. При повторном
+запуске с тем же выходным файлом успешно выполненные задания пропускаются,
+а задания с ошибкой выполняются заново. В конце (и каждые --report-every
+секунд) выводится пропускная способность.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backend_router
+import llm_client
+import llm_metrics
+
+DEFAULT_MODEL = "saiga_mistral_7b_gguf"
+# Одновременных запросов на один сервер
+DEFAULT_CONCURRENCY = 4
+# Одновременных задач агентов
+DEFAULT_CREW_CONCURRENCY = 1
+# Как часто выводить промежуточную статистику, сек
+REPORT_INTERVAL = 10.0
+# Как часто перепроверять недоступные серверы, ожидая места, сек
+HEALTH_POLL = 1.0
+
+
+class JobError(Exception):
+    """Задание нельзя выполнить (ошибка в его описании)."""
+
+
+def read_jobs(path):
+    """Читает задания из JSONL-файла; возвращает список словарей с полем id."""
+    jobs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise JobError(f"строка {number}: неверный JSON ({e})")
+            job["id"] = str(job.get("id", number))
+            jobs.append(job)
+    return jobs
+
+
+def load_completed(path):
+    """Идентификаторы успешно выполненных заданий из выходного файла."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Строка, недописанная при аварийном завершении
+                continue
+            if record.get("status") == "ok":
+                completed.add(str(record.get("id")))
+    return completed
+
+
+class ResultWriter:
+    """Дописывает результаты в выходной JSONL-файл по одной строке."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+', encoding='utf-8')
+        # После аварийного завершения последняя строка может быть без перевода строки
+        if self._file.tell():
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class BackendSlots:
+    """Ограничение числа одновременных запросов на каждый сервер."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._busy = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, candidates):
+        """Ждёт свободного места и возвращает первый исправный сервер из candidates, где оно есть.
+
+        Серверы с открытым автоматом защиты пропускаются: свободное место на
+        недоступном сервере дало бы только мгновенную ошибку. Если исправных
+        нет, ожидание повторяется, пока автомат одного из них не перейдёт в
+        пробный режим.
+        """
+        with self._cond:
+            while True:
+                for backend in candidates:
+                    if backend.healthy and self._busy.get(backend.name, 0) < self.limit:
+                        self._busy[backend.name] = self._busy.get(backend.name, 0) + 1
+                        return backend
+                # Автомат восстанавливается по времени, без release(): просыпаемся к этому моменту
+                down = [b.breaker.retry_in() for b in candidates if not b.healthy]
+                self._cond.wait(min(down + [HEALTH_POLL]) or HEALTH_POLL)
+
+    def release(self, backend):
+        with self._cond:
+            self._busy[backend.name] -= 1
+            self._cond.notify_all()
+
+
+class BatchStats:
+    """Счётчики пакетного запуска для отчёта о пропускной способности."""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.ok = 0
+        self.errors = 0
+        self.tokens = 0
+        self.latencies = []
+        self.per_backend = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            if record["status"] == "ok":
+                self.ok += 1
+                self.tokens += record.get("completion_tokens") or 0
+                self.latencies.append(record["elapsed"])
+            else:
+                self.errors += 1
+            backend = record.get("backend") or "-"
+            self.per_backend[backend] = self.per_backend.get(backend, 0) + 1
+
+    def report(self):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            done = self.ok + self.errors
+            lines = [
+                f"Выполнено {done} из {self.total - self.skipped} (пропущено готовых: {self.skipped}), "
+                f"ошибок {self.errors}, время {elapsed:.1f} с",
+                f"Пропускная способность: {done / elapsed * 60:.1f} заданий/мин, "
+                f"{self.tokens / elapsed:.1f} токенов/с",
+            ]
+            if self.latencies:
+                p50 = llm_metrics.percentile(self.latencies, 50)
+                p95 = llm_metrics.percentile(self.latencies, 95)
+                lines.append(f"Время задания: p50 {p50:.2f} с, p95 {p95:.2f} с")
+            if self.per_backend:
+                lines.append("По серверам: " + ", ".join(
+                    f"{name} {count}" for name, count in sorted(self.per_backend.items())))
+        return "\n".join(lines)
+
+
+def make_payload(job, default_model):
+    """Запрос к модели по заданию."""
+    if "messages" in job:
+        messages = job["messages"]
+    elif "prompt" in job:
+        messages = []
+        if job.get("system"):
+            messages.append({"role": "system", "content": job["system"]})
+        messages.append({"role": "user", "content": job["prompt"]})
+    else:
+        raise JobError("нет ни prompt, ни messages, ни task")
+    payload = dict(job.get("params") or {})
+    payload.update({"model": job.get("model") or default_model, "messages": messages, "stream": False})
+    return payload
+
+
+class BatchRunner:
+    """Выполняет задания с ограничением одновременных запросов на сервер."""
+
+    def __init__(self, router, writer, stats, concurrency=DEFAULT_CONCURRENCY,
+                 crew_concurrency=DEFAULT_CREW_CONCURRENCY, model=DEFAULT_MODEL):
+        self.router = router
+        self.writer = writer
+        self.stats = stats
+        self.model = model
+        self.slots = BackendSlots(concurrency)
+        self._crew_slots = threading.Semaphore(crew_concurrency)
+        self._crew_ready = False
+        self._crew_lock = threading.Lock()
+
+    def run_job(self, job):
+        """Выполняет задание, записывает и возвращает его результат."""
+        started = time.perf_counter()
+        record = {"id": job["id"]}
+        try:
+            if "task" in job or "preset" in job:
+                record.update(self._run_crew(job))
+            else:
+                record.update(self._run_prompt(job))
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        self.writer.write(record)
+        self.stats.add(record)
+        return record
+
+    def _run_prompt(self, job):
+        payload = make_payload(job, self.model)
+        candidates = self.router.candidates(payload["model"])
+        if not candidates:
+            raise JobError("нет ни одного сервера")
+        last_error = None
+        # Каждый сервер пробуем не больше одного раза
+        for _ in range(len(candidates)):
+            backend = self.slots.acquire(candidates)
+            candidates = [b for b in candidates if b is not backend]
+            try:
+                return self._complete(backend, payload)
+            except JobError:
+                raise
+            except Exception as e:
+                last_error = e
+            finally:
+                self.slots.release(backend)
+        raise last_error
+
+    def _complete(self, backend, payload):
+        metrics = llm_metrics.RequestMetrics(
+            payload["model"], "batch",
+            prompt_chars=sum(len(str(m.get("content", ""))) for m in payload["messages"])
+        )
+        metrics.backend = backend.name
+        started = time.perf_counter()
+        self.router.acquire(backend)
+        try:
+            response = llm_client.chat_completion(
+                backend.base_url, backend.prepare_payload(payload), api_key=backend.api_key,
+                timeout=backend_router.MAX_READ_TIMEOUT
+            )
+            if response.status_code == 400:
+                # Запрос неверен сам по себе — другой сервер его тоже не примет
+                raise JobError(response.text[:200])
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            metrics.finish(error=type(e).__name__)
+            if not isinstance(e, JobError):
+                self.router.record_failure(backend)
+            raise
+        finally:
+            self.router.release(backend)
+        self.router.record_ttft(backend, time.perf_counter() - started)
+        metrics.mark_connected()
+        metrics.on_tokens(0)
+        usage = data.get("usage") or {}
+        metrics.prompt_tokens = usage.get("prompt_tokens", 0)
+        metrics.finish(completion_tokens=usage.get("completion_tokens"))
+        return {
+            "backend": backend.name,
+            "model": payload["model"],
+            "output": data["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+        }
+
+    def _run_crew(self, job):
+        # crewai нужен только для задач агентов
+        import run
+        with self._crew_lock:
+            if not self._crew_ready:
+                run.configure_backend(self.router.best())
+                self._crew_ready = True
+        if "task" in job:
+            description = job["task"]
+        elif str(job["preset"]) in run.TASK_PRESETS:
+            description = run.TASK_PRESETS[str(job["preset"])]
+        else:
+            raise JobError(f"нет готовой задачи {job['preset']}")
+        with self._crew_slots:
+            output = run.run_task(description, run.create_agent(verbose=False))
+        return {"backend": "crew", "model": "crew", "output": output}
+
+
+def report_periodically(stats, stop, interval):
+    while not stop.wait(interval):
+        print(stats.report().splitlines()[0], file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетное выполнение заданий из JSONL-файла")
+    parser.add_argument("jobs", help="входной JSONL-файл с заданиями")
+    parser.add_argument("--output", help="выходной JSONL-файл (по умолчанию <jobs>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="одновременных запросов на сервер")
+    parser.add_argument("--crew-concurrency", type=int, default=DEFAULT_CREW_CONCURRENCY,
+                        help="одновременных задач агентов")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="модель для заданий без поля model")
+    parser.add_argument("--base-url", help="работать только с этим сервером (без маршрутизатора)")
+    parser.add_argument("--report-every", type=float, default=REPORT_INTERVAL,
+                        help="интервал промежуточной статистики, сек (0 — не выводить)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.jobs)[0] + ".results.jsonl"
+    try:
+        jobs = read_jobs(args.jobs)
+    except (OSError, JobError) as e:
+        print(f"Не удалось прочитать задания: {e}")
+        return 1
+    completed = load_completed(output)
+    pending = [job for job in jobs if job["id"] not in completed]
+
+    if args.base_url:
+        router = backend_router.BackendRouter([
+            backend_router.Backend("cli", args.base_url, args.base_url, os.getenv("OPENAI_API_KEY"))
+        ])
+    else:
+        router = backend_router.get_router()
+    # Пул соединений должен вмещать все одновременные запросы к серверу;
+    # задаётся до probe_all(), который создаёт общую сессию
+    llm_client.set_pool_size(max(llm_client.POOL_MAXSIZE, args.concurrency))
+    available = router.probe_all()
+    print(f"Заданий: {len(jobs)}, осталось: {len(pending)}, доступных серверов: {available}")
+    print(router.describe())
+    if not pending:
+        return 0
+
+    workers = args.concurrency * max(1, len(router.backends)) + args.crew_concurrency
+
+    writer = ResultWriter(output)
+    stats = BatchStats(len(jobs), len(jobs) - len(pending))
+    runner = BatchRunner(router, writer, stats, args.concurrency, args.crew_concurrency, args.model)
+    stop = threading.Event()
+    if args.report_every > 0:
+        threading.Thread(target=report_periodically, args=(stats, stop, args.report_every),
+                         daemon=True).start()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for record in pool.map(runner.run_job, pending):
+            if record["status"] != "ok":
+                print(f"[{record['id']}] {record['error']}", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("\nПрервано: выполненные задания сохранены, повторный запуск продолжит с остальных")
+        # Начатые запросы дописываются, остальные отменяются
+        pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        pool.shutdown()
+        stop.set()
+        writer.close()
+        print(stats.report())
+        print(f"Результаты: {output}")
+    return 0 if stats.errors == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
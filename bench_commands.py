@@ -0,0 +1,180 @@
+"""Сравнение разбора команд: прежняя цепочка process_command и CommandDispatcher.
+
+Запуск: python bench_commands.py [--history conversation_history.json] [--repeat 2000]
+
+Сообщения пользователя берутся из истории разговора и дополняются
+фразами, на которых прежний разбор ошибался. Для каждого сообщения задан
+ожидаемый результат: команда и путь файла или папки (None — сообщение
+должно уйти к модели). Выводятся время разбора одного сообщения и доля
+верно разобранных сообщений для обоих вариантов.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import command_dispatcher
+
+# Ожидаемый разбор: сообщение -> (команда, путь); остальные сообщения — к модели
+EXPECTED = {
+    "создай папку test": ("create_folder", "test"),
+    "создай файл test.txt": ("create_file", "test.txt"),
+    "создай файл test.txt внутри папки test": ("create_file", os.path.join("test", "test.txt")),
+    "внутри папки test создай файл test.txt": ("create_file", os.path.join("test", "test.txt")),
+    "голос системный": ("voice", None),
+    "голос мужской": ("voice", None),
+    "создай файл notes": ("create_file", "notes.txt"),
+    "сделай main.py": ("create_file", "main.py"),
+    "в папке src создай файл app.py": ("create_file", os.path.join("src", "app.py")),
+    "создай папку logs": ("create_folder", "logs"),
+    "покажи файлы": ("list_files", None),
+    "создай приложение для заметок": ("create_app", None),
+    "кэш вкл": ("cache", None),
+    "хеджирование выкл": ("hedge", None),
+    "статистика": ("stats", None),
+    "токены": ("token_limit", None),
+    "!dir": ("run", None),
+    "! git status": ("run", None),
+    "!фон ping localhost": ("background", None),
+}
+
+# Обычные просьбы к модели, которые прежний разбор принимал за команды
+EXTRA_PHRASES = [
+    "сделай мне краткое резюме в двух словах",
+    "напиши стихотворение в стиле Пушкина",
+    "создай план тренировок в зале на неделю",
+    "напиши функцию сортировки in python",
+    "что лежит в папке docs",
+    "голосовые ассистенты бывают разные?",
+    "кэширование ответов ускоряет работу?",
+    # Команды ОС — только после «!», обычные фразы уходят к модели
+    "фон для презентации какой выбрать?",
+    "фон рабочего стола не меняется",
+    "cmd это что за программа",
+    "выполни команду из инструкции по шагам",
+] + list(EXPECTED)
+
+
+def legacy_parse_file_creation_command(text):
+    """Прежний разбор пути из cmd_assistant.py (без шаблонов содержимого)."""
+    path_patterns = [
+        (r'(?:в|во|inside|in)\s+(?:папк[еи]|каталоге|folder)?\s*([^\s\.]+)', 'in_folder'),
+        (r'([^\s\\/]+(?:\\/[^\s\\/]+)*\.[a-zA-Z0-9]+)', 'full_path'),
+    ]
+    for pattern, ptype in path_patterns:
+        match = re.search(pattern, text.lower())
+        if match:
+            if ptype == 'in_folder':
+                return f"{match.group(1).strip()}/new_file.txt"
+            return match.group(1).strip()
+    return None
+
+
+def legacy_route(command):
+    """Прежняя цепочка проверок process_command: только выбор команды, без действий."""
+    command = command.strip()
+    if command.lower().startswith("голос"):
+        return ("voice", None)
+    command = command.lower()
+    if any(word in command for word in ['создай приложение', 'сделай приложение', 'создай проект']):
+        return ("create_app", None)
+    if any(word in command.lower() for word in ['создай', 'создать', 'напиши', 'сделай']):
+        path = legacy_parse_file_creation_command(command)
+        if path:
+            return ("create_file", path)
+    if 'внутри папки' in command.lower() or 'в папке' in command.lower():
+        parts = re.split(r'внутри папки|в папке', command, flags=re.IGNORECASE)
+        if len(parts) > 1 and parts[1].strip():
+            folder = parts[1].strip().split()[0]
+            rest_command = ' '.join(parts[1].strip().split()[1:])
+            if any(cmd in rest_command.lower() for cmd in ['создай файл', 'создать файл']):
+                return ("create_file", os.path.join(folder, rest_command.split('файл')[-1].strip()))
+    if command.lower() == 'меню':
+        return ("menu", None)
+    if command.lower().startswith("создай файл") or command.lower().startswith("создать файл"):
+        filename = ' '.join(command.split()[2:]).strip('"\'')
+        if not os.path.splitext(filename)[1]:
+            filename += ".txt"
+        return ("create_file", filename)
+    elif command.lower().startswith("создай папку") or command.lower().startswith("создать папку"):
+        return ("create_folder", ' '.join(command.split()[2:]).strip('"\''))
+    elif command.lower().startswith("покажи файлы") or command.lower().startswith("показать файлы"):
+        return ("list_files", None)
+    elif command.lower() == 'cls' or command.lower() == 'очистить':
+        return ("clear", None)
+    elif command.lower() == 'помощь':
+        return ("help", None)
+    elif command.lower() == 'смена модели':
+        return ("change_model", None)
+    elif command.lower() == 'лимит токенов' or command.lower() == 'токены':
+        return ("token_limit", None)
+    elif command.lower() == 'статистика':
+        return ("stats", None)
+    elif command.lower().startswith('кэш'):
+        return ("cache", None)
+    elif command.lower().startswith('хеджирование'):
+        return ("hedge", None)
+    return None
+
+
+def dispatcher_route(dispatcher, command):
+    """Разбор через CommandDispatcher в том же виде, что и legacy_route."""
+    match = dispatcher.match(command)
+    if match is None:
+        return None
+    if match.name in ("create_file", "create_file_in_folder"):
+        return ("create_file", command_dispatcher.target_path(match))
+    if match.name == "create_folder":
+        return ("create_folder", match.args["rest"])
+    return (match.name, None)
+
+
+def load_messages(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        history = json.load(f)
+    return [m["content"] for m in history if m.get("role") == "user"]
+
+
+def accuracy(route, messages):
+    wrong = []
+    for message in messages:
+        if route(message) != EXPECTED.get(message.strip().lower()):
+            wrong.append(message)
+    return 1 - len(wrong) / len(messages), wrong
+
+
+def timed(route, messages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            route(message)
+    return (time.perf_counter() - started) / (repeat * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость и точность разбора команд")
+    parser.add_argument("--history", default="conversation_history.json")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    messages = EXTRA_PHRASES[:]
+    if os.path.exists(args.history):
+        messages = load_messages(args.history) + messages
+    dispatcher = command_dispatcher.CommandDispatcher()
+    variants = [
+        ("прежний", legacy_route),
+        ("таблица", lambda message: dispatcher_route(dispatcher, message)),
+    ]
+    print(f"Сообщений: {len(messages)}, из них команд: "
+          f"{sum(1 for m in messages if m.strip().lower() in EXPECTED)}")
+    for name, route in variants:
+        share, wrong = accuracy(route, messages)
+        cost = timed(route, messages, args.repeat)
+        print(f"{name:<8} {cost * 1e6:6.2f} мкс/сообщение, верно {share:.0%}")
+        for message in wrong:
+            print(f"         ошибка: {message.strip()!r} -> {route(message)}")
+
+
+if __name__ == "__main__":
+    main()
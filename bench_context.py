@@ -0,0 +1,115 @@
+"""Сравнение скорости подготовки контекста: прежняя prepare_messages и ContextWindow.
+
+Запуск: python bench_context.py [--history 10000] [--turns 200]
+
+Для каждого бюджета токенов история из --history сообщений прогоняется
+через --turns ходов (сообщение пользователя, запрос, ответ ассистента).
+Оба варианта считают токены одинаково (1 токен ~ 4 символа), так что
+разница — только в самой структуре данных.
+"""
+import argparse
+import random
+import time
+
+import context_window
+import token_counter
+
+SYSTEM_PROMPT = "Ты — полезный ассистент, работающий в командной строке."
+BUDGETS = (8000, 32000, 128000)
+
+
+def count_tokens(text):
+    """Приблизительный подсчет токенов (1 токен ~ 4 символа)"""
+    return len(str(text)) // 4
+
+
+def legacy_prepare_messages(history, user_message, max_tokens):
+    """Прежняя версия из cmd_assistant.py: обход истории и insert(1, ...)."""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    total_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(user_message)
+
+    for msg in reversed(history):
+        msg_tokens = count_tokens(msg["content"])
+        if total_tokens + msg_tokens > max_tokens - 500:
+            break
+        messages.insert(1, msg)
+        total_tokens += msg_tokens
+
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+class CharCounter(token_counter.TokenCounter):
+    """Тот же подсчёт, что и в legacy_prepare_messages."""
+
+    name = "chars"
+
+    def count(self, text):
+        return count_tokens(text)
+
+
+def make_history(size, rng):
+    words = ["файл", "папка", "команда", "python", "сервер", "модель", "ответ", "запрос"]
+    history = []
+    for i in range(size):
+        role = "user" if i % 2 == 0 else "assistant"
+        length = rng.randint(5, 20) if role == "user" else rng.randint(20, 120)
+        history.append({"role": role, "content": " ".join(rng.choice(words) for _ in range(length))})
+    return history
+
+
+def bench_legacy(history, turns, max_tokens, replies):
+    history = list(history)
+    started = time.perf_counter()
+    for i in range(turns):
+        user_message = replies[i][0]
+        history.append({"role": "user", "content": user_message})
+        legacy_prepare_messages(history, user_message, max_tokens)
+        history.append({"role": "assistant", "content": replies[i][1]})
+    return time.perf_counter() - started
+
+
+def bench_window(history, turns, max_tokens, replies):
+    # Копии сообщений, чтобы кэш токенов в них не переходил между прогонами
+    history = [dict(m) for m in history]
+    started = time.perf_counter()
+    # Окно строится по загруженной истории один раз — как в main()
+    window = context_window.ContextWindow(SYSTEM_PROMPT, CharCounter())
+    window.extend(history)
+    window.trim(max_tokens)
+    setup = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(turns):
+        user_message = replies[i][0]
+        history.append({"role": "user", "content": user_message})
+        window.append(history[-1])
+        window.build(user_message, max_tokens)
+        history.append({"role": "assistant", "content": replies[i][1]})
+        window.append(history[-1])
+    return time.perf_counter() - started, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=10000, help="сообщений в истории")
+    parser.add_argument("--turns", type=int, default=200, help="число ходов")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    history = make_history(args.history, rng)
+    extra = make_history(args.turns * 2, rng)
+    replies = [(extra[2 * i]["content"], extra[2 * i + 1]["content"]) for i in range(args.turns)]
+
+    print(f"История: {args.history} сообщений, ходов: {args.turns}")
+    print(f"{'бюджет':>8} {'prepare_messages':>18} {'ContextWindow':>15} {'загрузка окна':>15} {'ускорение':>10}")
+    for budget in BUDGETS:
+        legacy = bench_legacy(history, args.turns, budget, replies)
+        window, setup = bench_window(history, args.turns, budget, replies)
+        print(f"{budget:>8} {legacy / args.turns * 1e6:>15.1f} мкс {window / args.turns * 1e6:>12.1f} мкс "
+              f"{setup * 1e3:>12.1f} мс {legacy / window:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
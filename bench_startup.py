@@ -0,0 +1,69 @@
+"""Время запуска cmd_assistant с озвучкой и без неё.
+
+Запуск: python bench_startup.py [--repeat 3] [--no-voice-only]
+
+Каждый замер — отдельный процесс Python (холодный импорт). Измеряются:
+- импорт cmd_assistant — через столько появляется приглашение;
+- загружен ли torch после импорта (не должен: модель грузится в фоне);
+- с озвучкой — через сколько после запуска модель TTS готова.
+Раньше модель загружалась при импорте, и приглашение ждало импорт и
+загрузку модели вместе: это время выводится для сравнения.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import cmd_assistant
+imported = time.perf_counter() - started
+result = {"import": imported, "torch": "torch" in sys.modules}
+if cmd_assistant.voice_manager.enabled:
+    cmd_assistant.voice_manager.start_loading()
+    result["ready"] = cmd_assistant.voice_manager.wait_ready()
+    result["voice"] = time.perf_counter() - started
+print("RESULT " + json.dumps(result))
+"""
+
+
+def measure(voice):
+    env = dict(os.environ, LLM_VOICE="1" if voice else "0")
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE], env=env, capture_output=True, text=True,
+        encoding="utf-8", errors="replace", cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"замер не удался:\n{completed.stderr.strip()[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска cmd_assistant")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-voice-only", action="store_true",
+                        help="не замерять запуск с озвучкой (без torch и модели)")
+    args = parser.parse_args()
+
+    modes = [("без озвучки", False)] + ([] if args.no_voice_only else [("с озвучкой", True)])
+    for name, voice in modes:
+        runs = [measure(voice) for _ in range(args.repeat)]
+        imported = statistics.median(r["import"] for r in runs)
+        line = f"{name:<12} приглашение через {imported:.2f} с"
+        line += ", torch при импорте: " + ("да" if any(r["torch"] for r in runs) else "нет")
+        if voice:
+            if all(r["ready"] for r in runs):
+                ready = statistics.median(r["voice"] for r in runs)
+                line += f", озвучка готова через {ready:.2f} с"
+                line += f" (при загрузке во время импорта приглашение ждало бы ~{ready:.2f} с)"
+            else:
+                line += ", модель озвучки не загрузилась"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
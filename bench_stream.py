@@ -0,0 +1,301 @@
+"""Сквозной замер клиентской части на сервере-заглушке (stub_server.py).
+
+Запуск: python bench_stream.py [--runs 5] [--rate 200] [--jitter 0.2] [--chunk 1]
+        [--flows stream,send_to_ai,debug_api,simple_run] [--replay file.sse]
+
+Сервер-заглушка запускается отдельным процессом, поэтому процессорное
+время, которое считает тест, — это время только клиента. Для каждого
+сценария выводятся:
+- процессорное время клиента на токен;
+- задержка доставки токена: от отправки события сервером до получения
+  его потребителем (или до конца ответа для непотоковых сценариев);
+- задержка постановки предложения в очередь озвучки после прихода
+  последнего токена предложения.
+Отдельно замеряется стоимость разбора SSE (SSEParser) на токен.
+
+Сценарии, для которых не хватает зависимостей (cmd_assistant — torch,
+sounddevice; simple_run — openai), пропускаются.
+"""
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Метрики тестовых запросов не должны попадать в статистику ассистента
+os.environ.setdefault("LLM_METRICS_FILE", os.path.join(tempfile.gettempdir(), "bench_llm_metrics.jsonl"))
+
+import llm_client
+import llm_metrics
+import llm_stream
+import stub_server
+
+MODEL = "saiga_mistral_7b_gguf"
+MAX_TOKENS = 300
+PROMPT = [
+    {"role": "system", "content": "Ты помощник."},
+    {"role": "user", "content": "Как настроить проект на Python?"}
+]
+
+
+def start_stub(args):
+    """Запускает сервер-заглушку и возвращает (процесс, base_url)."""
+    command = [
+        sys.executable, "stub_server.py", "--port", "0",
+        "--rate", str(args.rate), "--jitter", str(args.jitter), "--chunk", str(args.chunk),
+        "--ttft", str(args.ttft), "--error-rate", str(args.error_rate),
+        "--drop-rate", str(args.drop_rate), "--seed", "1"
+    ]
+    if args.replay:
+        command += ["--replay", args.replay]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    base_url = process.stdout.readline().strip()
+    return process, base_url
+
+
+def server_sent(base_url):
+    """Время отправки событий последнего потокового ответа."""
+    root = stub_server_root(base_url)
+    return llm_client.get(f"{root}/_stub/last").json()["sent"]
+
+
+def server_tokens(base_url):
+    """Сколько токенов заглушка отправила с момента запуска."""
+    root = stub_server_root(base_url)
+    return llm_client.get(f"{root}/_stub/last").json()["tokens"]
+
+
+def stub_server_root(base_url):
+    return base_url[:-3] if base_url.endswith("/v1") else base_url
+
+
+def speech_lags(speak_times, sent):
+    """Задержки от последнего отправленного перед озвучкой события до постановки в очередь."""
+    lags = []
+    for spoken in speak_times:
+        index = bisect.bisect_right(sent, spoken) - 1
+        if index >= 0:
+            lags.append(spoken - sent[index])
+    return lags
+
+
+class TimingConsumer(llm_stream.StreamConsumer):
+    """Запоминает время получения каждого токена."""
+
+    def __init__(self):
+        self.times = []
+
+    async def on_token(self, token):
+        self.times.append(time.time())
+
+
+class Result:
+    """Сводка замеров одного сценария."""
+
+    def __init__(self, name):
+        self.name = name
+        self.tokens = 0
+        self.cpu = 0.0
+        self.wall = 0.0
+        self.delivery = []
+        self.speech = []
+        self.errors = 0
+        self.note = ""
+
+    def report(self):
+        if self.note:
+            return f"{self.name:<11} {self.note}"
+        cpu = self.cpu / self.tokens * 1e6 if self.tokens else 0.0
+        p50 = llm_metrics.percentile(self.delivery, 50)
+        p95 = llm_metrics.percentile(self.delivery, 95)
+        speech = llm_metrics.percentile(self.speech, 95)
+        return (f"{self.name:<11} токенов {self.tokens:>6}  CPU {cpu:>7.1f} мкс/токен  "
+                f"доставка p50 {_ms(p50)} p95 {_ms(p95)}  "
+                f"озвучка p95 {_ms(speech)}  ошибок {self.errors}  время {self.wall:.2f} с")
+
+
+def _ms(value):
+    return "   -    " if value is None else f"{value * 1000:>6.2f} мс"
+
+
+def measure(result, fn):
+    """Выполняет fn(), добавляя процессорное и общее время к result."""
+    cpu, wall = time.process_time(), time.perf_counter()
+    try:
+        return fn()
+    finally:
+        result.cpu += time.process_time() - cpu
+        result.wall += time.perf_counter() - wall
+
+
+def flow_stream(base_url, runs):
+    """Потоковый клиент llm_stream: вывод, озвучка по предложениям, сбор текста."""
+    result = Result("stream")
+    engine = llm_stream.get_engine()
+    payload = {"model": MODEL, "messages": PROMPT, "max_tokens": MAX_TOKENS}
+    for _ in range(runs):
+        timing = TimingConsumer()
+        spoken = []
+        consumers = [timing, llm_stream.SentenceConsumer(lambda s: spoken.append(time.time())),
+                     llm_stream.CollectConsumer()]
+        try:
+            measure(result, lambda: engine.run(llm_stream.stream_chat(base_url, payload, consumers=consumers)))
+        except Exception:
+            result.errors += 1
+            continue
+        sent = server_sent(base_url)
+        result.tokens += len(timing.times)
+        result.delivery += [got - put for got, put in zip(timing.times, sent)]
+        result.speech += speech_lags(spoken, sent)
+    return result
+
+
+def flow_send_to_ai(base_url, runs):
+    """cmd_assistant.send_to_ai целиком (без маршрутизации, с перехватом озвучки)."""
+    result = Result("send_to_ai")
+    try:
+        import cmd_assistant
+    except Exception as e:
+        result.note = f"пропущено: {e}"
+        return result
+
+    cmd_assistant.ROUTER_ENABLED = False
+    cmd_assistant.BASE_URL = base_url
+    cmd_assistant.MODEL_NAME = MODEL
+    spoken = []
+    voice = cmd_assistant.voice_manager
+    voice.enabled = True
+    voice.speak = lambda text: spoken.append(time.time())
+
+    for _ in range(runs):
+        spoken.clear()
+        history = [{"role": "user", "content": PROMPT[-1]["content"]}]
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = measure(result, lambda: cmd_assistant.send_to_ai(PROMPT[-1]["content"], history))
+        if not response or response.startswith(("Ошибка", "Произошла ошибка")):
+            result.errors += 1
+            continue
+        sent = server_sent(base_url)
+        result.tokens += len(sent)
+        finished = time.time()
+        result.delivery.append(finished - sent[-1])
+        result.speech += speech_lags(spoken, sent)
+    return result
+
+
+def flow_simple_run(base_url, runs):
+    """simple_run.request_completion через клиент openai (непотоковый запрос)."""
+    result = Result("simple_run")
+    try:
+        import openai
+        import simple_run
+    except Exception as e:
+        result.note = f"пропущено: {e}"
+        return result
+
+    client = openai.OpenAI(api_key="stub", base_url=base_url)
+    payload = {"model": MODEL, "messages": PROMPT, "max_tokens": MAX_TOKENS}
+    for _ in range(runs):
+        try:
+            text = measure(result, lambda: simple_run.request_completion(client, payload))
+        except Exception:
+            result.errors += 1
+            continue
+        result.tokens += len(stub_server._TOKEN.findall(text))
+    return result
+
+
+def flow_debug_api(base_url, runs):
+    """debug_api.py отдельным процессом (включая его паузы по 0.5 с между шагами)."""
+    result = Result("debug_api")
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    env = dict(os.environ, LLM_BASE_URL=base_url)
+    tokens_before = server_tokens(base_url)
+    for _ in range(runs):
+        before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "debug_api.py"], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        result.wall += time.perf_counter() - started
+        if resource:
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            result.cpu += (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        if completed.returncode != 0:
+            result.errors += 1
+    # Сколько токенов сервер на самом деле отдал процессам debug_api.py
+    result.tokens = server_tokens(base_url) - tokens_before
+    return result
+
+
+FLOWS = {
+    "stream": flow_stream,
+    "send_to_ai": flow_send_to_ai,
+    "debug_api": flow_debug_api,
+    "simple_run": flow_simple_run,
+}
+
+
+def bench_parser(tokens, chunk_bytes=64, repeat=20):
+    """Стоимость разбора SSE на токен (данные режутся на куски по chunk_bytes)."""
+    events = []
+    for token in tokens:
+        event = {"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+        events.append(b"data: " + json.dumps(event, ensure_ascii=False).encode('utf-8') + b"\n\n")
+    body = b"".join(events) + b"data: [DONE]\n\n"
+    pieces = [body[i:i + chunk_bytes] for i in range(0, len(body), chunk_bytes)]
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parser = llm_stream.SSEParser()
+        for piece in pieces:
+            parser.feed(piece)
+    parsed = (time.perf_counter() - started) / (repeat * len(tokens))
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for event in events:
+            json.loads(event[6:])
+    loads = (time.perf_counter() - started) / (repeat * len(tokens))
+    return parsed, loads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер клиентской части на сервере-заглушке")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=200.0, help="токенов в секунду на сервере")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--chunk", type=int, default=1)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--replay", help="файл с записанным SSE-потоком")
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    args = parser.parse_args()
+
+    tokens = stub_server.load_replay(args.replay) if args.replay else stub_server.StubConfig().tokens
+    parsed, loads = bench_parser(tokens[:MAX_TOKENS])
+    print(f"Разбор SSE: {parsed * 1e6:.2f} мкс/токен (json.loads на событие: {loads * 1e6:.2f} мкс)")
+
+    process, base_url = start_stub(args)
+    try:
+        print(f"Сервер-заглушка: {base_url}, {args.rate:g} токенов/с, разброс {args.jitter:.0%}, "
+              f"{args.chunk} токен(ов) в событии")
+        for name in args.flows.split(","):
+            print(FLOWS[name.strip()](base_url, args.runs).report())
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
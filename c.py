@@ -1,17 +1,12 @@
 import torch
+import tts_model_store
 
 # Загрузка модели
 language = 'ru'
 model_id = 'v3_1_ru'  # Модель для русского языка
 device = torch.device('cpu')  # или 'cuda' если есть GPU
 
-model, example_text = torch.hub.load(
-    repo_or_dir='snakers4/silero-models',
-    model='silero_tts',
-    language=language,
-    speaker=model_id
-)
-model.to(device)
+model = tts_model_store.load_model(model_id, device)
 
 # Синтез речи
 text = "Привет! Это тест голоса от Silero TTS."
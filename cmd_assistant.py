@@ -9,27 +9,57 @@ from colorama import Fore, Back, Style
 import shutil
 from pathlib import Path
 import threading
-import queue
-import torch
 import numpy as np
-import sounddevice as sd
-import torch.hub
-import requests
+import llm_client
+import llm_stream
+import llm_metrics
+import response_cache
+import backend_router
+import llm_providers
+import context_window
+import token_counter
+import history_summarizer
+import conversation_log
+import history_index
+import model_catalog
+import terminal_renderer
+import resilience
+import command_dispatcher
+import intent_classifier
+import command_runner
+import speech_queue
+import audio_output
+import audio_cache
+import tts_model_store
 from collections import deque
 
-# Очередь для синхронизации доступа к движку TTS
-tts_queue = queue.Queue()
+# Очередь озвучки: фразы синтезирует и проигрывает по порядку один поток.
+# LLM_TTS_QUEUE — сколько фраз может ждать, LLM_TTS_POLICY — что делать
+# при переполнении (merge/drop/block, см. speech_queue)
+TTS_QUEUE_SIZE = int(os.getenv("LLM_TTS_QUEUE", str(speech_queue.MAX_PENDING)))
+TTS_QUEUE_POLICY = os.getenv("LLM_TTS_POLICY", speech_queue.MERGE)
 
-# Простой флаг для голосового управления
-voice_enabled = True
+# Озвучка при запуске (LLM_VOICE=0 — выключена, включается командой «голос вкл»)
+voice_enabled = os.getenv("LLM_VOICE", "1") == "1"
 
 class VoiceManager:
-    def __init__(self):
-        self.enabled = False
+    """Озвучка ответов моделью Silero.
+
+    torch и модель загружаются не при создании, а в фоновом потоке при
+    первой необходимости (start_loading): приглашение появляется сразу.
+    Фразы озвучивает по порядку поток очереди self.queue (speech_queue);
+    пока модель грузится, они копятся в очереди и озвучиваются, как
+    только она готова.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
         self.current_voice = "xenia"
         self.sample_rate = 48000
         self.model = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # Вариант модели, с которым она загрузилась (входит в ключ кэша озвучки)
+        self.model_version = None
+        self.device = None
         self.voices = {
             "xenia": "xenia",
             "aidar": "aidar",
@@ -38,38 +68,66 @@ class VoiceManager:
             "eugene": "eugene",
             "random": "random"
         }
-        self.load_model()
+        self._loader = None
+        self._loaded = threading.Event()
+        self._loader_lock = threading.Lock()
+        self.queue = speech_queue.SpeechQueue(self.say, maxsize=TTS_QUEUE_SIZE, policy=TTS_QUEUE_POLICY)
+    
+    def start_loading(self, retry=False):
+        """Запускает загрузку модели в фоновом потоке (если она еще не начата).
+
+        retry=True — повторить загрузку, если прошлая попытка не удалась.
+        """
+        with self._loader_lock:
+            if self._loader is None or (retry and self.failed):
+                self._loaded.clear()
+                self._loader = threading.Thread(target=self._load_in_background, daemon=True)
+                self._loader.start()
+    
+    def _load_in_background(self):
+        started = time.perf_counter()
+        try:
+            if self.load_model():
+                print(f"[Озвучка готова за {time.perf_counter() - started:.1f} с]")
+                self.prefetch()
+        finally:
+            self._loaded.set()
+    
+    @property
+    def failed(self):
+        """Загрузка модели завершилась неудачей (повтор — «голос вкл»)."""
+        return self._loaded.is_set() and self.model is None
+
+    def wait_ready(self, timeout=None):
+        """Ждет загрузки модели (запуская ее при необходимости); True — модель готова."""
+        self.start_loading()
+        self._loaded.wait(timeout)
+        return self.model is not None
     
     def load_model(self):
         """Загружает модель для синтеза речи."""
         try:
-            # Пробуем загрузить модель с разными параметрами
-            torch.hub._validate_not_a_forked_repo = lambda a, b, c: True
+            import torch
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
             
-            # Пробуем загрузить модель с разными параметрами
-            for speaker in ['v3_1_ru', 'ru_v3', 'v3']:
+            # Модель открывается из локального хранилища (см. tts_model_store),
+            # при первом запуске скачивается; пробуем варианты по очереди
+            for speaker in ['v3_1_ru', 'ru_v3']:
                 try:
-                    self.model, _ = torch.hub.load(
-                        repo_or_dir='snakers4/silero-models',
-                        model='silero_tts',
-                        language='ru',
-                        speaker=speaker
-                    )
-                    self.model.to(self.device)
-                    self.enabled = True
+                    self.model = tts_model_store.load_model(speaker, self.device)
+                    self.model_version = speaker
                     print(f"Модель TTS успешно загружена с параметром speaker='{speaker}'")
                     return True
                 except Exception as e:
                     print(f"Не удалось загрузить с speaker='{speaker}': {str(e)[:200]}")
             
-            # Если не удалось загрузить ни с какими параметрами
-            self.enabled = False
+            # Если не удалось загрузить ни с какими параметрами;
+            # enabled не трогаем: это выбор пользователя, а не состояние модели
             print("Не удалось загрузить модель TTS ни с какими параметрами")
             return False
             
         except Exception as e:
             print(f"Критическая ошибка при загрузке модели TTS: {e}")
-            self.enabled = False
             return False
     
     def clean_text(self, text):
@@ -85,9 +143,8 @@ class VoiceManager:
         return bool(re.search('[а-яА-ЯёЁ]', text))
 
     def speak(self, text):
-        """Озвучивает текст."""
-        if not self.enabled or not text or not self.model:
-            print("Озвучка отключена или модель не загружена")
+        """Ставит текст в очередь озвучки; модель при этом начинает загружаться."""
+        if not self.enabled or self.failed or not text:
             return
             
         # Пропускаем не-русский текст
@@ -95,72 +152,101 @@ class VoiceManager:
             print("Пропуск озвучки: текст не содержит русских символов")
             return
             
-        def _speak():
+        self.start_loading()
+        self.queue.put(text)
+
+    def say(self, text):
+        """Синтезирует и проигрывает текст; выполняется в потоке self.queue."""
+        # Пока модель грузится, очередь копит фразы
+        if not self.wait_ready() or not self.enabled:
+            return
+        try:
+            # Очищаем текст
+            clean_text = self.clean_text(text)
+            if not clean_text:
+                print("Текст для озвучки пуст")
+                return
+            
+            print(f"Озвучиваю: {clean_text[:100]}...")
+            
+            # Проверяем, что текст содержит русские символы
+            if not self.is_russian_text(clean_text):
+                print("Пропуск: текст не содержит русских символов после очистки")
+                return
+            
+            # Ограничиваем длину текста для TTS
+            if len(clean_text) > 500:
+                clean_text = clean_text[:500] + '...'
+            
+            # Генерируем аудио (или берем из кэша)
             try:
-                # Очищаем текст
-                clean_text = self.clean_text(text)
-                if not clean_text:
-                    print("Текст для озвучки пуст")
-                    return
-                
-                print(f"Озвучиваю: {clean_text[:100]}...")
-                
-                # Проверяем, что текст содержит русские символы
-                if not self.is_russian_text(clean_text):
-                    print("Пропуск: текст не содержит русских символов после очистки")
-                    return
-                
-                # Ограничиваем длину текста для TTS
-                if len(clean_text) > 500:
-                    clean_text = clean_text[:500] + '...'
-                
-                # Генерируем аудио
-                try:
-                    audio = self.model.apply_tts(
-                        text=clean_text,
-                        speaker=self.current_voice,
-                        sample_rate=self.sample_rate,
-                        put_accent=True,
-                        put_yo=True
-                    )
-                except Exception as e:
-                    print(f"Ошибка генерации TTS: {str(e)}")
-                    return
-                
-                # Воспроизводим
+                audio = self.synthesize(clean_text)
+            except Exception as e:
+                print(f"Ошибка генерации TTS: {str(e)}")
+                return
+            
+            if audio is not None:
                 try:
-                    if isinstance(audio, torch.Tensor):
-                        audio = audio.cpu().numpy()
+                    print(f"Воспроизведение аудио длительностью {len(audio)/self.sample_rate:.2f} сек")
+                    # Звук играет постоянный поток вывода, а этот поток сразу
+                    # синтезирует следующую фразу (см. audio_output)
+                    player = audio_output.get_player()
+                    # Провалы звука плеер считает, пока у этой очереди есть работа
+                    player.busy = self.queue.active
+                    player.play(audio, self.sample_rate)
                 except Exception as e:
-                    print(f"Ошибка преобразования аудио: {str(e)}")
-                    return
+                    print(f"Ошибка воспроизведения: {str(e)}")
+            else:
+                print("Не удалось сгенерировать аудио")
                 
-                if audio is not None:
-                    try:
-                        print(f"Воспроизведение аудио длительностью {len(audio)/self.sample_rate:.2f} сек")
-                        sd.play(audio, self.sample_rate)
-                        sd.wait()
-                        print("Воспроизведение завершено")
-                    except Exception as e:
-                        print(f"Ошибка воспроизведения: {str(e)}")
-                else:
-                    print("Не удалось сгенерировать аудио")
-                    
-            except Exception as e:
-                print(f"Ошибка при обработке речи: {str(e)}")
-        
-        # Запускаем в отдельном потоке
-        threading.Thread(target=_speak, daemon=True).start()
+        except Exception as e:
+            print(f"Ошибка при обработке речи: {str(e)}")
     
+    def synthesize(self, clean_text):
+        """Звук (numpy float32) для очищенного текста; повторные фразы — из кэша."""
+        cache = audio_cache.get_audio_cache()
+        # Случайный голос каждый раз звучит по-разному — его не кэшируем
+        key = None
+        if self.current_voice != "random":
+            key = audio_cache.make_key(clean_text, self.current_voice, self.sample_rate, self.model_version)
+            audio = cache.get(key)
+            if audio is not None:
+                return audio
+        audio = self.model.apply_tts(
+            text=clean_text,
+            speaker=self.current_voice,
+            sample_rate=self.sample_rate,
+            put_accent=True,
+            put_yo=True
+        )
+        if hasattr(audio, "cpu"):  # torch.Tensor
+            audio = audio.cpu().numpy()
+        if key is not None:
+            cache.put(key, audio)
+        return audio
+
+    def prefetch(self, phrases=None):
+        """Заранее синтезирует частые фразы, пока озвучивать нечего."""
+        for text in (PREFETCH_PHRASES if phrases is None else phrases):
+            for sentence in speech_sentences(text):
+                self.queue.when_idle(lambda sentence=sentence: self._prefetch_one(sentence))
+
+    def _prefetch_one(self, text):
+        clean_text = self.clean_text(text)
+        if not self.enabled or not self.model or self.current_voice == "random":
+            return
+        key = audio_cache.make_key(clean_text, self.current_voice, self.sample_rate, self.model_version)
+        if not audio_cache.get_audio_cache().contains(key):
+            self.synthesize(clean_text)
+
     def change_voice(self, voice_name):
         """Меняет голос"""
         if voice_name in self.voices:
             self.current_voice = voice_name
-            print(f"Голос изменён на: {voice_name}")
-            return True
-        print(f"Голос {voice_name} не найден. Доступные голоса: {', '.join(self.voices.keys())}")
-        return False
-        return f"Голос изменён на {voice_name}"
+            # Частые фразы новым голосом готовятся заранее
+            self.prefetch()
+            return f"Голос изменён на {voice_name}"
+        return f"Голос {voice_name} не найден. Доступные голоса: {', '.join(self.voices.keys())}"
 
     def toggle(self, state=None):
         """Включает/выключает голос"""
@@ -168,23 +254,79 @@ class VoiceManager:
             self.enabled = bool(state)
         else:
             self.enabled = not self.enabled
+        if self.enabled:
+            self.start_loading(retry=True)
+        else:
+            self.queue.clear()
+            audio_output.get_player().clear()
         status = "включен" if self.enabled else "выключен"
         return f"Голос {status}"
 
     def stop(self):
-        """Останавливает текущее воспроизведение"""
+        """Останавливает текущее воспроизведение и озвучку ожидающих фраз"""
         try:
-            sd.stop()
+            self.queue.clear()
+            audio_output.get_player().clear()
             return "Воспроизведение остановлено"
         except Exception as e:
             print(f"Ошибка при остановке воспроизведения: {str(e)}")
             return "Не удалось остановить воспроизведение"
 
-# Глобальный экземпляр VoiceManager
-voice_manager = VoiceManager()
+def speech_sentences(text):
+    """Разбивает текст на предложения для озвучки, убирая символы, которые не читаются."""
+    # Простая очистка текста
+    clean_text = re.sub(r'[^\w\s.,!?-]', ' ', text)  # Оставляем только буквы, цифры и основные знаки препинания
+    clean_text = ' '.join(clean_text.split())  # Удаляем лишние пробелы
+    
+    # Разбиваем на предложения
+    return [s.strip() for s in re.split('(?<=[.!?]) +', clean_text) if s.strip()]
+
+# Ответы команд с путями и подробностями озвучиваются короткой фразой:
+# полный путь на слух бесполезен, а постоянная фраза берется из кэша озвучки
+SPOKEN_FORMS = (
+    (re.compile(r'✓ Папка .* создана'), "Папка создана"),
+    (re.compile(r'✓ Файл .* успешно создан'), "Файл создан"),
+    (re.compile(r'❌ Ошибка при создании папки'), "Не удалось создать папку"),
+    (re.compile(r'❌ Ошибка при создании'), "Не удалось создать файл"),
+    (re.compile(r'❌ Ошибка выполнения команды|❌ Команда завершилась с кодом'), "Команда завершилась с ошибкой"),
+    (re.compile(r'✓ Команда выполнена'), "Команда выполнена"),
+)
+
+# Постоянные подтверждения команд; их звук готовится заранее (VoiceManager.prefetch)
+PREFETCH_PHRASES = (
+    "Голос включен",
+    "Голос выключен",
+    "Папка создана",
+    "Файл создан",
+    "Не удалось создать папку",
+    "Не удалось создать файл",
+    "Укажите имя файла",
+    "Укажите имя папки",
+    "Команда выполнена",
+    "Команда завершилась с ошибкой",
+    "Использование: голос [вкл/выкл/мужской/женский]",
+    "Кэш ответов очищен",
+    "Отменено",
+)
+
+def spoken_form(response):
+    """Текст ответа команды, который нужно произнести."""
+    lines = []
+    for line in response.splitlines():
+        for pattern, phrase in SPOKEN_FORMS:
+            if pattern.match(line):
+                line = phrase
+                break
+        if line.strip() and line not in lines:
+            lines.append(line)
+    return "\n".join(lines)
+
+# Глобальный экземпляр VoiceManager; модель загружается в main() или при первой фразе
+voice_manager = VoiceManager(enabled=voice_enabled)
+tts_queue = voice_manager.queue
 
 # Настройки подключения по умолчанию
-DEFAULT_BASE_URL = "http://26.224.68.101:1234/v1"
+DEFAULT_BASE_URL = llm_providers.default_base_url()
 DEFAULT_MODEL = "saiga_mistral_7b_gguf"
 DEFAULT_API_KEY = "lm-studio"
 
@@ -199,6 +341,19 @@ API_KEY = DEFAULT_API_KEY
 # Кэш доступных моделей
 AVAILABLE_MODELS = []
 
+# Выбор самого быстрого сервера из таблицы провайдеров (LLM_ROUTER=0 — всегда BASE_URL)
+ROUTER_ENABLED = os.getenv("LLM_ROUTER", "1") == "1"
+
+# Хеджирование: через HEDGE_DELAY сек без первого токена запрос дублируется на второй сервер
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", str(llm_stream.HEDGE_DELAY)))
+
+# Сколько секунд ждать начала ответа, включая повторы и переключение серверов
+TURN_DEADLINE = float(os.getenv("LLM_TURN_DEADLINE", "30"))
+
+# Предел времени системной команды, сек (0 — без ограничения)
+COMMAND_TIMEOUT = float(os.getenv("LLM_COMMAND_TIMEOUT", "300")) or None
+
 # Информация о максимальной длине контекста для разных моделей
 MODEL_CONTEXT_LENGTHS = {
     'deepseek-coder-6.7b-instruct': 16384,
@@ -279,241 +434,348 @@ def print_prompt(directory):
     """Выводит приглашение командной строки."""
     print(f"{directory}>", end=" ")
 
-def execute_system_command(command):
-    """Выполняет системную команду и возвращает результат."""
-    try:
-        import subprocess
-        result = subprocess.run(
-            command,
-            shell=True,
-            text=True,
-            capture_output=True,
-            encoding='cp866'  # Кодировка для русского языка в Windows
-        )
-        return result.stdout if result.stdout else "Команда выполнена успешно"
-    except Exception as e:
-        return f"Ошибка выполнения команды: {str(e)}"
-
-def parse_file_creation_command(text):
-    """Разбирает команду создания файла с путём и содержимым"""
-    import re
-    
-    # Паттерны для поиска путей и содержимого
-    path_patterns = [
-        (r'(?:в|во|inside|in)\s+(?:папк[еи]|каталоге|folder)?\s*([^\s\.]+)', 'in_folder'),
-        (r'([^\s\\/]+(?:\\/[^\s\\/]+)*\.[a-zA-Z0-9]+)', 'full_path'),
-    ]
-    
-    # Ищем шаблоны содержимого
-    content_templates = {
-        'крестики-нолики': 'tictactoe',
-        'калькулятор': 'calculator',
-        'заметки': 'notes',
-        'игру': 'game',
-    }
-    
-    # Извлекаем путь
-    path = None
-    content_type = None
-    
-    for pattern, ptype in path_patterns:
-        match = re.search(pattern, text.lower())
-        if match:
-            if ptype == 'in_folder':
-                folder = match.group(1).strip()
-                filename = 'new_file.txt'
-                path = f"{folder}/{filename}"
-            else:
-                path = match.group(1).strip()
-            break
-    
-    # Определяем тип содержимого
-    for keyword, template in content_templates.items():
-        if keyword in text.lower():
-            content_type = template
-            break
-    
-    return path, content_type
-
-def process_command(command, conversation_history):
-    """Обрабатывает команды для работы с файловой системой и выполнения системных команд."""
-    global BASE_URL, MODEL_NAME, API_KEY, voice_manager
+def execute_system_command(command, timeout=COMMAND_TIMEOUT):
+    """Выполняет системную команду, выводя ее вывод по мере работы.
+
+    Ctrl+C или истечение timeout завершают команду вместе с дочерними
+    процессами. Возвращает итог (код завершения, время), сам вывод уже
+    показан на экране.
+    """
+    renderer = terminal_renderer.get_renderer()
+    job = command_runner.get_job_manager().run(
+        command, timeout=timeout, on_line=lambda line: renderer.write(line + "\n")
+    )
+    renderer.flush()
+    return job.summary()
+
+def handle_run_command(match):
+    """![команда] — выполнить команду ОС"""
+    return execute_system_command(match.args["command"])
+
+def handle_background_command(match):
+    """!фон [команда] — выполнить команду в фоне"""
+    renderer = terminal_renderer.get_renderer()
+
+    def done(job):
+        renderer.write(f"\n[Фоновая задача {job.id}: {job.summary()}]\n")
+
+    job = command_runner.get_job_manager().start(match.args["command"], timeout=None, on_done=done)
+    return f"✓ Запущена фоновая задача {job.id}. Вывод: «вывод {job.id}», остановка: «стоп {job.id}»"
+
+def handle_job_output_command(match):
+    """вывод [номер] — последние строки вывода фоновой задачи"""
+    job = command_runner.get_job_manager().get(int(match.args["job"]))
+    if job is None:
+        return f"❌ Нет фоновой задачи {match.args['job']}"
+    return job.describe() + "\n" + job.output.text()
+
+def handle_job_stop_command(match):
+    """стоп [номер|все] — остановить фоновую задачу"""
+    job_id = None if match.args["job"] == "все" else int(match.args["job"])
+    stopped = command_runner.get_job_manager().stop(job_id)
+    return f"✓ Остановлено задач: {stopped}" if stopped else "Нет выполняющихся задач для остановки"
+
+def handle_voice_command(match):
+    """голос [вкл/выкл/мужской/женский]"""
+    parts = match.args["rest"].lower().split()
+    if parts:
+        if parts[0] in ["вкл", "on"]:
+            return voice_manager.toggle(True)
+        elif parts[0] in ["выкл", "off"]:
+            return voice_manager.toggle(False)
+        elif parts[0] in voice_manager.voices:
+            return voice_manager.change_voice(parts[0])
+    return "Использование: голос [вкл/выкл/мужской/женский]"
+
+def handle_create_app_command(match):
+    """Создает заготовку приложения по описанию из запроса."""
+    # Анализируем требования к приложению
+    requirements = analyze_requirements(match.text.lower())
     
-    command = command.strip()
-    response = ""
+    # Генерируем структуру приложения
+    app_structure = generate_app_structure(requirements)
     
-    # Обработка голосовых команд
-    if command.lower().startswith("голос"):
-        parts = command.split()
-        if len(parts) > 1:
-            if parts[1].lower() in ["вкл", "on"]:
-                return voice_manager.toggle(True)
-            elif parts[1].lower() in ["выкл", "off"]:
-                return voice_manager.toggle(False)
-            elif parts[1].lower() in voice_manager.voices:
-                return voice_manager.change_voice(parts[1].lower())
-        return "Использование: голос [вкл/выкл/мужской/женский]"
+    # Создаем файлы и папки
+    results = []
+    for path, content in app_structure.items():
+        if path.endswith('/'):  # Это директория
+            result = create_file(path, None)
+        else:
+            result = create_file(path, content)
+        results.append(result)
     
-    # Приводим команду к нижнему регистру для остальной обработки
-    command = command.lower()  # Анализируем команду на создание приложения
-    if any(word in command for word in ['создай приложение', 'сделай приложение', 'создай проект']):
-        # Анализируем требования к приложению
-        requirements = analyze_requirements(command)
-        
-        # Генерируем структуру приложения
-        app_structure = generate_app_structure(requirements)
+    return "\n".join(results)
+
+def handle_create_file_command(match):
+    """создай файл [имя], создай файл [имя] в папке [папка], сделай [имя.расширение]"""
+    filename = command_dispatcher.target_path(match)
+    if not filename:
+        return "❌ Укажите имя файла"
+    return create_file(filename)
+
+def handle_create_folder_command(match):
+    """создай папку [имя]"""
+    dirname = match.args["rest"].strip('"\'')
+    if not dirname:
+        return "❌ Укажите имя папки"
+    return create_folder(dirname)
+
+def list_current_directory(path=None):
+    """Содержимое папки (по умолчанию текущей) с размерами файлов."""
+    try:
+        folder = os.path.abspath(path or os.getcwd())
+        # Показываем полный путь папки
+        result = f"Текущая папка: {folder}\n" if path is None else f"Папка: {folder}\n"
+        result += "Содержимое папки:\n"
         
-        # Создаем файлы и папки
-        results = []
-        for path, content in app_structure.items():
-            if path.endswith('/'):  # Это директория
-                result = create_file(path, None)
+        # Получаем список файлов и папок
+        items = os.listdir(folder)
+        for item in items:
+            full_path = os.path.join(folder, item)
+            if os.path.isdir(full_path):
+                result += f"[Папка] {item}"
             else:
-                result = create_file(path, content)
-            results.append(result)
-        
-        return "\n".join(results)
-    
-    # Обработка создания файлов и папок
-    if any(word in command.lower() for word in ['создай', 'создать', 'напиши', 'сделай']):
-        # Пытаемся извлечь путь из команды
-        path, _ = parse_file_creation_command(command)
-        if path:
-            return create_file(path)
-    
-    # Обработка команд с указанием пути
-    if 'внутри папки' in command.lower() or 'в папке' in command.lower():
-        # Извлекаем имя папки и оставшуюся часть команды
-        parts = re.split(r'внутри папки|в папке', command, flags=re.IGNORECASE)
-        if len(parts) > 1:
-            folder = parts[1].strip().split()[0]
-            rest_command = ' '.join(parts[1].strip().split()[1:])
-            
-            # Создаем папку, если её нет
-            if not os.path.exists(folder):
-                os.makedirs(folder, exist_ok=True)
-            
-            # Обрабатываем команду внутри папки
-            if any(cmd in rest_command.lower() for cmd in ['создай файл', 'создать файл']):
-                filename = rest_command.split('файл')[-1].strip()
-                return create_file(os.path.join(folder, filename))
-    
-    # Обработка команды меню
-    if command.lower() == 'меню':
-        return show_interactive_menu()
-        
-    # Обработка команд для работы с файлами и папками
-    if command.lower().startswith("создай файл") or command.lower().startswith("создать файл"):
-        try:
-            # Извлекаем имя файла из команды
-            parts = command.split()
-            if len(parts) < 3:
-                return "❌ Укажите имя файла"
-                
-            filename = ' '.join(parts[2:]).strip('"\'')
+                result += f"[Файл]  {item}"
             
-            # Добавляем расширение .txt, если не указано
-            if not os.path.splitext(filename)[1]:
-                filename += ".txt"
-                
-            # Создаем все необходимые директории
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-            
-            # Создаем пустой файл
-            try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    pass
-                return f"✓ Файл {os.path.abspath(filename)} создан"
-            except Exception as e:
-                return f"❌ Ошибка при создании файла: {str(e)}"
-        except Exception as e:
-            return f"❌ Ошибка: {str(e)}"
-    
-    elif command.lower().startswith("создай папку") or command.lower().startswith("создать папку"):
-        try:
-            # Извлекаем имя папки из команды
-            parts = command.split()
-            if len(parts) < 3:
-                return "❌ Укажите имя папки"
-                
-            dirname = ' '.join(parts[2:]).strip('"\'')
-            return create_folder(dirname)
+            # Добавляем размер файла
+            if os.path.isfile(full_path):
+                size = os.path.getsize(full_path)
+                if size < 1024:
+                    size_str = f"{size} байт"
+                elif size < 1024*1024:
+                    size_str = f"{size/1024:.1f} КБ"
+                else:
+                    size_str = f"{size/(1024*1024):.1f} МБ"
+                result += f" ({size_str})"
+            result += "\n"
             
-        except Exception as e:
-            return f"❌ Ошибка: {str(e)}"
+        return result.strip()
+    except Exception as e:
+        return f"❌ Ошибка при получении списка файлов: {str(e)}"
+
+def handle_clear_command(match):
+    clear_screen()
+    return ""
+
+def handle_help_command(match):
+    show_help()
+    return ""
+
+def handle_change_model_command(match):
+    global MODEL_NAME
+    MODEL_NAME = select_model()
+    return f"✓ Выбрана модель: {MODEL_NAME}"
+
+def handle_stats_command(match):
+    """Скорость ответа моделей, состояние серверов и счётчики команд."""
+    result = llm_metrics.format_summary()
+    if ROUTER_ENABLED:
+        result += "\n\nСерверы:\n" + backend_router.get_router().describe()
+    result += "\n\n" + resilience.describe_breakers()
+    if HISTORY_SUMMARIZER is not None:
+        result += "\n\n" + HISTORY_SUMMARIZER.status()
+    result += "\n\n" + tts_queue.status()
+    result += "\n" + audio_output.get_player().status()
+    result += "\n" + audio_cache.get_audio_cache().status()
+    result += "\n\n" + COMMAND_DISPATCHER.status()
+    if INTENT_CLASSIFIER is not None:
+        result += "\n" + INTENT_CLASSIFIER.status()
+    return result
+
+# Локальные команды: таблица разбора — command_dispatcher.COMMANDS
+COMMAND_DISPATCHER = command_dispatcher.CommandDispatcher()
+COMMAND_HANDLERS = {
+    "voice": handle_voice_command,
+    "create_app": handle_create_app_command,
+    "create_file_in_folder": handle_create_file_command,
+    "create_file": handle_create_file_command,
+    "create_folder": handle_create_folder_command,
+    "list_files": lambda match: list_current_directory(match.args.get("path")),
+    "menu": lambda match: show_interactive_menu(),
+    "clear": handle_clear_command,
+    "help": handle_help_command,
+    "change_model": handle_change_model_command,
+    "token_limit": lambda match: change_token_limit(),
+    "stats": handle_stats_command,
+    "cache": lambda match: handle_cache_command(match.text.lower()),
+    "hedge": lambda match: handle_hedge_command(match.text.lower()),
+    "run": handle_run_command,
+    "background": handle_background_command,
+    "jobs": lambda match: command_runner.get_job_manager().describe(),
+    "job_output": handle_job_output_command,
+    "job_stop": handle_job_stop_command,
+}
+
+# Распознавание команд, сказанных своими словами (LLM_INTENTS=0 — выключено);
+# классификатор обучается в main() с учетом истории
+INTENTS_ENABLED = os.getenv("LLM_INTENTS", "1") == "1"
+INTENT_CLASSIFIER = None
+
+def process_command(command, conversation_history):
+    """Обрабатывает команды для работы с файловой системой и выполнения системных команд.
     
-    elif command.lower().startswith("покажи файлы") or command.lower().startswith("показать файлы"):
+    Сначала ищется точная команда, затем — уверенно распознанное намерение
+    («сделай мне папку logs»). Возвращает ответ команды или None, если
+    сообщение нужно отправить модели.
+    """
+    response = COMMAND_DISPATCHER.dispatch(command, COMMAND_HANDLERS)
+    if response is None and INTENT_CLASSIFIER is not None:
+        match = INTENT_CLASSIFIER.route(command)
+        if match is not None:
+            existing = existing_target(match)
+            if existing:
+                # Команда угадана, а не сказана явно: существующее не перезаписываем
+                return (f"❌ {existing} уже существует, ничего не изменено. "
+                        f"Чтобы пересоздать, используйте явную команду «создай файл ...»")
+            return COMMAND_HANDLERS[match.name](match)
+    return response
+
+def existing_target(match):
+    """Описание уже существующего файла или папки, которые создала бы команда, или None."""
+    if match.name in ("create_file", "create_file_in_folder"):
+        path = command_dispatcher.target_path(match)
+    elif match.name == "create_folder":
+        path = match.args.get("rest", "").strip('"\'')
+    else:
+        return None
+    if path and os.path.isdir(path):
+        return f"Папка {os.path.abspath(path)}"
+    if path and os.path.exists(path):
+        return f"Файл {os.path.abspath(path)}"
+    return None
+
+def handle_cache_command(command):
+    """Управляет кэшем ответов: кэш [вкл/выкл/всегда/очистить]."""
+    cache = response_cache.get_cache()
+    parts = command.split()
+    action = parts[1] if len(parts) > 1 else ""
+    if action in ["вкл", "on"]:
+        cache.enabled, cache.force = True, False
+    elif action in ["выкл", "off"]:
+        cache.enabled = False
+    elif action == "всегда":
+        cache.enabled, cache.force = True, True
+    elif action == "очистить":
+        cache.clear()
+        return "✓ Кэш ответов очищен"
+    elif action:
+        return "Использование: кэш [вкл/выкл/всегда/очистить]"
+    return cache.status()
+
+def handle_hedge_command(command):
+    """Управляет хеджированием запросов: хеджирование [вкл/выкл/<секунды>]."""
+    global HEDGE_ENABLED, HEDGE_DELAY
+    parts = command.split()
+    action = parts[1] if len(parts) > 1 else ""
+    if action in ["вкл", "on"]:
+        HEDGE_ENABLED = True
+    elif action in ["выкл", "off"]:
+        HEDGE_ENABLED = False
+    elif action:
         try:
-            # Показываем полный путь текущей директории
-            result = f"Текущая папка: {os.getcwd()}\n"
-            result += "Содержимое папки:\n"
-            
-            # Получаем список файлов и папок
-            items = os.listdir()
-            for item in items:
-                full_path = os.path.join(os.getcwd(), item)
-                if os.path.isdir(full_path):
-                    result += f"[Папка] {item}"
-                else:
-                    result += f"[Файл]  {item}"
-                
-                # Добавляем размер файла
-                if os.path.isfile(full_path):
-                    size = os.path.getsize(full_path)
-                    if size < 1024:
-                        size_str = f"{size} байт"
-                    elif size < 1024*1024:
-                        size_str = f"{size/1024:.1f} КБ"
-                    else:
-                        size_str = f"{size/(1024*1024):.1f} МБ"
-                    result += f" ({size_str})"
-                result += "\n"
-                
-            return result.strip()
-        except Exception as e:
-            return f"❌ Ошибка при получении списка файлов: {str(e)}"
+            HEDGE_DELAY = float(action.replace(',', '.'))
+            HEDGE_ENABLED = True
+        except ValueError:
+            return "Использование: хеджирование [вкл/выкл/<секунды>]"
+    if not ROUTER_ENABLED:
+        return "Хеджирование недоступно: маршрутизация серверов выключена (LLM_ROUTER=0)"
+    status = f"включено, задержка {HEDGE_DELAY:g} сек" if HEDGE_ENABLED else "выключено"
+    return f"Хеджирование запросов {status}"
+
+# Счётчик токенов текущей модели (токенизатор из tokenizers/ или оценка)
+TOKEN_COUNTER = token_counter.get_counter(DEFAULT_MODEL)
+
+def count_tokens(text):
+    """Подсчет токенов токенизатором текущей модели"""
+    return TOKEN_COUNTER.count(text)
+
+def request_summary(messages):
+    """Пересказывает блок истории текущей моделью (вызывается в фоновом потоке)."""
+    payload = {
+        "model": MODEL_NAME,
+        "messages": messages,
+        "temperature": 0.2,
+        "max_tokens": history_summarizer.SUMMARY_MAX_TOKENS,
+        "stream": False
+    }
+    base_url, api_key, read_timeout = BASE_URL, API_KEY, None
+    backend = backend_router.get_router().best(MODEL_NAME) if ROUTER_ENABLED else None
+    if backend is not None:
+        payload = backend.prepare_payload(payload)
+        base_url, api_key = backend.base_url, backend.api_key
+        read_timeout = backend_router.MAX_READ_TIMEOUT
     
-    elif command.lower() == 'cls' or command.lower() == 'очистить':
-        os.system('cls')
-        return ""
-        
-    elif command.lower() == 'помощь':
-        show_full_help()
-        return ""
-        
-    elif command.lower() == 'смена модели':
-        global MODEL_NAME
-        MODEL_NAME = select_model()
-        return f"✓ Выбрана модель: {MODEL_NAME}"
+    metrics = llm_metrics.RequestMetrics(
+        MODEL_NAME, "summary",
+        prompt_chars=sum(len(m["content"]) for m in messages)
+    )
+    if backend is not None:
+        metrics.backend = backend.name
+    try:
+        response = llm_client.chat_completion(base_url, payload, api_key=api_key, timeout=read_timeout)
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        metrics.finish(error=type(e).__name__)
+        raise
+    metrics.mark_connected()
+    metrics.on_tokens(0)
+    usage = data.get("usage") or {}
+    metrics.prompt_tokens = usage.get("prompt_tokens", 0)
+    metrics.finish(completion_tokens=usage.get("completion_tokens"))
+    return data["choices"][0]["message"]["content"]
+
+# Фоновый пересказ старой истории (LLM_SUMMARY=0 — только вытеснение)
+HISTORY_SUMMARIZER = (
+    history_summarizer.HistorySummarizer(request_summary, lambda: MODEL_NAME)
+    if os.getenv("LLM_SUMMARY", "1") == "1" else None
+)
+
+# Поиск похожих старых сообщений для запроса (LLM_RECALL=0 — выключен)
+RECALL_ENABLED = os.getenv("LLM_RECALL", "1") == "1"
+
+def create_context_window(history, summarizer=None, retriever=None):
+    """Создает окно контекста и заполняет его историей разговора.
     
-    elif command.lower() == 'лимит токенов' or command.lower() == 'токены':
-        return change_token_limit()
-        
-    # Если команда не распознана, отправляем запрос к AI
-    return None
+    История в запросе растёт только с конца, старые сообщения вытесняются
+    крупными блоками — так сервер переиспользует KV-кэш префикса.
+    С summarizer старые блоки заменяются их кратким содержанием,
+    с retriever в запрос добавляются похожие вытесненные сообщения.
+    """
+    context = context_window.ContextWindow(
+        SYSTEM_PROMPT, TOKEN_COUNTER, summarizer=summarizer, retriever=retriever
+    )
+    context.extend(history)
+    return context
+
+def prepare_messages(context, user_message):
+    """Подготавливает сообщения с учетом ограничения на длину"""
+    # Модель могла смениться — тогда окно пересчитывается новым токенизатором
+    context.set_counter(TOKEN_COUNTER)
+    return context.build(user_message, MAX_TOKENS)
 
-def count_tokens(text):
-    """Приблизительный подсчет токенов (1 токен ~ 4 символа)"""
-    return len(str(text)) // 4
+_direct_router = None
 
-def prepare_messages(history, user_message):
-    """Подготавливает сообщения с учетом ограничения на длину"""
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    total_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(user_message)
+def direct_router():
+    """Маршрутизатор из одного сервера BASE_URL (когда LLM_ROUTER=0).
     
-    # Добавляем историю, пока не достигнем лимита
-    for msg in reversed(history):
-        msg_tokens = count_tokens(msg["content"])
-        if total_tokens + msg_tokens > MAX_TOKENS - 500:  # Оставляем запас для ответа
-            break
-        messages.insert(1, msg)  # Вставляем в начало (после системного сообщения)
-        total_tokens += msg_tokens
+    Через него запросы получают те же повторы и автомат защиты, что и
+    при маршрутизации.
+    """
+    global _direct_router
+    backend = _direct_router.backends[0] if _direct_router is not None else None
+    if backend is None or backend.base_url != BASE_URL or backend.api_key != API_KEY:
+        _direct_router = backend_router.BackendRouter([
+            backend_router.Backend("direct", BASE_URL, BASE_URL, API_KEY)
+        ])
+    return _direct_router
+
+def send_to_ai(message, conversation_history, context=None):
+    """Отправляет сообщение к AI и получает ответ.
     
-    messages.append({"role": "user", "content": user_message})
-    return messages
-
-def send_to_ai(message, conversation_history):
-    """Отправляет сообщение к AI и получает ответ."""
+    context — окно контекста сессии (см. main); без него окно строится
+    по conversation_history заново.
+    """
     global BASE_URL, MODEL_NAME, API_KEY, voice_manager
     
     # Функция для озвучивания текста
@@ -522,21 +784,16 @@ def send_to_ai(message, conversation_history):
             return
             
         try:
-            # Простая очистка текста
-            clean_text = re.sub(r'[^\w\s.,!?-]', ' ', text)  # Оставляем только буквы, цифры и основные знаки препинания
-            clean_text = ' '.join(clean_text.split())  # Удаляем лишние пробелы
-            
-            # Разбиваем на предложения
-            sentences = re.split('(?<=[.!?]) +', clean_text)
-            
             # Озвучиваем каждое предложение
-            for sentence in sentences:
-                if sentence.strip():
-                    voice_manager.speak(sentence.strip())
+            for sentence in speech_sentences(text):
+                voice_manager.speak(sentence)
                     
         except Exception as e:
             print(f"Ошибка при озвучивании текста: {e}")
     
+    # Новая команда прерывает ответ, который ещё может идти в фоне
+    llm_stream.cancel_active()
+    
     # Сначала проверяем, не является ли сообщение командой
     command_response = process_command(message, conversation_history)
     if command_response is not None:
@@ -544,20 +801,18 @@ def send_to_ai(message, conversation_history):
             print()  # Пустая строка перед ответом
             simulate_typing(command_response, delay=0.005)
             print("\n")
-            # Озвучиваем ответ команды
-            speak_text(command_response)
+            # Озвучиваем ответ команды (длинные подробности — короткой фразой)
+            speak_text(spoken_form(command_response))
         return command_response
         
+    metrics = None
     try:
         print("\nОбработка запроса...", end="\r")
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {API_KEY}"
-        }
-        
         # Формируем сообщения с учетом контекста
-        messages = prepare_messages(conversation_history, message)
+        if context is None:
+            context = create_context_window(conversation_history)
+        messages = prepare_messages(context, message)
         
         data = {
             "model": MODEL_NAME,
@@ -572,87 +827,80 @@ def send_to_ai(message, conversation_history):
             "frequency_penalty": 0.5  # Штраф за частые слова
         }
         
-        # Отправляем запрос к API с потоковой передачей
-        response = requests.post(
-            f"{BASE_URL}/chat/completions", 
-            headers=headers,
-            json=data,
-            stream=True,
-            timeout=60
-        )
+        # Кэш ответов: повторный детерминированный запрос не идёт на сервер
+        cache = response_cache.get_cache()
+        cache_key = response_cache.make_key(data) if cache.is_cacheable(data) else None
+        cached_response = cache.get(cache_key) if cache_key else None
         
-        if response.status_code == 200:
-            full_response = ""
-            buffer = ""
-            print("\n")  # Две пустые строки перед ответом
-            
-            # Обрабатываем потоковые данные
-            current_sentence = ""
-            full_response = ""
-            print("\n")  # Две пустые строки перед ответом
-            
-            for line in response.iter_lines():
-                if not line:
-                    continue
-                    
-                line = line.decode('utf-8')
-                if not line.startswith('data: '):
-                    continue
-                    
-                data = line[6:]  # Удаляем префикс 'data: '
-                if data.strip() == '[DONE]':
-                    if current_sentence.strip():
-                        speak_text(current_sentence)
-                    break
-                    
-                try:
-                    chunk = json.loads(data)
-                    if not chunk.get('choices'):
-                        continue
-                        
-                    delta = chunk['choices'][0].get('delta', {})
-                    content = delta.get('content', '')
-                    
-                    if content:
-                        # Добавляем в полный ответ и текущее предложение
-                        full_response += content
-                        current_sentence += content
-                        
-                        # Выводим текст по мере поступления (только новое содержимое)
-                        print(content, end='', flush=True)
-                        
-                        # Проверяем конец предложения для озвучки
-                        if re.search(r'[.!?]\s*$', current_sentence):
-                            speak_text(current_sentence)
-                            current_sentence = ""
-                            
-                except json.JSONDecodeError as e:
-                    print(f"Ошибка декодирования JSON: {e}")
-                    continue
-                    
-            # Озвучиваем оставшийся текст, если он есть
-            if current_sentence.strip():
-                speak_text(current_sentence)
-            
-            # Выводим оставшийся буфер
-            if buffer:
-                print(buffer, end='', flush=True)
-            print("\n")  # Пустая строка после ответа
-            
-            # Озвучиваем полный ответ
-            if full_response.strip():
-                speak_text(full_response)
-            
-            return full_response.strip()
-            
+        # Токены раздаются выводу, озвучке и сборщику ответа
+        collector = llm_stream.CollectConsumer()
+        consumers = [
+            llm_stream.PrintConsumer(),
+            llm_stream.SentenceConsumer(speak_text),
+            collector
+        ]
+        print("\n")  # Пустые строки перед ответом
+        
+        if cached_response is not None:
+            # Ответ из кэша выводится и озвучивается так же, как потоковый
+            job = llm_stream.broadcast(response_cache.replay_tokens(cached_response), consumers)
         else:
-            error_msg = f"Ошибка при отправке запроса. Код ответа: {response.status_code}"
-            if response.text:
-                error_msg += f"\nТекст ответа: {response.text}"
+            # Замеры скорости ответа (см. команду «статистика»)
+            metrics = llm_metrics.RequestMetrics(
+                MODEL_NAME, "cmd_assistant",
+                prompt_tokens=context.last_total,
+                prompt_chars=sum(len(m["content"]) for m in messages)
+            )
+            # Срок ответа на весь ход: повторы и запасные серверы не ждут дольше
+            deadline = resilience.Deadline(TURN_DEADLINE)
+            if ROUTER_ENABLED:
+                job = llm_stream.stream_chat_routed(
+                    backend_router.get_router(), data, consumers, metrics=metrics,
+                    hedge_delay=HEDGE_DELAY if HEDGE_ENABLED else None, deadline=deadline
+                )
+            else:
+                job = llm_stream.stream_chat_routed(direct_router(), data, consumers,
+                                                    metrics=metrics, deadline=deadline)
+        
+        completed = False
+        renderer = terminal_renderer.get_renderer()
+        try:
+            llm_stream.get_engine().run(job)
+            completed = True
+        except KeyboardInterrupt:
+            # Сначала выводим то, что уже пришло; непроизнесенные фразы не нужны
+            renderer.flush()
+            tts_queue.clear()
+            audio_output.get_player().clear()
+            print("\n[Ответ прерван]")
+        except llm_stream.StreamError as e:
+            renderer.flush()
+            metrics.finish(error=f"HTTP {e.status_code}")
+            error_msg = f"Ошибка при отправке запроса. Код ответа: {e.status_code}"
+            if e.text:
+                error_msg += f"\nТекст ответа: {e.text}"
             print(f"\n{error_msg}\n")
             # Озвучиваем сообщение об ошибке
             speak_text(error_msg)
             return error_msg
+        except (resilience.CircuitOpenError, resilience.DeadlineExceeded) as e:
+            renderer.flush()
+            metrics.finish(error=type(e).__name__)
+            error_msg = f"Сервер не отвечает: {e}"
+            print(f"\n{error_msg}\n")
+            speak_text(error_msg)
+            return error_msg
+        
+        if metrics is not None:
+            metrics.finish(error=None if completed else "cancelled")
+        
+        full_response = collector.text
+        if completed and cache_key and cached_response is None:
+            cache.put(cache_key, full_response)
+        print("\n")  # Пустая строка после ответа
+        
+        # Ответ уже озвучен по предложениям (SentenceConsumer)
+        return full_response.strip()
             
     except Exception as e:
         error_msg = f"Произошла ошибка: {str(e)}"
@@ -660,24 +908,36 @@ def send_to_ai(message, conversation_history):
         # Озвучиваем сообщение об ошибке
         speak_text(error_msg)
         return error_msg
+    finally:
+        if metrics is not None:
+            metrics.finish(error="exception")
 
 def simulate_typing(text, delay=0.01):
-    """Имитирует печатание текста, как в CMD."""
-    for char in text:
-        print(char, end='', flush=True)
-        time.sleep(delay)
+    """Имитирует печатание текста, как в CMD (не дольше секунды при любой длине)."""
+    terminal_renderer.get_renderer().type_text(text, char_delay=delay)
     print()
 
+def create_model_catalog():
+    """Создает каталог моделей: все серверы маршрутизатора или один BASE_URL."""
+    if ROUTER_ENABLED:
+        router = backend_router.get_router()
+    else:
+        router = backend_router.BackendRouter([
+            backend_router.Backend("default", "Сервер", BASE_URL, API_KEY)
+        ])
+    return model_catalog.ModelCatalog(router, MODEL_CONTEXT_LENGTHS)
+
+# Каталог моделей: список моделей кэшируется и обновляется в фоне
+MODEL_CATALOG = create_model_catalog()
+
 def get_available_models():
     """Получает список доступных моделей с сервера."""
     global AVAILABLE_MODELS
     try:
-        print("\nЗагрузка списка моделей...")
-        response = requests.get(f"{BASE_URL}/models")
-        if response.status_code == 200:
-            models_data = response.json()
-            AVAILABLE_MODELS = [model["id"] for model in models_data.get("data", [])]
-            return AVAILABLE_MODELS
+        AVAILABLE_MODELS = MODEL_CATALOG.models()
+        if ROUTER_ENABLED:
+            print(MODEL_CATALOG.router.describe())
+        return AVAILABLE_MODELS
     except Exception as e:
         print(f"Ошибка при получении списка моделей: {str(e)}")
     return []
@@ -903,6 +1163,14 @@ def show_help():
   очистить / cls        - Очистить экран
   смена модели          - Сменить модель ИИ
   лимит токенов / токены - Изменить максимальное количество токенов
+  статистика            - Скорость ответа моделей (TTFT, токенов/сек)
+  кэш [вкл/выкл/всегда/очистить] - Кэш повторяющихся ответов модели
+  хеджирование [вкл/выкл/сек] - Дублировать медленный запрос на второй сервер
+  ![команда]            - Выполнить команду ОС (Ctrl+C - остановить)
+  !фон [команда]        - Выполнить команду ОС в фоне
+  задачи                - Список фоновых задач
+  вывод [номер]         - Последние строки вывода фоновой задачи
+  стоп [номер/все]      - Остановить фоновую задачу
   помощь                - Показать эту справку
   выход / exit          - Выйти из программы
 
@@ -912,27 +1180,22 @@ def show_help():
 
 def update_max_tokens_for_model(model_name):
     """Обновляет максимальное количество токенов в зависимости от выбранной модели."""
-    global MAX_TOKENS, CURRENT_MODEL
+    global MAX_TOKENS, CURRENT_MODEL, TOKEN_COUNTER
     
     CURRENT_MODEL = model_name.lower()
     
-    # Находим максимальную длину контекста для текущей модели
-    for model_pattern, context_length in MODEL_CONTEXT_LENGTHS.items():
-        if model_pattern.lower() in CURRENT_MODEL.lower():
-            MAX_TOKENS = context_length
-            return
+    # Токенизатор выбирается по той же модели
+    TOKEN_COUNTER = token_counter.get_counter(CURRENT_MODEL)
     
-    # Если модель не найдена в списке, используем значение по умолчанию
-    MAX_TOKENS = MODEL_CONTEXT_LENGTHS['default']
+    # Длина контекста от сервера, если он ее сообщает, иначе из таблицы
+    MAX_TOKENS = MODEL_CATALOG.context_length(model_name)
 
 def change_token_limit():
     """Позволяет изменить максимальное количество токенов вручную."""
     global MAX_TOKENS, CURRENT_MODEL
     
     if CURRENT_MODEL:
-        model_max = next((length for pattern, length in MODEL_CONTEXT_LENGTHS.items() 
-                        if pattern.lower() in CURRENT_MODEL.lower()),
-                       MODEL_CONTEXT_LENGTHS['default'])
+        model_max = MODEL_CATALOG.context_length(CURRENT_MODEL)
         print(f"\nТекущая модель: {CURRENT_MODEL}")
         print(f"Рекомендуемый максимум: {model_max} токенов")
     else:
@@ -963,20 +1226,18 @@ def select_model():
     """Позволяет пользователю выбрать модель из списка доступных."""
     global MODEL_NAME, AVAILABLE_MODELS, MAX_TOKENS
     
+    # Список из кэша каталога; сервер опрашивается только при первом вызове
+    print("\nЗагрузка списка моделей...")
+    AVAILABLE_MODELS = get_available_models()
+    
     if not AVAILABLE_MODELS:
-        print("\nЗагрузка списка моделей...")
-        AVAILABLE_MODELS = get_available_models()
-        
-        if not AVAILABLE_MODELS:
-            print("Не удалось загрузить список моделей. Используется модель по умолчанию.")
-            return MODEL_NAME
+        print("Не удалось загрузить список моделей. Используется модель по умолчанию.")
+        return MODEL_NAME
     
     print("\nДоступные модели:")
     for i, model in enumerate(AVAILABLE_MODELS, 1):
         # Показываем максимальный контекст для каждой модели
-        context_length = next((length for pattern, length in MODEL_CONTEXT_LENGTHS.items() 
-                             if pattern.lower() in model.lower()), 
-                            MODEL_CONTEXT_LENGTHS['default'])
+        context_length = MODEL_CATALOG.context_length(model)
         print(f"{i}. {model} (до {context_length} токенов)")
     
     while True:
@@ -997,36 +1258,68 @@ def select_model():
         except ValueError:
             print("\nПожалуйста, введите число.")
 
-def save_conversation_history(history):
-    """Сохраняет историю разговора в файл"""
+# Журнал разговора: каждое сообщение дописывается одной строкой
+CONVERSATION_LOG = conversation_log.ConversationLog()
+# Сколько последних сообщений читать из журнала при запуске (не больше)
+HISTORY_TAIL_MESSAGES = 1000
+
+def save_message(history, context, role, content):
+    """Добавляет сообщение в историю, окно контекста и журнал"""
+    message = {"role": role, "content": content}
+    history.append(message)
+    context.append(message)
     try:
-        with open('conversation_history.json', 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        CONVERSATION_LOG.append(message)
     except Exception as e:
         print(f"Не удалось сохранить историю: {e}")
 
 def load_conversation_history():
-    """Загружает историю разговора из файла"""
+    """Загружает из журнала хвост истории, который может попасть в окно контекста"""
     try:
-        if os.path.exists('conversation_history.json'):
-            with open('conversation_history.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
+        # Даже латиница занимает не больше ~4 символов на токен
+        return CONVERSATION_LOG.load_tail(HISTORY_TAIL_MESSAGES, max_chars=MAX_TOKENS * 4)
     except Exception as e:
         print(f"Не удалось загрузить историю: {e}")
     return []
 
+def load_older_history(tail_length):
+    """Сообщения журнала старше загруженного хвоста — для поиска по смыслу"""
+    try:
+        messages = CONVERSATION_LOG.load_all()
+    except Exception as e:
+        print(f"Не удалось прочитать старую историю: {e}")
+        return []
+    return messages[:max(0, len(messages) - tail_length)]
+
 def main():
     """Основная функция программы."""
     # Инициализация
     print_cmd_header()
     
-    # Загрузка истории
-    conversation_history = load_conversation_history()
+    # Модель озвучки грузится в фоне, пока пользователь выбирает модель и пишет
+    if voice_manager.enabled:
+        voice_manager.start_loading()
     
     # Выбор модели
     global MODEL_NAME
     MODEL_NAME = select_model()
     
+    # Загрузка истории (после выбора модели: объем зависит от ее контекста)
+    conversation_history = load_conversation_history()
+    
+    # Команды из истории дополняют примеры классификатора намерений
+    global INTENT_CLASSIFIER
+    if INTENTS_ENABLED:
+        INTENT_CLASSIFIER = intent_classifier.create_classifier(conversation_history)
+    
+    # Окно контекста живет всю сессию и пополняется вместе с историей
+    retriever = None
+    if RECALL_ENABLED:
+        # В поиск попадает весь журнал, а не только загруженный в окно хвост
+        retriever = history_index.HistoryIndex(history_index.get_embedder())
+        retriever.extend(load_older_history(len(conversation_history)))
+    context = create_context_window(conversation_history, HISTORY_SUMMARIZER, retriever)
+    
     current_dir = get_current_directory()
     
     # Приветственное сообщение
@@ -1049,24 +1342,20 @@ def main():
         # Обработка выхода
         if user_input.lower() in ['exit', 'quit', 'выход']:
             print("Выход из программы...")
-            save_conversation_history(conversation_history[-100:])  # Сохраняем последние 100 сообщений
+            CONVERSATION_LOG.close()
             break
         
         try:
             # Добавляем сообщение пользователя в историю
             if user_input.strip():
-                conversation_history.append({"role": "user", "content": user_input.strip()})
+                save_message(conversation_history, context, "user", user_input.strip())
             
             # Отправка запроса к AI
-            response = send_to_ai(user_input.strip(), conversation_history)
+            response = send_to_ai(user_input.strip(), conversation_history, context)
             
             # Добавляем ответ ассистента в историю, если он есть и не пустой
             if response and response.strip():
-                conversation_history.append({"role": "assistant", "content": response.strip()})
-            
-            # Автосохранение истории каждые 5 сообщений
-            if len(conversation_history) % 5 == 0:
-                save_conversation_history(conversation_history[-100:])
+                save_message(conversation_history, context, "assistant", response.strip())
                 
         except Exception as e:
             error_msg = f"Ошибка: {str(e)}"
@@ -1080,4 +1369,5 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"\nПроизошла непредвиденная ошибка: {str(e)}")
     finally:
+        CONVERSATION_LOG.close()  # Сбрасываем журнал разговора на диск
         colorama.deinit()  # Сбрасываем настройки colorama
@@ -0,0 +1,204 @@
+"""Разбор локальных команд ассистента (process_command в cmd_assistant.py).
+
+Команды описаны таблицей COMMANDS: точные фразы, начала фраз (префиксы)
+и регулярные выражения, у каждой команды — приоритет. При создании
+диспетчера префиксы и точные фразы собираются в одно префиксное дерево,
+а регулярные выражения компилируются. Разбор сообщения:
+- строка приводится к нижнему регистру один раз;
+- дерево проходится по символам один раз и находит все подходящие
+  префиксы (префикс должен заканчиваться на границе слова);
+- регулярные выражения проверяются по убыванию приоритета и только те,
+  чей приоритет выше лучшего найденного префикса.
+Значения (имена файлов и папок) берутся из исходной строки, поэтому
+регистр имён сохраняется.
+
+Для каждой команды считаются число срабатываний и суммарное время
+(разбор плюс обработчик); сообщения без команды учитываются отдельно.
+"""
+import os
+import re
+import threading
+import time
+
+# Ключ статистики для сообщений, которые ушли к модели
+NO_COMMAND = None
+
+_FILE_NAME = r'(?P<path>["\']?[\w\-./\\]+\.[a-z0-9]{1,8}["\']?)'
+
+
+class Command:
+    """Описание одной команды.
+
+    exact — фразы, совпадающие со всем сообщением; prefixes — начала
+    сообщения (остаток передаётся в обработчик как rest); pattern —
+    регулярное выражение (именованные группы становятся аргументами),
+    search=True — искать его в любом месте сообщения.
+    """
+
+    def __init__(self, name, exact=(), prefixes=(), pattern=None, search=False, priority=0):
+        self.name = name
+        self.exact = tuple(exact)
+        self.prefixes = tuple(prefixes)
+        self.regex = re.compile(pattern) if pattern else None
+        self.search = search
+        self.priority = priority
+
+
+class Match:
+    """Найденная команда, её аргументы и текст сообщения."""
+
+    def __init__(self, command, args, text):
+        self.command = command
+        self.args = args
+        self.text = text
+
+    @property
+    def name(self):
+        return self.command.name
+
+
+def target_path(match):
+    """Путь файла для команд создания файла ('' — имя не указано).
+
+    Без расширения добавляется .txt; папка из «в папке ...» добавляется к пути.
+    """
+    filename = match.args.get("path") or match.args.get("name") or match.args.get("rest", "")
+    filename = filename.strip('"\'')
+    if not filename:
+        return ""
+    if not os.path.splitext(filename)[1]:
+        filename += ".txt"
+    folder = match.args.get("folder", "").strip('"\'')
+    return os.path.join(folder, filename) if folder else filename
+
+
+COMMANDS = (
+    Command("voice", prefixes=("голос",), priority=100),
+    # Команды ОС: текст команды передаётся как есть. Только после «!»:
+    # обычные фразы вроде «фон для презентации...» не должны попадать в оболочку
+    Command("background", pattern=r"!\s*фон\s+(?P<command>\S.*)", priority=96),
+    Command("run", pattern=r"!\s*(?P<command>\S.*)", priority=95),
+    Command("create_app", pattern=r"(?:создай|сделай) приложение|создай проект", search=True, priority=90),
+    Command("create_file_in_folder",
+            pattern=r"(?:внутри папки|в папке)\s+(?P<folder>\S+)\s+(?:создай|создать)\s+файл\s+(?P<name>\S+)",
+            priority=80),
+    Command("create_file_in_folder",
+            pattern=r"(?:создай|создать)\s+файл\s+(?P<name>\S+)\s+(?:внутри папки|в папке)\s+(?P<folder>\S+)",
+            priority=80),
+    Command("create_file", prefixes=("создай файл", "создать файл"), priority=70),
+    Command("create_folder", prefixes=("создай папку", "создать папку"), priority=70),
+    # Глагол без слова «файл» — только если дальше сразу имя файла с расширением,
+    # иначе «сделай мне резюме в двух словах» уходило в создание файла
+    Command("create_file",
+            pattern=r"(?:создай|создать|сделай|напиши)(?:\s+(?:мне|новый|пустой))*\s+" + _FILE_NAME,
+            priority=60),
+    Command("list_files", prefixes=("покажи файлы", "показать файлы"), priority=50),
+    Command("menu", exact=("меню",)),
+    Command("clear", exact=("cls", "очистить")),
+    Command("help", exact=("помощь",)),
+    Command("change_model", exact=("смена модели",)),
+    Command("token_limit", exact=("лимит токенов", "токены")),
+    Command("stats", exact=("статистика",)),
+    Command("cache", prefixes=("кэш",)),
+    Command("hedge", prefixes=("хеджирование",)),
+    Command("jobs", exact=("задачи",)),
+    Command("job_output", pattern=r"вывод\s+(?P<job>\d+)", priority=40),
+    Command("job_stop", pattern=r"стоп\s+(?P<job>\d+|все)", priority=40),
+)
+
+
+class CommandDispatcher:
+    """Скомпилированная таблица команд со счётчиками срабатываний."""
+
+    def __init__(self, commands=COMMANDS):
+        self.commands = tuple(commands)
+        # Узел дерева: {символ: узел}, в ключе None — команды, которые здесь заканчиваются
+        self._trie = {}
+        for command in self.commands:
+            for phrase in command.exact:
+                self._insert(phrase, command, True)
+            for phrase in command.prefixes:
+                self._insert(phrase, command, False)
+        self._patterns = sorted((c for c in self.commands if c.regex is not None),
+                                key=lambda c: -c.priority)
+        self.hits = {}
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def _insert(self, phrase, command, exact):
+        node = self._trie
+        for char in phrase.lower():
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append((command, exact))
+
+    def match(self, text):
+        """Находит команду для сообщения или возвращает None."""
+        original = text.strip()
+        lowered = original.lower()
+        # lower() почти всегда сохраняет длину; иначе значения берутся из lowered
+        source = original if len(original) == len(lowered) else lowered
+
+        best = None
+        best_end = 0
+        node = self._trie
+        for end in range(len(lowered) + 1):
+            terminals = node.get(None)
+            if terminals and (end == len(lowered) or lowered[end].isspace()):
+                for command, exact in terminals:
+                    if exact and end != len(lowered):
+                        continue
+                    if best is None or command.priority > best.priority or \
+                            (command.priority == best.priority and end > best_end):
+                        best, best_end = command, end
+            if end == len(lowered):
+                break
+            node = node.get(lowered[end])
+            if node is None:
+                break
+
+        for command in self._patterns:
+            if best is not None and command.priority <= best.priority:
+                break
+            found = (command.regex.search if command.search else command.regex.fullmatch)(lowered)
+            if found:
+                args = {key: source[found.start(key):found.end(key)]
+                        for key, value in found.groupdict().items() if value is not None}
+                return Match(command, args, source)
+
+        if best is None:
+            return None
+        return Match(best, {"rest": source[best_end:].strip()}, source)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.hits[name] = self.hits.get(name, 0) + 1
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def dispatch(self, text, handlers):
+        """Выполняет обработчик найденной команды: handlers[имя](match).
+
+        Возвращает ответ обработчика или None, если команды нет (тогда
+        сообщение нужно отправить модели).
+        """
+        started = time.perf_counter()
+        match = self.match(text)
+        name = NO_COMMAND if match is None else match.name
+        try:
+            if match is None:
+                return None
+            return handlers[match.name](match)
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def status(self):
+        """Счётчики команд для команды «статистика»."""
+        with self._lock:
+            items = sorted(self.hits.items(), key=lambda item: -item[1])
+            lines = []
+            for name, hits in items:
+                average = self.seconds[name] / hits * 1000
+                label = "к модели" if name is NO_COMMAND else name
+                lines.append(f"  {label}: {hits} раз, в среднем {average:.2f} мс")
+        if not lines:
+            return "Команды: еще не было"
+        return "Команды:\n" + "\n".join(lines)
@@ -0,0 +1,316 @@
+"""Выполнение системных команд с выводом по мере работы.
+
+Команда запускается через asyncio в цикле llm_stream.StreamEngine, её
+stdout и stderr читаются кусками и выдаются построчно (on_line), пока
+команда работает. В памяти хранится только хвост вывода (RingBuffer),
+поэтому команда с гигабайтами вывода не раздувает процесс.
+
+Кодировка определяется для каждой строки: сначала UTF-8 (так пишут
+python, git и большинство современных программ), при ошибке — кодировка
+консоли платформы (OEM-страница Windows, например cp866, или кодировка
+локали в других системах). Прочитанный кусок сначала целиком пробуется
+как UTF-8, и только если это не удалось, строки декодируются по одной.
+
+Команда запускается в своей группе процессов: по таймауту или Ctrl+C
+завершается всё дерево процессов, а не только оболочка. Фоновые
+задачи (JobManager) работают параллельно с разговором.
+"""
+import asyncio
+import locale
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+import llm_stream
+
+# Сколько последних строк вывода хранить
+MAX_LINES = 2000
+# Предел памяти под хранимый вывод, байт
+MAX_BYTES = 1024 * 1024
+# Размер куска при чтении вывода
+READ_CHUNK = 64 * 1024
+# Строка длиннее этого выдаётся частями
+MAX_LINE_BYTES = 64 * 1024
+# Сколько ждать завершения после мягкой остановки, сек
+KILL_GRACE = 2.0
+
+RUNNING = "выполняется"
+FINISHED = "завершена"
+FAILED = "ошибка"
+TIMED_OUT = "таймаут"
+CANCELLED = "остановлена"
+
+
+def console_encoding():
+    """Кодировка вывода консольных программ этой системы."""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            # Перенаправленный вывод cmd.exe и встроенных команд — в OEM-кодировке
+            return f"cp{ctypes.windll.kernel32.GetOEMCP()}"
+        except Exception:
+            return "cp866"
+    return locale.getpreferredencoding(False) or "utf-8"
+
+
+CONSOLE_ENCODING = console_encoding()
+
+
+def decode_output(data, fallback=CONSOLE_ENCODING):
+    """Декодирует вывод: UTF-8, иначе кодировка консоли."""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode(fallback, errors="replace")
+
+
+class RingBuffer:
+    """Последние строки вывода в пределах max_lines и max_bytes."""
+
+    def __init__(self, max_lines=MAX_LINES, max_bytes=MAX_BYTES):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines = deque()
+        self.size = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def extend(self, lines):
+        with self._lock:
+            if len(lines) >= self.max_lines:
+                # Весь прежний хвост всё равно будет вытеснен
+                self.dropped += len(self.lines) + len(lines) - self.max_lines
+                self.lines.clear()
+                self.size = 0
+                lines = lines[-self.max_lines:]
+            self.lines.extend(lines)
+            self.size += sum(map(len, lines))
+            while self.lines and (len(self.lines) > self.max_lines or self.size > self.max_bytes):
+                self.size -= len(self.lines.popleft())
+                self.dropped += 1
+
+    def tail(self, count=None):
+        with self._lock:
+            lines = list(self.lines)
+        return lines if count is None else lines[-count:]
+
+    def text(self, count=None):
+        lines = self.tail(count)
+        prefix = f"[... пропущено строк: {self.dropped}]\n" if self.dropped and count is None else ""
+        return prefix + "\n".join(lines)
+
+
+class CommandJob:
+    """Одна запущенная команда и её вывод."""
+
+    def __init__(self, job_id, command, timeout=None, on_line=None, on_done=None):
+        self.id = job_id
+        self.command = command
+        self.timeout = timeout
+        self.on_line = on_line
+        self.on_done = on_done
+        self.output = RingBuffer()
+        self.status = RUNNING
+        self.returncode = None
+        self.started = time.monotonic()
+        self.finished = None
+        self.process = None
+        self.future = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def describe(self):
+        code = "" if self.returncode is None else f", код {self.returncode}"
+        return f"[{self.id}] {self.status}{code}, {self.elapsed:.1f} с: {self.command}"
+
+    def summary(self):
+        """Итог выполнения для ответа ассистента."""
+        if self.status == FINISHED and self.returncode == 0:
+            return f"✓ Команда выполнена за {self.elapsed:.1f} с"
+        if self.status == FINISHED:
+            return f"❌ Команда завершилась с кодом {self.returncode} за {self.elapsed:.1f} с"
+        if self.status == TIMED_OUT:
+            return f"❌ Команда остановлена по таймауту ({self.timeout:g} с)"
+        if self.status == CANCELLED:
+            return "Команда остановлена"
+        return f"❌ Ошибка выполнения команды: {self.output.text(1)}"
+
+    def _emit(self, data):
+        # Строки одного прочитанного куска декодируются и сохраняются вместе:
+        # при выводе в миллионы строк это в разы быстрее, чем по одной
+        data = data[:-1] if data.endswith(b"\r") else data
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            # Одна строка в другой кодировке не должна портить соседние
+            text = "\n".join(decode_output(line) for line in data.split(b"\n"))
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        lines = text.split("\n")
+        self.output.extend(lines)
+        if self.on_line is not None:
+            for line in lines:
+                self.on_line(line)
+
+    async def _pump(self, stream):
+        pending = b""
+        while True:
+            chunk = await stream.read(READ_CHUNK)
+            if not chunk:
+                break
+            pending += chunk
+            end = pending.rfind(b"\n")
+            if end >= 0:
+                self._emit(pending[:end])
+                pending = pending[end + 1:]
+            # Очень длинная строка без перевода строки выдаётся частями
+            while len(pending) > MAX_LINE_BYTES:
+                self._emit(pending[:MAX_LINE_BYTES])
+                pending = pending[MAX_LINE_BYTES:]
+        if pending:
+            self._emit(pending)
+
+    async def run(self):
+        """Выполняет команду; при отмене или таймауте завершает дерево процессов."""
+        try:
+            self.process = await asyncio.create_subprocess_shell(
+                self.command, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                **_new_group()
+            )
+        except Exception as e:
+            self.status = FAILED
+            self.output.extend([str(e)])
+            self._finish()
+            return self
+        pumps = asyncio.gather(self._pump(self.process.stdout), self._pump(self.process.stderr))
+        try:
+            # Таймаут общий для вывода и завершения: процесс, закрывший stdout,
+            # но продолжающий работать, тоже будет остановлен
+            self.returncode = await asyncio.wait_for(self._complete(pumps), self.timeout)
+            self.status = FINISHED
+        except asyncio.TimeoutError:
+            self.status = TIMED_OUT
+            await self._kill()
+        except asyncio.CancelledError:
+            self.status = CANCELLED
+            await self._kill()
+            raise
+        finally:
+            if self.status != FINISHED:
+                pumps.cancel()
+            self._finish()
+        return self
+
+    async def _complete(self, pumps):
+        # shield: при таймауте чтение вывода продолжается до остановки процесса
+        await asyncio.shield(pumps)
+        return await self.process.wait()
+
+    def _finish(self):
+        self.finished = time.monotonic()
+        if self.on_done is not None:
+            self.on_done(self)
+
+    async def _kill(self):
+        process = self.process
+        if process is None or process.returncode is not None:
+            return
+        kill_tree(process.pid, force=False)
+        try:
+            await asyncio.wait_for(process.wait(), KILL_GRACE)
+        except asyncio.TimeoutError:
+            kill_tree(process.pid, force=True)
+            await process.wait()
+        self.returncode = process.returncode
+
+
+def _new_group():
+    """Параметры запуска, при которых команда получает свою группу процессов."""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_tree(pid, force=False):
+    """Завершает процесс со всеми дочерними."""
+    try:
+        if sys.platform == "win32":
+            subprocess.run(["taskkill", "/T", "/PID", str(pid)] + (["/F"] if force else []),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+class JobManager:
+    """Команды, запущенные в фоне, и их вывод."""
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.jobs = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _engine(self):
+        return self.engine or llm_stream.get_engine()
+
+    def _create(self, command, timeout, on_line=None, on_done=None):
+        with self._lock:
+            job = CommandJob(self._next_id, command, timeout, on_line, on_done)
+            self._next_id += 1
+        return job
+
+    def run(self, command, timeout=None, on_line=None):
+        """Выполняет команду, дожидаясь её завершения. Ctrl+C останавливает её."""
+        job = self._create(command, timeout, on_line)
+        try:
+            self._engine().run(job.run())
+        except KeyboardInterrupt:
+            job.status = CANCELLED
+        return job
+
+    def start(self, command, timeout=None, on_done=None):
+        """Запускает команду в фоне и сразу возвращает задачу."""
+        job = self._create(command, timeout, on_done=on_done)
+        with self._lock:
+            self.jobs[job.id] = job
+        # Фоновая задача не прерывается новым запросом к модели
+        job.future = self._engine().submit(job.run(), cancel_with_requests=False)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stop(self, job_id=None):
+        """Останавливает задачу (или все); возвращает число остановленных."""
+        jobs = [self.jobs[job_id]] if job_id in self.jobs else list(self.jobs.values()) if job_id is None else []
+        stopped = 0
+        for job in jobs:
+            if job.status == RUNNING and job.future is not None:
+                job.future.cancel()
+                stopped += 1
+        return stopped
+
+    def describe(self):
+        if not self.jobs:
+            return "Фоновых задач нет"
+        return "\n".join(job.describe() for job in self.jobs.values())
+
+
+_manager = None
+
+
+def get_job_manager():
+    """Возвращает общий список фоновых задач."""
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
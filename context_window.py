@@ -0,0 +1,222 @@
+"""Окно контекста, сохраняющее общий префикс запросов между ходами.
+
+llama.cpp / LM Studio переиспользуют KV-кэш, только если начало запроса
+совпадает с предыдущим. Поэтому история в запросе растёт только с конца,
+а старые сообщения вытесняются редко и сразу крупным блоком (не меньше
+EVICT_FRACTION бюджета), причём окно всегда начинается с реплики
+пользователя. Между вытеснениями префикс запроса не меняется.
+
+Окно живёт всё время сессии: сообщения хранятся в deque вместе с числом
+токенов, общая сумма ведётся на ходу. Каждое сообщение считается и
+вытесняется один раз, так что добавление хода и обрезка до бюджета
+стоят амортизированно O(1), независимо от длины истории.
+
+Если задан summarizer (history_summarizer.HistorySummarizer), то при
+заполнении окна на SUMMARIZE_AT бюджета самый старый блок реплик
+пересказывается в фоне, и готовое краткое содержание заменяет этот блок,
+дописываясь к системному промпту. Жёсткое вытеснение остаётся запасным
+вариантом, если пересказ не успел.
+
+Если задан retriever (history_index.HistoryIndex), в него попадает каждое
+сообщение окна (индекс может быть заранее заполнен более старой частью
+журнала), а к запросу добавляются до RECALL_TOP_K похожих на него
+сообщений, уже вышедших из окна (не больше RECALL_FRACTION бюджета).
+Они дописываются в начало последнего сообщения пользователя, поэтому
+общий префикс запросов не меняется.
+"""
+from collections import deque
+
+from history_summarizer import ROLE_NAMES, SUMMARIZE_AT, SUMMARIZE_FRACTION
+
+# Запас токенов под ответ модели
+RESPONSE_RESERVE = 500
+# Какую долю бюджета освобождать при вытеснении
+EVICT_FRACTION = 0.25
+
+# Сколько старых сообщений подмешивать в запрос и какую долю бюджета они могут занять
+RECALL_TOP_K = 4
+RECALL_FRACTION = 0.1
+
+SUMMARY_HEADER = "Краткое содержание предыдущей части разговора:"
+RECALL_HEADER = "Из более ранней части разговора:"
+
+
+class ContextWindow:
+    """Сообщения истории, которые попадут в следующий запрос."""
+
+    def __init__(self, system_prompt, counter,
+                 reserve=RESPONSE_RESERVE, evict_fraction=EVICT_FRACTION,
+                 summarizer=None, retriever=None):
+        self.system_prompt = system_prompt
+        # Счётчик токенов (token_counter.TokenCounter), кэширующий результат в сообщениях
+        self.counter = counter
+        self.reserve = reserve
+        self.evict_fraction = evict_fraction
+        self.summarizer = summarizer
+        self.retriever = retriever
+        # Сколько сообщений добавлено в окно за все время (включая вытесненные)
+        self.appended = 0
+        # Краткое содержание сообщений, замененных пересказом
+        self.summary = ""
+        self.summaries = 0
+        # Ожидаемый пересказ: (Future, пересказываемые сообщения)
+        self._pending = None
+        # Сообщения в виде для запроса и их размеры в токенах (параллельные очереди)
+        self.messages = deque()
+        self.sizes = deque()
+        # Сумма токенов сообщений в окне
+        self.total = 0
+        self.evictions = 0
+        # Размер последнего сформированного запроса в токенах
+        self.last_total = 0
+        self._system_tokens = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, message):
+        """Добавляет сообщение истории в конец окна."""
+        self._add(message)
+        if self.retriever is not None:
+            self.retriever.add(message)
+
+    def extend(self, messages):
+        messages = list(messages)
+        for message in messages:
+            self._add(message)
+        if self.retriever is not None:
+            self.retriever.extend(messages)
+
+    def _add(self, message):
+        tokens = self.counter.count_message(message)
+        self.messages.append({"role": message["role"], "content": message["content"]})
+        self.sizes.append(tokens)
+        self.total += tokens
+        self.appended += 1
+
+    def set_counter(self, counter):
+        """Меняет счётчик токенов (при смене модели) и пересчитывает окно."""
+        if counter is self.counter:
+            return
+        self.counter = counter
+        self.sizes = deque(counter.count(message["content"]) for message in self.messages)
+        self.total = sum(self.sizes)
+
+    def system_content(self):
+        """Системный промпт вместе с кратким содержанием старой истории."""
+        if not self.summary:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\n{SUMMARY_HEADER}\n{self.summary}"
+
+    def system_tokens(self):
+        """Токены системного сообщения (пересчитываются при смене счётчика или пересказа)."""
+        if self._system_tokens is None or self._system_tokens[0] != self.counter.name:
+            self._system_tokens = (self.counter.name, self.counter.count(self.system_content()))
+        return self._system_tokens[1]
+
+    def trim(self, max_tokens, extra_tokens=0):
+        """Вытесняет старые сообщения крупным блоком, если бюджет превышен."""
+        budget = max_tokens - self.reserve
+        fixed = self.system_tokens() + extra_tokens
+        if fixed + self.total <= budget:
+            return
+        target = max(0, budget - fixed - int(budget * self.evict_fraction))
+        messages, sizes = self.messages, self.sizes
+        # Последнее сообщение (текущий запрос) не вытесняем никогда
+        while len(messages) > 1 and self.total > target:
+            messages.popleft()
+            self.total -= sizes.popleft()
+        # Окно должно начинаться с реплики пользователя
+        while len(messages) > 1 and messages[0]["role"] != "user":
+            messages.popleft()
+            self.total -= sizes.popleft()
+        self.evictions += 1
+
+    def build(self, user_message, max_tokens):
+        """Формирует список сообщений для запроса к модели."""
+        # Сообщение пользователя обычно уже добавлено в окно перед запросом
+        last = self.messages[-1] if self.messages else None
+        if last and last["role"] == "user" and last["content"] == user_message:
+            tail = []
+        else:
+            tail = [{"role": "user", "content": user_message}]
+        extra = sum(self.counter.count(m["content"]) for m in tail)
+
+        self._apply_summary()
+        self.trim(max_tokens, extra)
+        recall, recall_tokens = self._recall(user_message, max_tokens - self.reserve)
+        if recall:
+            extra += recall_tokens
+            self.trim(max_tokens, extra)
+        self._request_summary(max_tokens - self.reserve, self.system_tokens() + extra)
+        self.last_total = self.system_tokens() + self.total + extra
+
+        messages = [{"role": "system", "content": self.system_content()}]
+        messages.extend(self.messages)
+        messages.extend(tail)
+        if recall:
+            # Копия: в самом окне сообщение остается без вставки
+            messages[-1] = {"role": messages[-1]["role"], "content": f"{recall}\n\n{messages[-1]['content']}"}
+        return messages
+
+    def _recall(self, query, budget):
+        """Похожие на запрос сообщения, которые уже вышли из окна."""
+        if self.retriever is None:
+            return "", 0
+        # Индекс может начинаться с сообщений журнала старше загруженной истории
+        window_start = len(self.retriever) - len(self.messages)
+        hits = self.retriever.search(query, RECALL_TOP_K, limit=window_start)
+        limit = int(budget * RECALL_FRACTION)
+        lines, tokens = [], self.counter.count(RECALL_HEADER)
+        for position, message in hits:
+            line = f"{ROLE_NAMES.get(message['role'], message['role'])}: {message['content']}"
+            line_tokens = self.counter.count(line)
+            if tokens + line_tokens > limit:
+                continue
+            lines.append((position, line))
+            tokens += line_tokens
+        if not lines:
+            return "", 0
+        # В хронологическом порядке
+        lines.sort()
+        return "\n".join([RECALL_HEADER] + [line for _, line in lines]), tokens
+
+    def _request_summary(self, budget, fixed):
+        """Отправляет самый старый блок реплик на пересказ, если окно почти заполнено."""
+        if self.summarizer is None or self._pending is not None:
+            return
+        if fixed + self.total < budget * SUMMARIZE_AT:
+            return
+        # Блок заканчивается перед репликой пользователя, чтобы окно начиналось с неё
+        limit = budget * SUMMARIZE_FRACTION
+        block, tokens = [], 0
+        last = len(self.messages) - 1
+        for i, (message, size) in enumerate(zip(self.messages, self.sizes)):
+            if i >= last or (tokens >= limit and message["role"] == "user"):
+                break
+            block.append(message)
+            tokens += size
+        if not block or self.messages[len(block)]["role"] != "user":
+            return
+        self._pending = (self.summarizer.submit(self.summary, block), block)
+
+    def _apply_summary(self):
+        """Заменяет пересказанный блок кратким содержанием, когда оно готово."""
+        if self._pending is None or not self._pending[0].done():
+            return
+        future, block = self._pending
+        self._pending = None
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"Не удалось пересказать историю: {e}")
+            return
+        # Пока шел пересказ, часть блока могла быть вытеснена — тогда он устарел
+        if len(self.messages) <= len(block) or any(a is not b for a, b in zip(block, self.messages)):
+            return
+        for _ in block:
+            self.messages.popleft()
+            self.total -= self.sizes.popleft()
+        self.summary = summary
+        self.summaries += 1
+        self._system_tokens = None
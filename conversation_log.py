@@ -0,0 +1,193 @@
+"""Журнал разговора: одна JSON-строка на сообщение, только дозапись.
+
+Сохранение сообщения стоит O(1) независимо от длины истории: строка
+дописывается в конец файла, а fsync выполняется пачками — фоновым потоком
+не чаще раза в FSYNC_INTERVAL секунд (и при закрытии журнала). Сбой
+может оставить недописанной только последнюю строку; при чтении такие
+строки пропускаются, поэтому файл никогда не теряет уже сохранённое.
+
+При запуске окну контекста нужен только хвост журнала, он читается с
+конца файла; поиск по старой истории один раз читает журнал целиком.
+Сжатие журнала выполняется отдельно, когда программа не запущена:
+
+    python conversation_log.py compact [--keep 1000]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILE = "conversation_history.jsonl"
+# Прежний формат: весь список сообщений одним JSON
+LEGACY_FILE = "conversation_history.json"
+# Как часто сбрасывать журнал на диск, сек
+FSYNC_INTERVAL = 1.0
+# Размер блока при чтении файла с конца
+READ_BLOCK = 64 * 1024
+# Сколько последних сообщений оставлять при сжатии
+COMPACT_KEEP = 1000
+
+
+def _parse(line):
+    """Разбирает строку журнала; недописанные и битые строки пропускаются."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or "role" not in record or "content" not in record:
+        return None
+    return record
+
+
+class ConversationLog:
+    """Журнал сообщений разговора в формате JSONL."""
+
+    def __init__(self, path=JOURNAL_FILE, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+            # После сбоя последняя строка может быть недописана — начинаем с новой
+            if self._file.tell() > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._file.write(b"\n")
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+        return self._file
+
+    def append(self, message):
+        """Дописывает сообщение в журнал."""
+        record = {"role": message["role"], "content": message["content"], "ts": round(time.time(), 3)}
+        line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n"
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            # Данные уходят в ОС сразу: падение программы их не потеряет
+            f.flush()
+            self._dirty = True
+
+    def sync(self):
+        """Сбрасывает дописанные строки на диск."""
+        with self._lock:
+            if self._file is not None and self._dirty:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:
+                print(f"Не удалось сохранить журнал разговора: {e}")
+                return
+
+    def close(self):
+        self._closed.set()
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def load_tail(self, max_messages=None, max_chars=None):
+        """Читает последние сообщения журнала, не разбирая весь файл.
+
+        Чтение идёт с конца файла блоками и останавливается, когда набрано
+        max_messages сообщений или max_chars символов текста.
+        """
+        if not os.path.exists(self.path):
+            return self._import_legacy(max_messages)
+
+        messages = []
+        chars = 0
+        with open(self.path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END)
+            rest = b""
+            while position > 0:
+                size = min(READ_BLOCK, position)
+                position -= size
+                f.seek(position)
+                lines = (f.read(size) + rest).split(b"\n")
+                # Первая строка блока может начинаться в предыдущем блоке
+                rest = lines.pop(0) if position > 0 else b""
+                for line in reversed(lines):
+                    record = _parse(line) if line.strip() else None
+                    if record is None:
+                        continue
+                    messages.append(record)
+                    chars += len(record["content"])
+                    if ((max_messages is not None and len(messages) >= max_messages)
+                            or (max_chars is not None and chars >= max_chars)):
+                        messages.reverse()
+                        return messages
+        messages.reverse()
+        return messages
+
+    def load_all(self):
+        """Читает все сообщения журнала от начала (для поиска по старой истории)."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            return [record for record in map(_parse, f) if record is not None]
+
+    def _import_legacy(self, max_messages=None):
+        """Переносит историю из conversation_history.json в журнал (один раз)."""
+        if not os.path.exists(LEGACY_FILE):
+            return []
+        try:
+            with open(LEGACY_FILE, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except Exception as e:
+            print(f"Не удалось загрузить историю: {e}")
+            return []
+        for message in history:
+            self.append(message)
+        self.sync()
+        return history[-max_messages:] if max_messages else history
+
+
+def compact(path=JOURNAL_FILE, keep=COMPACT_KEEP):
+    """Оставляет в журнале последние keep сообщений.
+
+    Новый файл записывается рядом и подменяет старый атомарно, так что
+    сбой во время сжатия не повреждает журнал. Запускать, когда
+    ассистент не работает.
+    """
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path, 'rb') as f:
+        records = [record for record in map(_parse, f) if record is not None]
+    kept = records[-keep:] if keep else records
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        for record in kept:
+            f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records), len(kept)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание журнала разговора")
+    parser.add_argument("action", choices=["compact"])
+    parser.add_argument("--path", default=JOURNAL_FILE)
+    parser.add_argument("--keep", type=int, default=COMPACT_KEEP, help="сколько последних сообщений оставить")
+    args = parser.parse_args()
+
+    total, kept = compact(args.path, args.keep)
+    print(f"Журнал {args.path}: было {total} сообщений, осталось {kept}")
+
+
+if __name__ == "__main__":
+    main()
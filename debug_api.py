@@ -1,10 +1,12 @@
-import requests
 import json
 import time
 import sys
 
+import llm_client
+import llm_providers
+
 # Настройки подключения
-base_url = "http://26.224.68.101:1234/v1"
+base_url = llm_providers.default_base_url()
 model_name = "saiga_mistral_7b_gguf"
 api_key = "lm-studio"  # Для LM Studio это значение обычно не важно
 
@@ -21,7 +23,7 @@ print("="*60)
 # Шаг 1: Проверка доступности сервера
 print_step(1, "Проверка доступности сервера")
 try:
-    response = requests.get(f"{base_url}/models")
+    response = llm_client.get(f"{base_url}/models", api_key=api_key)
     if response.status_code == 200:
         print("✓ Сервер доступен")
         models = response.json()
@@ -48,11 +50,6 @@ except Exception as e:
 # Шаг 2: Проверка возможности отправки запроса
 print_step(2, "Проверка возможности отправки запроса")
 try:
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
     data = {
         "model": model_name,
         "messages": [
@@ -64,11 +61,7 @@ try:
     }
     
     print("Отправка тестового запроса...")
-    response = requests.post(
-        f"{base_url}/chat/completions", 
-        headers=headers,
-        json=data
-    )
+    response = llm_client.chat_completion(base_url, data, api_key=api_key)
     
     if response.status_code == 200:
         result = response.json()
@@ -99,11 +92,7 @@ try:
     }
     
     print("Отправка сложного запроса...")
-    response = requests.post(
-        f"{base_url}/chat/completions", 
-        headers=headers,
-        json=data
-    )
+    response = llm_client.chat_completion(base_url, data, api_key=api_key)
     
     if response.status_code == 200:
         result = response.json()
@@ -0,0 +1,242 @@
+"""Поиск по смыслу среди старых сообщений разговора.
+
+Каждое сообщение истории превращается в нормированный вектор и хранится
+в матрице int8 (по одному коэффициенту масштаба на строку) — это вчетверо
+меньше памяти, чем float32. Новые сообщения добавляются по одному, без
+перестройки индекса.
+
+Поиск идёт в два этапа. Для каждого вектора хранится SIMHASH_BITS-битная
+подпись (знаки случайных проекций); расстояние Хэмминга до подписи
+запроса считается по битовым плоскостям за доли миллисекунды даже для
+100 тыс. сообщений и отбирает CANDIDATES кандидатов. Точное сходство
+по int8-векторам считается только для них.
+
+Векторы строит небольшая модель sentence-transformers из каталога
+embeddings/ (только локальные файлы), а если её нет — хэширование
+символьных n-грамм, которому не нужны ни модель, ни сеть.
+
+Проверка скорости поиска: python history_index.py bench [--size 100000]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+EMBEDDINGS_DIR = "embeddings"
+# Размерность векторов хэширующего встраивания
+HASHING_DIM = 256
+# Длины символьных n-грамм для хэширования
+NGRAM_SIZES = (3, 4)
+# Сколько строк матрицы обрабатывать за раз при точном поиске
+CHUNK_ROWS = 4096
+# Длина подписи для предварительного отбора (кратна 64)
+SIMHASH_BITS = 256
+# Сколько кандидатов отбирать по подписи для точной проверки
+CANDIDATES = 256
+# Ниже этого косинусного сходства сообщения не считаются похожими
+MIN_SCORE = 0.25
+
+
+class HashingEmbedder:
+    """Векторы из хэшей символьных n-грамм (без модели)."""
+
+    name = "hashing"
+
+    def __init__(self, dim=HASHING_DIM, ngram_sizes=NGRAM_SIZES):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def _buckets(self, text):
+        text = f" {' '.join(str(text).lower().split())} "
+        # hash() строк случаен для каждого процесса, но индекс не сохраняется на диск
+        return [hash(text[i:i + n]) for n in self.ngram_sizes for i in range(len(text) - n + 1)]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array(self._buckets(text), dtype=np.int64)
+            if not hashes.size:
+                continue
+            # Знак из старшего бита уменьшает искажения от коллизий
+            signs = np.where(hashes & (1 << 40), 1.0, -1.0).astype(np.float32)
+            vectors[row] = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+        return _normalize(vectors)
+
+
+class SentenceEmbedder:
+    """Векторы модели sentence-transformers, загруженной из локального каталога."""
+
+    def __init__(self, path):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(path, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st:{os.path.basename(path)}"
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=32, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def get_embedder():
+    """Модель из embeddings/, если она есть, иначе хэширующее встраивание."""
+    if os.path.isdir(EMBEDDINGS_DIR):
+        for entry in sorted(os.listdir(EMBEDDINGS_DIR)):
+            path = os.path.join(EMBEDDINGS_DIR, entry)
+            if os.path.isdir(path):
+                try:
+                    return SentenceEmbedder(path)
+                except Exception as e:
+                    print(f"Не удалось загрузить модель встраивания {path}: {e}")
+    return HashingEmbedder()
+
+
+class HistoryIndex:
+    """Индекс сообщений истории в порядке добавления."""
+
+    def __init__(self, embedder, capacity=1024):
+        self.embedder = embedder
+        self.vectors = np.zeros((capacity, embedder.dim), dtype=np.int8)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        # Битовые плоскости подписей: строка j — j-е 64 бита подписи всех сообщений
+        self.signatures = np.zeros((SIMHASH_BITS // 64, capacity), dtype=np.uint64)
+        self.messages = []
+        # Фиксированные случайные проекции: подписи сравнимы между запусками
+        self._projections = np.random.default_rng(0).standard_normal(
+            (embedder.dim, SIMHASH_BITS)).astype(np.float32)
+        self._buffer = np.empty((CHUNK_ROWS, embedder.dim), dtype=np.float32)
+        # Подсчет битов есть только в NumPy 2.x; без него поиск всегда точный
+        self._prefilter = hasattr(np, "bitwise_count")
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, message):
+        self.extend([message])
+
+    def extend(self, messages):
+        """Добавляет сообщения в конец индекса."""
+        messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+        if not messages:
+            return
+        vectors = self.embedder.embed([m["content"] for m in messages])
+        start, end = len(self.messages), len(self.messages) + len(messages)
+        if end > self.vectors.shape[0]:
+            self._grow(end)
+        # Квантование в int8: строка хранится как round(v / scale)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        self.vectors[start:end] = np.round(vectors / scales[:, None]).astype(np.int8)
+        self.scales[start:end] = scales
+        self.signatures[:, start:end] = self._sign(vectors).T
+        self.messages.extend(messages)
+
+    def _sign(self, vectors):
+        """Подписи векторов: по SIMHASH_BITS // 64 чисел uint64 на вектор."""
+        bits = (vectors @ self._projections) > 0
+        return np.packbits(bits, axis=1).view(np.uint64)
+
+    def _grow(self, size):
+        count = len(self.messages)
+        capacity = max(size, self.vectors.shape[0] * 2)
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=np.int8)
+        vectors[:count] = self.vectors[:count]
+        scales = np.zeros(capacity, dtype=np.float32)
+        scales[:count] = self.scales[:count]
+        signatures = np.zeros((self.signatures.shape[0], capacity), dtype=np.uint64)
+        signatures[:, :count] = self.signatures[:, :count]
+        self.vectors, self.scales, self.signatures = vectors, scales, signatures
+
+    def scores(self, query_vector, limit):
+        """Точное косинусное сходство запроса с первыми limit сообщениями."""
+        scores = np.empty(limit, dtype=np.float32)
+        for start in range(0, limit, CHUNK_ROWS):
+            end = min(limit, start + CHUNK_ROWS)
+            block = self._buffer[:end - start]
+            np.copyto(block, self.vectors[start:end], casting='unsafe')
+            np.dot(block, query_vector, out=scores[start:end])
+        scores *= self.scales[:limit]
+        return scores
+
+    def candidates(self, query_vector, limit, count=CANDIDATES):
+        """Позиции сообщений с самыми близкими подписями (не меньше count)."""
+        signature = self._sign(query_vector[None, :])[0]
+        distance = np.zeros(limit, dtype=np.uint16)
+        xor = np.empty(limit, dtype=np.uint64)
+        for plane, bits in zip(self.signatures, signature):
+            np.bitwise_xor(plane[:limit], bits, out=xor)
+            distance += np.bitwise_count(xor)
+        # Порог расстояния, при котором набирается count кандидатов
+        cumulative = np.cumsum(np.bincount(distance, minlength=SIMHASH_BITS + 1))
+        threshold = np.searchsorted(cumulative, count)
+        return np.flatnonzero(distance <= threshold)
+
+    def search(self, text, k, limit=None, min_score=MIN_SCORE):
+        """Возвращает до k пар (позиция, сообщение) среди первых limit сообщений."""
+        limit = len(self.messages) if limit is None else min(limit, len(self.messages))
+        if limit <= 0 or k <= 0:
+            return []
+        query = self.embedder.embed([text])[0]
+        if self._prefilter and limit > CANDIDATES * 4:
+            positions = self.candidates(query, limit)
+            block = self.vectors[positions].astype(np.float32)
+            scores = (block @ query) * self.scales[positions]
+        else:
+            positions = np.arange(limit)
+            scores = self.scores(query, limit)
+        top = np.argsort(-scores)[:k]
+        return [(int(positions[i]), self.messages[positions[i]]) for i in top if scores[i] >= min_score]
+
+
+def bench(size, queries=50):
+    rng = np.random.default_rng(1)
+    words = ["файл", "папка", "команда", "python", "сервер", "модель", "ответ", "запрос",
+             "ошибка", "голос", "скрипт", "база", "данных", "таблица", "страница"]
+    index = HistoryIndex(HashingEmbedder(), capacity=size)
+    texts = [" ".join(rng.choice(words, size=rng.integers(5, 30))) for _ in range(size)]
+
+    started = time.perf_counter()
+    index.extend({"role": "user", "content": text} for text in texts)
+    print(f"Индекс {size} сообщений построен за {time.perf_counter() - started:.1f} с, "
+          f"матрица {index.vectors[:size].nbytes / 1024 / 1024:.1f} МБ")
+
+    query = index.embedder.embed([texts[0]])[0]
+    started = time.perf_counter()
+    for _ in range(queries):
+        index.scores(query, size)
+    print(f"Точное сходство со всеми сообщениями: {(time.perf_counter() - started) / queries * 1000:.2f} мс")
+
+    if index._prefilter:
+        started = time.perf_counter()
+        for _ in range(queries):
+            index.candidates(query, size)
+        print(f"Отбор кандидатов по подписям: {(time.perf_counter() - started) / queries * 1000:.2f} мс")
+
+    # Доля случаев, когда двухэтапный поиск находит то же лучшее сообщение, что и точный
+    same = 0
+    for text in texts[:queries]:
+        vector = index.embedder.embed([text])[0]
+        best = int(np.argmax(index.scores(vector, size)))
+        same += bool(index.search(text, 1)) and index.search(text, 1)[0][0] == best
+
+    started = time.perf_counter()
+    for text in texts[:queries]:
+        index.search(text, 4)
+    print(f"Поиск с построением вектора запроса: {(time.perf_counter() - started) / queries * 1000:.2f} мс")
+    print(f"Совпадение лучшего результата с точным поиском: {same / queries:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Индекс сообщений истории")
+    parser.add_argument("action", choices=["bench"])
+    parser.add_argument("--size", type=int, default=100000)
+    args = parser.parse_args()
+    bench(args.size)
+
+
+if __name__ == "__main__":
+    main()
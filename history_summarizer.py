@@ -0,0 +1,152 @@
+"""Фоновое сжатие старой части истории разговора.
+
+Когда окно контекста приближается к бюджету, самый старый блок реплик
+отправляется текущей модели с просьбой кратко пересказать его вместе с
+прежним кратким содержанием. Запрос выполняется в фоновом потоке и не
+задерживает ответ пользователю; готовое содержание заменяет блок в окне
+(см. context_window.ContextWindow).
+
+Краткие содержания сохраняются в SUMMARY_CACHE_FILE по ключу от модели
+и текста блока, поэтому один и тот же блок никогда не пересказывается
+дважды — в том числе после перезапуска.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+SUMMARY_CACHE_FILE = "history_summaries.json"
+# Сжатие запускается, когда окно заполнено на эту долю бюджета
+SUMMARIZE_AT = 0.75
+# Какую долю бюджета сжимать за один раз
+SUMMARIZE_FRACTION = 0.4
+# Ограничение длины краткого содержания
+SUMMARY_MAX_TOKENS = 400
+
+SUMMARY_PROMPT = (
+    "Кратко перескажи разговор пользователя с ассистентом. Сохрани факты, "
+    "имена файлов, команды, принятые решения и нерешённые вопросы. "
+    "Пиши сжато, без вступлений, не длиннее 10 предложений."
+)
+
+ROLE_NAMES = {"user": "Пользователь", "assistant": "Ассистент"}
+
+
+def make_summary_key(model, previous, messages):
+    """Ключ кэша по модели, прежнему содержанию и тексту блока."""
+    material = {
+        "model": model,
+        "previous": previous,
+        "messages": [[m["role"], m["content"]] for m in messages]
+    }
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_summary_request(previous, messages):
+    """Формирует сообщения запроса на пересказ блока."""
+    lines = []
+    if previous:
+        lines.append(f"Краткое содержание начала разговора:\n{previous}\n")
+        lines.append("Продолжение разговора:")
+    for message in messages:
+        lines.append(f"{ROLE_NAMES.get(message['role'], message['role'])}: {message['content']}")
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n".join(lines)}
+    ]
+
+
+class SummaryCache:
+    """Краткие содержания блоков истории в JSON-файле."""
+
+    def __init__(self, path=SUMMARY_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                if os.path.exists(self.path):
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._entries = json.load(f)
+            except Exception as e:
+                print(f"Не удалось загрузить кэш кратких содержаний: {e}")
+        return self._entries
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, summary):
+        with self._lock:
+            entries = self._load()
+            entries[key] = summary
+            try:
+                # Пишем во временный файл и подменяем — файл не останется наполовину записанным
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Не удалось сохранить кэш кратких содержаний: {e}")
+
+
+class HistorySummarizer:
+    """Пересказывает блоки истории в фоновом потоке.
+
+    complete(messages) отправляет запрос модели и возвращает текст ответа;
+    get_model() возвращает имя текущей модели (входит в ключ кэша).
+    """
+
+    def __init__(self, complete, get_model, cache=None):
+        self.complete = complete
+        self.get_model = get_model
+        self.cache = cache or SummaryCache()
+        self.summarized = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, previous, messages):
+        """Ставит блок в очередь на пересказ; возвращает Future с текстом."""
+        future = Future()
+        key = make_summary_key(self.get_model(), previous, messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            future.set_result(cached)
+            return future
+
+        if self._thread is None:
+            # Поток-демон: незаконченный пересказ не задерживает выход из программы
+            self._thread = threading.Thread(target=self._worker, daemon=True)
+            self._thread.start()
+        self._queue.put((future, key, make_summary_request(previous, messages)))
+        return future
+
+    def _worker(self):
+        while True:
+            future, key, request = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                summary = (self.complete(request) or "").strip()
+                if not summary:
+                    raise ValueError("пустой ответ модели")
+            except Exception as e:
+                self.failures += 1
+                future.set_exception(e)
+                continue
+            self.cache.put(key, summary)
+            self.summarized += 1
+            future.set_result(summary)
+
+    def status(self):
+        return (f"Сжатие истории: пересказано блоков {self.summarized}, "
+                f"из кэша {self.cache_hits}, ошибок {self.failures}")
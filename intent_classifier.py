@@ -0,0 +1,301 @@
+"""Распознавание команд, сказанных своими словами, без обращения к модели.
+
+«сделай мне папку logs» или «что в этой папке» не совпадают ни с одной
+фразой из command_dispatcher.COMMANDS и раньше уходили к 7B-модели.
+Классификатор намерений решает за десятки микросекунд, команда это или
+разговор:
+- признаки — символьные n-граммы (NGRAM_SIZES), хэшированные в вектор
+  размера FEATURE_DIM;
+- модель — многоклассовая логистическая регрессия (NumPy), обучаемая
+  при запуске на фразах INTENT_PHRASES, фразах из файла PHRASES_FILE
+  и на сообщениях истории, которые диспетчер распознал как команды;
+- класс CHAT — всё, что нужно отправить модели.
+Команда выполняется, только если вероятность не ниже THRESHOLD и из
+сообщения удалось извлечь нужные значения (имя файла, папки). Для
+команд создания в сообщении должен быть глагол создания: n-граммы
+держатся за существительное («файл», «папку») и глагол почти не
+различают — «удали папку logs» иначе создавала бы папку.
+"""
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+import command_dispatcher
+
+PHRASES_FILE = "intent_phrases.json"
+NGRAM_SIZES = (2, 3, 4)
+FEATURE_DIM = 1 << 14
+# Ниже этой вероятности сообщение уходит к модели
+THRESHOLD = 0.8
+EPOCHS = 200
+LEARNING_RATE = 20.0
+L2 = 1e-5
+
+CHAT = "chat"
+
+# Намерение -> (команда из command_dispatcher.COMMANDS, постоянные аргументы)
+INTENTS = {
+    "create_file": ("create_file", {}),
+    "create_folder": ("create_folder", {}),
+    "list_files": ("list_files", {}),
+    "voice_on": ("voice", {"rest": "вкл"}),
+    "voice_off": ("voice", {"rest": "выкл"}),
+    "stats": ("stats", {}),
+    "help": ("help", {}),
+}
+
+INTENT_PHRASES = {
+    "create_file": [
+        "сделай мне файл notes.txt", "создай новый файл readme.md", "нужен файл todo.txt",
+        "создай пустой файл config.json", "сделай файл с названием report", "заведи файл log.txt",
+        "создай файлик main.py", "сделай пустой файл data.csv", "мне нужен новый файл index.html",
+        "создай файл под названием script.py", "сделай файл test в папке src",
+        "создай в папке docs файл notes.md", "добавь файл app.py", "сделай новый файлик list.txt",
+        "можешь создать файл hello.py", "создай пожалуйста файл todo", "сгенерируй пустой файл a.txt",
+        "заведи новый файл с именем plan.txt", "сделай файл", "создай-ка файл info.txt",
+    ],
+    "create_folder": [
+        "сделай мне папку logs", "создай новую папку images", "нужна папка backup",
+        "заведи папку projects", "сделай папку с названием data", "создай каталог build",
+        "сделай директорию tmp", "создай пожалуйста папку music", "мне нужна папка docs",
+        "добавь папку assets", "сделай новую папку src", "создай папочку photos",
+        "можешь создать папку reports", "сделай каталог с именем cache", "заведи новую папку notes",
+        "создай директорию output", "сделай папку под названием games", "создай-ка папку work",
+        "сделай папку", "сотвори папку test",
+    ],
+    "list_files": [
+        "что в этой папке", "что лежит в папке", "какие тут файлы", "покажи что в папке docs",
+        "покажи содержимое папки", "выведи список файлов", "что есть в текущей папке",
+        "какие файлы в папке src", "список файлов", "покажи файлы здесь", "что здесь лежит",
+        "что у меня в папке", "открой список файлов", "какие папки тут есть",
+        "покажи содержимое текущей директории", "что находится в папке logs", "перечисли файлы",
+        "дай список файлов", "покажи мне файлы в папке", "какие файлы есть",
+    ],
+    "voice_on": [
+        "включи голос", "включи озвучку", "говори вслух", "озвучивай ответы", "включи звук",
+        "хочу слышать ответы", "верни голос", "давай голосом", "включи речь", "читай ответы вслух",
+    ],
+    "voice_off": [
+        "выключи голос", "выключи озвучку", "замолчи", "не говори вслух", "отключи звук",
+        "хватит говорить", "без голоса", "отключи озвучку", "тише, выключи речь", "не озвучивай ответы",
+    ],
+    "stats": [
+        "покажи статистику", "какая скорость ответа", "сколько токенов в секунду",
+        "покажи метрики", "как быстро работает модель", "выведи статистику запросов",
+        "какая задержка у сервера", "статистика работы",
+    ],
+    "help": [
+        "что ты умеешь", "какие есть команды", "покажи справку", "список команд",
+        "как тобой пользоваться", "помоги с командами", "справка", "какие команды ты знаешь",
+    ],
+    CHAT: [
+        "привет", "как дела", "расскажи о себе", "кто ты", "как тебя зовут", "спасибо",
+        "расскажи анекдот", "продолжи шутку", "объясни, как работает python",
+        "как создать папку в linux", "как создать файл в питоне", "что такое файловая система",
+        "как удалить папку через git", "напиши функцию сортировки", "напиши стихотворение о весне",
+        "сделай мне краткое резюме", "сделай вывод из текста", "создай план тренировок",
+        "создай историю про кота", "придумай название для папки", "почему файл не открывается",
+        "как переименовать файл в windows", "что лучше, папки или теги", "переведи на английский",
+        "какая погода завтра", "посоветуй книгу", "сколько будет дважды два", "что ты думаешь о музыке",
+        "а подробнее", "не будь таким кратким", "ты тут", "можно дать тебе имя",
+        "как организовать файлы в проекте", "объясни структуру папок django", "что такое каталог в базе данных",
+        "сделай текст короче", "напиши письмо начальнику", "создай идею для стартапа",
+        "почему голос у тебя такой странный", "как улучшить скорость модели", "помоги решить задачу",
+        "что в этой книге главное", "расскажи что в новостях", "какие файлы cookie хранит браузер",
+        "покажи пример кода на python", "как сделать папку скрытой", "зачем нужна папка venv",
+        "почему в папке нет файлов", "почему файл пустой", "зачем создавать отдельную папку",
+        "как посмотреть файлы в linux", "где хранятся файлы программы", "почему не работает голос",
+        "как включить голосовой ввод в windows", "что значит ошибка файл не найден",
+        # Другие действия с файлами и папками: слово «файл» есть, а создавать нечего
+        "открой файл data.csv", "удали файл a.txt", "переименуй файл a.txt", "удали папку logs",
+        "открой папку docs", "переименуй папку old", "скопируй файл report.docx", "перемести файл notes.txt",
+        "покажи файл main.py", "прочитай файл readme.md", "отредактируй файл config.json",
+        "очисти папку tmp", "удали каталог build", "закрой файл", "сожми папку backup",
+        "выключи свет", "включи музыку", "включи свет в комнате", "выключи компьютер",
+    ],
+}
+
+_NAME = r'["«]?([\w\-.\\/]+)["»]?'
+_NAMED = r'(?:\s+(?:с\s+названием|с\s+именем|под\s+названием|названием|именем))?\s+'
+_FILE_WITH_EXT = re.compile(r'["«]?([\w\-\\/]*\w\.[a-z0-9]{1,8})["»]?(?=\s|$|[,.!?])', re.IGNORECASE)
+_FILE_NAMED = re.compile(r'\bфайл(?:ик|а)?' + _NAMED + _NAME, re.IGNORECASE)
+_FOLDER_NAMED = re.compile(r'\b(?:папк[уаи]|папочку|каталог|директори[юя])' + _NAMED + _NAME, re.IGNORECASE)
+_IN_FOLDER = re.compile(r'\b(?:в|во|внутри)\s+(?:папк[еиу]|каталоге|директории)\s+' + _NAME, re.IGNORECASE)
+# Команды создания выполняются, только если в сообщении есть глагол создания
+_CREATE_VERB = re.compile(
+    r'\b(?:созда\w*|сдела\w*|завед\w*|завест\w*|добав\w*|сгенерир\w*|сотвори\w*|нуж(?:ен|на|но|ны)|надо)\b',
+    re.IGNORECASE
+)
+# Команды голоса — только если речь о голосе, а не о свете или музыке
+_VOICE_WORD = re.compile(r'голос|озвуч|звук|реч[ьи]|вслух|говор|молч|слыш', re.IGNORECASE)
+# Слова, которые стоят на месте имени, но именем не являются
+_NOT_NAMES = {
+    "с", "для", "под", "в", "во", "на", "и", "мне", "новую", "новый", "пустой", "этой", "текущей",
+    "эту", "этот", "там", "тут", "здесь", "пожалуйста", "названием", "именем", "по",
+}
+
+
+def _word(match):
+    if match is None:
+        return None
+    value = match.group(1).strip('.,!?')
+    return None if not value or value.lower() in _NOT_NAMES else value
+
+
+def extract_slots(intent, text):
+    """Значения для команды: {аргумент: значение} или None, если нужного нет."""
+    folder = _word(_IN_FOLDER.search(text))
+    if intent in ("create_file", "create_folder") and not _CREATE_VERB.search(text):
+        return None
+    if intent in ("voice_on", "voice_off") and not _VOICE_WORD.search(text):
+        return None
+    if intent == "create_file":
+        match = _FILE_WITH_EXT.search(text)
+        name = match.group(1) if match else _word(_FILE_NAMED.search(text))
+        if not name:
+            return None
+        return {"name": name, "folder": folder} if folder else {"name": name}
+    if intent == "create_folder":
+        name = _word(_FOLDER_NAMED.search(text))
+        return {"rest": name} if name else None
+    if intent == "list_files":
+        if folder and not os.path.isdir(folder):
+            return None
+        return {"path": folder} if folder else {}
+    return {}
+
+
+def ngram_features(text, dim=FEATURE_DIM, sizes=NGRAM_SIZES):
+    """Индексы и веса хэшированных символьных n-грамм (L2-норма 1)."""
+    text = f" {' '.join(text.lower().split())} "
+    # hash() строк случаен для каждого процесса, но модель обучается при каждом запуске
+    grams = [hash(text[i:i + n]) for n in sizes for i in range(len(text) - n + 1)]
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices, counts = np.unique(np.array(grams, dtype=np.int64) % dim, return_counts=True)
+    values = counts.astype(np.float32)
+    return indices, values / np.linalg.norm(values)
+
+
+def load_phrases(path=PHRASES_FILE):
+    """Дополнительные фразы пользователя: {намерение: [фразы]}."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось прочитать {path}: {e}")
+        return {}
+    return {intent: list(phrases) for intent, phrases in data.items()
+            if intent == CHAT or intent in INTENTS}
+
+
+def history_phrases(history, dispatcher=None):
+    """Сообщения истории, которые диспетчер распознал как команды-намерения."""
+    dispatcher = dispatcher or command_dispatcher.CommandDispatcher()
+    by_command = {}
+    for intent, (command, fixed) in INTENTS.items():
+        if not fixed:
+            by_command[command] = intent
+    phrases = {}
+    for message in history:
+        if message.get("role") != "user":
+            continue
+        match = dispatcher.match(message["content"])
+        if match is None:
+            continue
+        name = "create_file" if match.name == "create_file_in_folder" else match.name
+        if name in by_command:
+            phrases.setdefault(by_command[name], []).append(match.text)
+    return phrases
+
+
+class IntentClassifier:
+    """Логистическая регрессия по символьным n-граммам."""
+
+    def __init__(self, phrases, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.labels = sorted(phrases)
+        self.commands = {intent: command_dispatcher.Command(INTENTS[intent][0])
+                         for intent in self.labels if intent in INTENTS}
+        self.hits = {}
+        self.seconds = 0.0
+        self.calls = 0
+        started = time.perf_counter()
+        self.weights, self.bias = self._train(phrases)
+        self.train_seconds = time.perf_counter() - started
+        self.examples = sum(len(p) for p in phrases.values())
+
+    def _train(self, phrases):
+        samples = [(text, self.labels.index(intent)) for intent in self.labels for text in phrases[intent]]
+        matrix = np.zeros((len(samples), FEATURE_DIM), dtype=np.float32)
+        targets = np.zeros((len(samples), len(self.labels)), dtype=np.float32)
+        for row, (text, label) in enumerate(samples):
+            indices, values = ngram_features(text)
+            np.add.at(matrix[row], indices, values)
+            targets[row, label] = 1.0
+        # Обучаем только на n-граммах, которые встречались: матрица весов остается полной
+        used = np.flatnonzero(matrix.any(axis=0))
+        features = matrix[:, used]
+        weights = np.zeros((len(used), len(self.labels)), dtype=np.float32)
+        bias = np.zeros(len(self.labels), dtype=np.float32)
+        # Классы разного размера получают одинаковый вес
+        sample_weight = (1.0 / targets.sum(axis=0))[targets.argmax(axis=1)] * len(self.labels)
+        scale = 1.0 / len(samples)
+        for _ in range(EPOCHS):
+            error = (_softmax(features @ weights + bias) - targets) * sample_weight[:, None]
+            weights -= LEARNING_RATE * (scale * (features.T @ error) + L2 * weights)
+            bias -= LEARNING_RATE * scale * error.sum(axis=0)
+        full = np.zeros((FEATURE_DIM, len(self.labels)), dtype=np.float32)
+        full[used] = weights
+        return full, bias
+
+    def predict(self, text):
+        """Возвращает (намерение, вероятность)."""
+        indices, values = ngram_features(text)
+        scores = values @ self.weights[indices] + self.bias
+        probabilities = _softmax(scores[None, :])[0]
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def route(self, text):
+        """command_dispatcher.Match для уверенно распознанной команды или None."""
+        started = time.perf_counter()
+        try:
+            intent, probability = self.predict(text)
+            if intent == CHAT or probability < self.threshold:
+                return None
+            slots = extract_slots(intent, text.strip())
+            if slots is None:
+                return None
+            self.hits[intent] = self.hits.get(intent, 0) + 1
+            args = dict(INTENTS[intent][1], **slots)
+            return command_dispatcher.Match(self.commands[intent], args, text.strip())
+        finally:
+            self.calls += 1
+            self.seconds += time.perf_counter() - started
+
+    def status(self):
+        average = self.seconds / self.calls * 1e6 if self.calls else 0.0
+        hits = ", ".join(f"{intent} {count}" for intent, count in sorted(self.hits.items())) or "нет"
+        return (f"Намерения: {self.examples} примеров, обучение {self.train_seconds * 1000:.0f} мс, "
+                f"проверено {self.calls} сообщений (в среднем {average:.0f} мкс), распознано: {hits}")
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def create_classifier(history=(), path=PHRASES_FILE):
+    """Классификатор на встроенных фразах, фразах из файла и командах из истории."""
+    phrases = {intent: list(texts) for intent, texts in INTENT_PHRASES.items()}
+    for extra in (load_phrases(path), history_phrases(history)):
+        for intent, texts in extra.items():
+            phrases.setdefault(intent, []).extend(texts)
+    return IntentClassifier(phrases)
@@ -0,0 +1,122 @@
+"""Общий HTTP-клиент для обращений к OpenAI-совместимым серверам (LM Studio, Ollama и др.).
+
+Все запросы идут через одну requests.Session с пулом постоянных соединений,
+поэтому TCP/TLS-рукопожатие выполняется один раз, а не на каждый запрос.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Таймауты: время на установку соединения и время ожидания данных от сервера
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+# Размер пула: число разных хостов и соединений на один хост
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Возвращает общую сессию с пулом keep-alive соединений."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE,
+                    max_retries=0
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                # HTTP/1.1 keep-alive: соединение остаётся открытым между запросами
+                session.headers.update({"Connection": "keep-alive"})
+                _session = session
+    return _session
+
+
+def set_pool_size(maxsize):
+    """Задаёт число соединений на один хост; уже созданная сессия получает новый пул."""
+    global POOL_MAXSIZE
+    with _session_lock:
+        POOL_MAXSIZE = maxsize
+        if _session is not None:
+            old = {_session.adapters.get("http://"), _session.adapters.get("https://")}
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=POOL_MAXSIZE,
+                max_retries=0
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            # Соединения прежнего пула больше не нужны
+            for previous in old - {None}:
+                previous.close()
+
+
+def close_session():
+    """Закрывает все соединения пула."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def make_headers(api_key=None):
+    """Формирует заголовки запроса к API."""
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+def make_timeout(read_timeout=None):
+    """Возвращает пару (connect, read) таймаутов для requests."""
+    return (CONNECT_TIMEOUT, READ_TIMEOUT if read_timeout is None else read_timeout)
+
+
+def get(url, api_key=None, timeout=None, **kwargs):
+    """Выполняет GET-запрос через общий пул соединений."""
+    return get_session().get(
+        url,
+        headers=make_headers(api_key),
+        timeout=make_timeout(timeout),
+        **kwargs
+    )
+
+
+def post(url, payload, api_key=None, stream=False, timeout=None, **kwargs):
+    """Выполняет POST-запрос с JSON-телом через общий пул соединений."""
+    return get_session().post(
+        url,
+        headers=make_headers(api_key),
+        json=payload,
+        stream=stream,
+        timeout=make_timeout(timeout),
+        **kwargs
+    )
+
+
+def list_models(base_url, api_key=None, timeout=None):
+    """Возвращает список идентификаторов моделей сервера (/models)."""
+    response = get(f"{base_url}/models", api_key=api_key, timeout=timeout)
+    response.raise_for_status()
+    return [model["id"] for model in response.json().get("data", [])]
+
+
+def chat_completion(base_url, payload, api_key=None, stream=False, timeout=None):
+    """Отправляет запрос к /chat/completions и возвращает объект ответа."""
+    return post(
+        f"{base_url}/chat/completions",
+        payload,
+        api_key=api_key,
+        stream=stream,
+        timeout=timeout
+    )
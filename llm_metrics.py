@@ -0,0 +1,212 @@
+"""Метрики скорости ответа LLM: время соединения, TTFT, токены в секунду.
+
+Каждый запрос записывается одной строкой в llm_metrics.jsonl. Когда файл
+превышает MAX_FILE_BYTES, он переименовывается в .1 (старые копии
+сдвигаются), хранится не более BACKUP_COUNT копий.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+METRICS_FILE = "llm_metrics.jsonl"
+MAX_FILE_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+
+# Границы корзин гистограммы межтокенных задержек, мс
+HISTOGRAM_BOUNDS_MS = (5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class RequestMetrics:
+    """Замеры одного запроса к модели."""
+
+    def __init__(self, model, source, prompt_tokens=0, prompt_chars=0, recorder=None):
+        self.model = model
+        self.source = source
+        self.prompt_tokens = prompt_tokens
+        self.prompt_chars = prompt_chars
+        self.recorder = recorder
+        # Имя сервера, выбранного маршрутизатором (если запрос шёл через него)
+        self.backend = None
+        self.started = time.perf_counter()
+        self.connected = None
+        self.first_token = None
+        self.last_token = None
+        self.tokens = 0
+        # Последняя корзина — задержки больше последней границы
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.finished = False
+
+    def mark_connected(self):
+        """Отмечает получение заголовков ответа сервера."""
+        if self.connected is None:
+            self.connected = time.perf_counter()
+
+    def on_tokens(self, count=1):
+        """Отмечает приход count токенов (одним куском из сети)."""
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        elif self.last_token is not None:
+            gap_ms = (now - self.last_token) * 1000
+            bucket = 0
+            while bucket < len(HISTOGRAM_BOUNDS_MS) and gap_ms > HISTOGRAM_BOUNDS_MS[bucket]:
+                bucket += 1
+            self.histogram[bucket] += 1
+        self.last_token = now
+        self.tokens += count
+
+    def finish(self, error=None, completion_tokens=None):
+        """Завершает замер и записывает его. Возвращает запись."""
+        if self.finished:
+            return None
+        self.finished = True
+        end = time.perf_counter()
+        if completion_tokens is not None:
+            self.tokens = completion_tokens
+        record = {
+            "ts": time.time(),
+            "source": self.source,
+            "model": self.model,
+            "backend": self.backend,
+            "prompt_tokens": self.prompt_tokens,
+            "prompt_chars": self.prompt_chars,
+            "completion_tokens": self.tokens,
+            "connect_ms": _ms(self.started, self.connected),
+            "ttft_ms": _ms(self.started, self.first_token),
+            "total_ms": _ms(self.started, end),
+            "tokens_per_sec": None,
+            "itl_histogram": dict(zip(_bucket_labels(), self.histogram)),
+            "error": error
+        }
+        if self.first_token is not None and self.tokens > 1 and self.last_token > self.first_token:
+            record["tokens_per_sec"] = round((self.tokens - 1) / (self.last_token - self.first_token), 2)
+        elif self.tokens and end > self.started:
+            # Непотоковый ответ: считаем по полному времени запроса
+            record["tokens_per_sec"] = round(self.tokens / (end - self.started), 2)
+        (self.recorder or get_recorder()).record(record)
+        return record
+
+
+class MetricsRecorder:
+    """Потокобезопасная запись метрик в JSONL-файл с ротацией."""
+
+    def __init__(self, path=METRICS_FILE, max_bytes=MAX_FILE_BYTES, backup_count=BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                self._rotate_if_needed(len(line.encode('utf-8')))
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except Exception as e:
+                print(f"Не удалось записать метрики: {e}")
+
+    def _rotate_if_needed(self, incoming):
+        if not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) + incoming <= self.max_bytes:
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def load(self):
+        """Читает все записи (включая ротированные файлы)."""
+        records = []
+        paths = [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1)] + [self.path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        return records
+
+    def summary(self):
+        """Возвращает p50/p95 по каждой модели."""
+        by_model = {}
+        for record in self.load():
+            by_model.setdefault(record.get("model") or "?", []).append(record)
+
+        result = {}
+        for model, records in by_model.items():
+            ok = [r for r in records if not r.get("error")]
+            result[model] = {
+                "requests": len(records),
+                "errors": len(records) - len(ok),
+                "ttft_ms": _percentiles([r.get("ttft_ms") for r in ok]),
+                "tokens_per_sec": _percentiles([r.get("tokens_per_sec") for r in ok]),
+                "total_ms": _percentiles([r.get("total_ms") for r in ok])
+            }
+        return result
+
+
+def percentile(values, p):
+    """Перцентиль p (0-100) методом ближайшего ранга."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def format_summary(recorder=None):
+    """Формирует текст для команды «статистика»."""
+    recorder = recorder or get_recorder()
+    summary = recorder.summary()
+    lines = []
+    if not summary:
+        lines.append("Метрик пока нет: сделайте хотя бы один запрос к модели.")
+    for model, stats in sorted(summary.items()):
+        lines.append(f"Модель: {model} (запросов: {stats['requests']}, ошибок: {stats['errors']})")
+        lines.append(f"  TTFT, мс:        p50={_fmt(stats['ttft_ms'][0])}  p95={_fmt(stats['ttft_ms'][1])}")
+        lines.append(f"  Токенов/сек:     p50={_fmt(stats['tokens_per_sec'][0])}  p95={_fmt(stats['tokens_per_sec'][1])}")
+        lines.append(f"  Полное время, мс: p50={_fmt(stats['total_ms'][0])}  p95={_fmt(stats['total_ms'][1])}")
+    return "\n".join(lines)
+
+
+def _ms(start, end):
+    if end is None:
+        return None
+    return round((end - start) * 1000, 1)
+
+
+def _bucket_labels():
+    labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS]
+    labels.append(f">{HISTOGRAM_BOUNDS_MS[-1]}")
+    return labels
+
+
+def _percentiles(values):
+    values = [v for v in values if v is not None]
+    return percentile(values, 50), percentile(values, 95)
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+_recorder = None
+
+
+def get_recorder():
+    """Возвращает общий объект записи метрик (файл можно задать через LLM_METRICS_FILE)."""
+    global _recorder
+    if _recorder is None:
+        _recorder = MetricsRecorder(os.getenv("LLM_METRICS_FILE", METRICS_FILE))
+    return _recorder
@@ -0,0 +1,71 @@
+"""Таблица провайдеров LLM, общая для main.py, cmd_assistant.py и скриптов запуска."""
+import os
+
+# Адрес удалённого сервера LM Studio (можно переопределить переменной LLM_BASE_URL)
+REMOTE_LM_STUDIO_URL = "http://26.224.68.101:1234/v1"
+
+MODELS_CONFIG = {
+    "openai": {
+        "name": "OpenAI API",
+        "env_vars": {
+            "OPENAI_API_KEY": "your-openai-api-key"
+        },
+        "models": ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo"]
+    },
+    "lm-studio-local": {
+        "name": "LM Studio (localhost)",
+        "env_vars": {
+            "OPENAI_API_KEY": "lm-studio",
+            "OPENAI_API_BASE": "http://localhost:1234/v1"
+        },
+        # Сервер на llama.cpp: просим переиспользовать KV-кэш общего префикса
+        "request_params": {"cache_prompt": True},
+        "models": ["local-model"]
+    },
+    "lm-studio-remote": {
+        "name": "LM Studio (remote)",
+        "env_vars": {
+            "OPENAI_API_KEY": "lm-studio",
+            "OPENAI_API_BASE": REMOTE_LM_STUDIO_URL
+        },
+        # Сервер на llama.cpp: просим переиспользовать KV-кэш общего префикса
+        "request_params": {"cache_prompt": True},
+        "models": ["remote-model"]
+    },
+    "ollama": {
+        "name": "Ollama (локальный)",
+        "env_vars": {
+            "OPENAI_API_KEY": "ollama",
+            "OPENAI_API_BASE": "http://localhost:11434/v1"
+        },
+        "models": ["llama3", "mistral", "mixtral", "gemma"]
+    },
+    "anthropic": {
+        "name": "Anthropic API",
+        "env_vars": {
+            "ANTHROPIC_API_KEY": "your-anthropic-api-key"
+        },
+        "models": ["claude-3-opus", "claude-3-sonnet", "claude-3-haiku"]
+    },
+    "together": {
+        "name": "Together AI",
+        "env_vars": {
+            "TOGETHER_API_KEY": "your-together-api-key"
+        },
+        "models": ["mistralai/Mixtral-8x7B", "meta-llama/Llama-3-70b"]
+    }
+}
+
+
+def default_base_url():
+    """Адрес сервера по умолчанию для скриптов, работающих с одним сервером."""
+    return os.getenv("LLM_BASE_URL", REMOTE_LM_STUDIO_URL)
+
+
+def openai_compatible_providers(config=None):
+    """Возвращает провайдеров с OpenAI-совместимым API (у них задан OPENAI_API_BASE)."""
+    config = MODELS_CONFIG if config is None else config
+    return {
+        name: provider for name, provider in config.items()
+        if provider.get("env_vars", {}).get("OPENAI_API_BASE")
+    }
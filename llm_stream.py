@@ -0,0 +1,606 @@
+"""Асинхронный потоковый клиент для /chat/completions.
+
+Байты ответа разбираются инкрементально (SSEParser): каждый байт
+просматривается один раз, поэтому работа на токен постоянна. Токены
+рассылаются асинхронным потребителям — выводу на экран, озвучке,
+записи истории. Запрос можно прервать в любой момент (Ctrl+C или новая
+команда пользователя).
+"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+
+import llm_client
+import resilience
+import terminal_renderer
+
+# Символы, которыми заканчивается предложение (для озвучки по предложениям)
+SENTENCE_END = ('.', '!', '?')
+
+_CONTENT_KEY = b'"content":'
+
+# Через сколько секунд без первого токена дублировать запрос на второй сервер
+HEDGE_DELAY = 2.0
+
+
+class StreamError(Exception):
+    """Сервер ответил на потоковый запрос кодом, отличным от 200."""
+
+    def __init__(self, status_code, text="", retry_after=None):
+        super().__init__(f"Код ответа: {status_code}")
+        self.status_code = status_code
+        self.text = text
+        # Пауза, которую просит сервер (заголовок Retry-After), сек
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status_code in resilience.RETRYABLE_STATUS
+
+
+class SSEParser:
+    """Инкрементальный разбор потока Server-Sent Events с дельтами OpenAI.
+
+    feed() принимает произвольные куски байтов и возвращает список
+    фрагментов текста, пришедших целиком в этих кусках.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.done = False
+
+    def feed(self, data):
+        """Добавляет байты в буфер и возвращает новые фрагменты текста."""
+        if self.done or not data:
+            return []
+        buffer = self._buffer
+        # Новые строки ищем только в только что пришедших данных
+        search_from = len(buffer)
+        buffer += data
+        tokens = []
+        start = 0
+        while True:
+            end = buffer.find(b'\n', search_from)
+            if end == -1:
+                break
+            line = bytes(buffer[start:end])
+            start = search_from = end + 1
+            if not line.startswith(b'data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == b'[DONE]':
+                self.done = True
+                break
+            content = self._extract_content(payload)
+            if content:
+                tokens.append(content)
+        del buffer[:start]
+        return tokens
+
+    @staticmethod
+    def _extract_content(payload):
+        """Достаёт delta.content из JSON-строки события."""
+        # Быстрый путь: строка без экранирования — декодируем без json.loads
+        pos = payload.find(_CONTENT_KEY)
+        if pos != -1:
+            pos += len(_CONTENT_KEY)
+            if payload[pos:pos + 1] == b' ':
+                pos += 1
+            if payload[pos:pos + 1] == b'"':
+                end = payload.find(b'"', pos + 1)
+                if end != -1 and payload.find(b'\\', pos + 1, end) == -1:
+                    return payload[pos + 1:end].decode('utf-8', errors='replace')
+        # Общий путь: экранированные символы, null и прочее
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            return ""
+        choices = chunk.get('choices') or []
+        if not choices:
+            return ""
+        delta = choices[0].get('delta') or {}
+        return delta.get('content') or ""
+
+
+class SentenceSplitter:
+    """Накапливает токены и отдаёт законченные предложения.
+
+    Конец предложения проверяется только по новому токену, а не по всей
+    накопленной строке.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def feed(self, token):
+        """Добавляет токен; возвращает предложение, если оно закончилось."""
+        self._parts.append(token)
+        tail = token.rstrip()
+        if tail and tail[-1] in SENTENCE_END:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Возвращает накопленный остаток текста."""
+        sentence = ''.join(self._parts)
+        self._parts = []
+        return sentence
+
+
+class ChatStream:
+    """Потоковый запрос к /chat/completions.
+
+    Чтение из сокета идёт в отдельном потоке через общий пул соединений
+    llm_client; разобранные токены передаются в цикл asyncio.
+    """
+
+    def __init__(self, base_url, payload, api_key=None, metrics=None, read_timeout=None):
+        self.base_url = base_url
+        self.payload = dict(payload, stream=True)
+        self.api_key = api_key
+        self.metrics = metrics
+        self.read_timeout = read_timeout
+        self._cancelled = threading.Event()
+        self._response = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Прерывает поток: закрывает соединение, освобождая слот сервера."""
+        self._cancelled.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    async def tokens(self):
+        """Асинхронно отдаёт фрагменты текста по мере поступления."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        threading.Thread(target=self._read, args=(loop, queue), daemon=True).start()
+        finished = False
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == 'tokens':
+                    for token in value:
+                        yield token
+                elif kind == 'error':
+                    raise value
+                else:
+                    finished = True
+                    break
+        finally:
+            if not finished:
+                self.cancel()
+
+    def _read(self, loop, queue):
+        """Читает ответ сервера (выполняется в отдельном потоке)."""
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                pass
+
+        response = None
+        try:
+            response = llm_client.chat_completion(
+                self.base_url, self.payload, api_key=self.api_key, stream=True,
+                timeout=self.read_timeout
+            )
+            self._response = response
+            if self.metrics is not None:
+                self.metrics.mark_connected()
+            if self.cancelled:
+                return
+            if response.status_code != 200:
+                put(('error', StreamError(response.status_code, response.text,
+                                          resilience.retry_after(response))))
+                return
+            parser = SSEParser()
+            for chunk in response.iter_content(chunk_size=None):
+                if self.cancelled:
+                    break
+                tokens = parser.feed(chunk)
+                if tokens:
+                    if self.metrics is not None:
+                        self.metrics.on_tokens(len(tokens))
+                    put(('tokens', tokens))
+                if parser.done:
+                    break
+        except Exception as e:
+            if not self.cancelled:
+                put(('error', e))
+        finally:
+            put(('end', None))
+            if response is not None:
+                # Возвращаем соединение в пул (или закрываем, если поток прерван)
+                response.close()
+
+
+class StreamConsumer:
+    """Базовый асинхронный потребитель токенов."""
+
+    async def on_token(self, token):
+        pass
+
+    async def on_end(self):
+        pass
+
+
+class PrintConsumer(StreamConsumer):
+    """Выводит токены в терминал кадрами (см. terminal_renderer)."""
+
+    def __init__(self, renderer=None):
+        self.renderer = renderer or terminal_renderer.get_renderer()
+
+    async def on_token(self, token):
+        self.renderer.write(token)
+
+    async def on_end(self):
+        self.renderer.flush()
+
+
+class SentenceConsumer(StreamConsumer):
+    """Передаёт законченные предложения в callback (например, в озвучку)."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.splitter = SentenceSplitter()
+
+    async def on_token(self, token):
+        sentence = self.splitter.feed(token)
+        if sentence:
+            self.callback(sentence)
+
+    async def on_end(self):
+        rest = self.splitter.flush()
+        if rest.strip():
+            self.callback(rest)
+
+
+class CollectConsumer(StreamConsumer):
+    """Собирает полный текст ответа для записи в историю."""
+
+    def __init__(self):
+        self.parts = []
+
+    async def on_token(self, token):
+        self.parts.append(token)
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+
+async def broadcast(token_source, consumers):
+    """Рассылает токены всем потребителям, каждому — в своей задаче."""
+    queues = [asyncio.Queue() for _ in consumers]
+
+    async def drive(consumer, queue):
+        while True:
+            token = await queue.get()
+            if token is None:
+                break
+            await consumer.on_token(token)
+        await consumer.on_end()
+
+    tasks = [asyncio.create_task(drive(c, q)) for c, q in zip(consumers, queues)]
+    try:
+        async for token in token_source:
+            for queue in queues:
+                queue.put_nowait(token)
+    finally:
+        for queue in queues:
+            queue.put_nowait(None)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def stream_chat(base_url, payload, api_key=None, consumers=(), metrics=None):
+    """Выполняет потоковый запрос и раздаёт токены потребителям."""
+    stream = ChatStream(base_url, payload, api_key=api_key, metrics=metrics)
+    await broadcast(stream.tokens(), list(consumers))
+    return stream
+
+
+async def routed_tokens(router, payload, metrics=None, deadline=None, retries=resilience.RETRIES):
+    """Отдаёт токены с самого быстрого исправного сервера (см. backend_router).
+
+    Пока не пришёл первый токен, при ошибке соединения, таймауте или
+    ответе 429/5xx запрос повторяется на следующем сервере, а когда
+    серверы кончились — ещё до retries кругов со случайной растущей
+    паузой. Серверы с открытым автоматом защиты пропускаются без ожидания.
+    deadline (resilience.Deadline) ограничивает ожидание первого токена
+    вместе со всеми повторами и паузами.
+    """
+    last_error = None
+    candidates = router.candidates(payload.get("model"))
+    for attempt in range(retries + 1):
+        failed = None
+        retryable = False
+        hint = None
+        for backend in candidates:
+            if not backend.breaker.allow():
+                if last_error is None:
+                    last_error = resilience.CircuitOpenError(backend.title, backend.breaker.retry_in())
+                continue
+            if failed is not None:
+                print(f"\n[{failed.title} не отвечает, переключаюсь на {backend.title}]")
+            stream = ChatStream(
+                backend.base_url, backend.prepare_payload(payload), api_key=backend.api_key,
+                metrics=metrics,
+                read_timeout=resilience.limit_timeout(router.read_timeout(backend), deadline)
+            )
+            started = time.perf_counter()
+            got_token = False
+            completed = False
+            router.acquire(backend)
+            try:
+                async for token in stream.tokens():
+                    if not got_token:
+                        got_token = True
+                        router.record_ttft(backend, time.perf_counter() - started)
+                        if metrics is not None:
+                            metrics.backend = backend.name
+                    yield token
+                completed = True
+                if not got_token:
+                    router.record_success(backend)
+                return
+            except StreamError as e:
+                if got_token or not e.retryable:
+                    raise
+                router.record_failure(backend)
+                last_error, retryable, hint = e, True, e.retry_after
+            except Exception as e:
+                router.record_failure(backend)
+                if got_token:
+                    raise
+                last_error, retryable = e, True
+            finally:
+                router.release(backend)
+                if not completed:
+                    stream.cancel()
+            failed = backend
+        if not retryable or attempt == retries:
+            break
+        delay = resilience.backoff_delay(attempt, hint)
+        if deadline is not None and deadline.remaining() <= delay:
+            break
+        print(f"\n[Сервер не ответил, повтор через {delay:.1f} с]")
+        await asyncio.sleep(delay)
+    if last_error is not None:
+        raise last_error
+
+
+async def hedged_tokens(router, payload, metrics=None, delay=HEDGE_DELAY, deadline=None):
+    """Хеджированный запрос: гонка двух серверов за первый токен.
+
+    Если лучший сервер не прислал токен за delay секунд, тот же запрос
+    уходит на следующий. Побеждает поток, первым выдавший текст;
+    проигравший закрывается, чтобы не занимать слот сервера. Ошибка до
+    первого токена запускает следующий сервер сразу, без ожидания.
+    Серверы с открытым автоматом защиты в гонке не участвуют: каждый
+    запуск проходит через breaker.allow(), так что в пробном режиме
+    сервер получает не больше одного запроса. Ошибка одного участника,
+    в том числе неповторяемая (4xx), не прерывает других: она поднимается,
+    только если ни одной попытки не осталось.
+    """
+    everything = router.candidates(payload.get("model"))
+    candidates = [b for b in everything if b.healthy]
+    if everything and not candidates:
+        backend = everything[0]
+        raise resilience.CircuitOpenError(backend.title, backend.breaker.retry_in())
+    pending = {}
+    next_index = 0
+    hedged = False
+    winner = None
+    first_token = None
+    last_error = None
+
+    def launch():
+        """Запускает следующий сервер, которого пропускает автомат; возвращает его или None."""
+        nonlocal next_index, last_error
+        while next_index < len(candidates):
+            backend = candidates[next_index]
+            next_index += 1
+            if backend.breaker.allow():
+                break
+            if last_error is None:
+                last_error = resilience.CircuitOpenError(backend.title, backend.breaker.retry_in())
+        else:
+            return None
+        stream = ChatStream(
+            backend.base_url, backend.prepare_payload(payload), api_key=backend.api_key,
+            read_timeout=resilience.limit_timeout(router.read_timeout(backend), deadline)
+        )
+        tokens = stream.tokens()
+        router.acquire(backend)
+        attempt = (backend, stream, tokens, time.perf_counter())
+        pending[asyncio.ensure_future(tokens.__anext__())] = attempt
+        return backend
+
+    def drop(task, attempt):
+        backend, stream, _, started = attempt
+        task.cancel()
+        stream.cancel()
+        router.release(backend)
+        if winner is not None:
+            # Проигравший не успел ответить: его TTFT не меньше прошедшего времени
+            router.observe_ttft(backend, time.perf_counter() - started)
+
+    if not candidates:
+        return
+    if launch() is None:
+        raise last_error
+    try:
+        while pending and winner is None:
+            can_hedge = not hedged and next_index < len(candidates)
+            done, _ = await asyncio.wait(
+                list(pending), timeout=delay if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                hedged = True
+                slow = pending[next(iter(pending))][0]
+                backend = launch()
+                if backend is not None:
+                    print(f"\n[{slow.title} медлит, дублирую запрос на {backend.title}]")
+                continue
+            for task in done:
+                attempt = pending.pop(task)
+                backend, stream, _, started = attempt
+                if winner is not None:
+                    drop(task, attempt)
+                    continue
+                try:
+                    token = task.result()
+                except StopAsyncIteration:
+                    # Сервер ответил пустым текстом — это тоже ответ
+                    router.record_success(backend)
+                    winner, first_token = attempt, None
+                    continue
+                except StreamError as e:
+                    router.release(backend)
+                    # Неповторяемая ошибка (4xx) — не сбой сервера, но и не повод
+                    # обрывать другую попытку: поднимется, если других не останется
+                    if e.retryable:
+                        router.record_failure(backend)
+                    last_error = e
+                except Exception as e:
+                    router.release(backend)
+                    router.record_failure(backend)
+                    last_error = e
+                else:
+                    router.record_ttft(backend, time.perf_counter() - started)
+                    winner, first_token = attempt, token
+                    continue
+                # Ошибка до первого токена: сразу заменяем сервер следующим
+                if len(pending) < (2 if hedged else 1) and next_index < len(candidates):
+                    launch()
+    finally:
+        for task, attempt in list(pending.items()):
+            drop(task, attempt)
+        pending.clear()
+
+    if winner is None:
+        if last_error is not None:
+            raise last_error
+        return
+
+    backend, stream, tokens, _ = winner
+    completed = False
+    try:
+        if first_token is not None:
+            if metrics is not None:
+                metrics.backend = backend.name
+                metrics.mark_connected()
+                metrics.on_tokens()
+            yield first_token
+            async for token in tokens:
+                if metrics is not None:
+                    metrics.on_tokens()
+                yield token
+        completed = True
+    finally:
+        router.release(backend)
+        if not completed:
+            stream.cancel()
+
+
+async def stream_chat_routed(router, payload, consumers=(), metrics=None, hedge_delay=None,
+                             deadline=None):
+    """Потоковый запрос через маршрутизатор серверов.
+
+    hedge_delay — включает хеджирование с этой задержкой (секунды);
+    deadline — срок получения первого токена (resilience.Deadline).
+    """
+    if hedge_delay is not None:
+        source = hedged_tokens(router, payload, metrics=metrics, delay=hedge_delay, deadline=deadline)
+    else:
+        source = routed_tokens(router, payload, metrics=metrics, deadline=deadline)
+    await broadcast(source, list(consumers))
+
+
+class StreamEngine:
+    """Фоновый цикл asyncio, в котором выполняются потоковые запросы."""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def submit(self, coro, cancel_with_requests=True):
+        """Запускает корутину в фоновом цикле, возвращает concurrent.futures.Future.
+
+        cancel_with_requests=False — корутину не отменяет cancel_active()
+        (фоновые задачи, которые живут дольше одного запроса).
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        if cancel_with_requests:
+            self._active.add(future)
+            future.add_done_callback(self._active.discard)
+        return future
+
+    def cancel_active(self):
+        """Отменяет все выполняющиеся запросы."""
+        for future in list(self._active):
+            future.cancel()
+
+    def run(self, coro, poll_interval=0.1):
+        """Выполняет корутину и ждёт результат. Ctrl+C отменяет запрос.
+
+        Ожидание идёт короткими интервалами, чтобы Ctrl+C срабатывал
+        и в консоли Windows.
+        """
+        done = threading.Event()
+
+        async def wrapper():
+            try:
+                return await coro
+            finally:
+                done.set()
+
+        future = self.submit(wrapper())
+        try:
+            while True:
+                try:
+                    return future.result(timeout=poll_interval)
+                except concurrent.futures.TimeoutError:
+                    continue
+        except KeyboardInterrupt:
+            future.cancel()
+            # Даём потребителям дописать уже полученные токены
+            done.wait(timeout=2)
+            raise
+
+
+_engine = None
+
+
+def get_engine():
+    """Возвращает общий движок потоковых запросов."""
+    global _engine
+    if _engine is None:
+        _engine = StreamEngine()
+    return _engine
+
+
+def cancel_active():
+    """Прерывает все активные потоковые запросы."""
+    if _engine is not None:
+        _engine.cancel_active()
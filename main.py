@@ -4,56 +4,14 @@ import subprocess
 import importlib
 import pkg_resources
 import json
+import copy
+
+import llm_providers
 
 class ModelManager:
     def __init__(self):
-        self.models_config = {
-            "openai": {
-                "name": "OpenAI API",
-                "env_vars": {
-                    "OPENAI_API_KEY": "your-openai-api-key"
-                },
-                "models": ["gpt-3.5-turbo", "gpt-4", "gpt-4-turbo"]
-            },
-            "lm-studio-local": {
-                "name": "LM Studio (localhost)",
-                "env_vars": {
-                    "OPENAI_API_KEY": "lm-studio",
-                    "OPENAI_API_BASE": "http://localhost:1234/v1"
-                },
-                "models": ["local-model"]
-            },
-            "lm-studio-remote": {
-                "name": "LM Studio (remote)",
-                "env_vars": {
-                    "OPENAI_API_KEY": "lm-studio",
-                    "OPENAI_API_BASE": "http://26.224.68.101:1234/v1"
-                },
-                "models": ["remote-model"]
-            },
-            "ollama": {
-                "name": "Ollama (локальный)",
-                "env_vars": {
-                    "OPENAI_API_KEY": "ollama",
-                    "OPENAI_API_BASE": "http://localhost:11434/v1"
-                },
-                "models": ["llama3", "mistral", "mixtral", "gemma"]
-            },
-            "anthropic": {
-                "name": "Anthropic API",
-                "env_vars": {
-                    "ANTHROPIC_API_KEY": "your-anthropic-api-key"
-                },
-                "models": ["claude-3-opus", "claude-3-sonnet", "claude-3-haiku"]
-            },
-            "together": {
-                "name": "Together AI",
-                "env_vars": {
-                    "TOGETHER_API_KEY": "your-together-api-key"
-                },
-                "models": ["mistralai/Mixtral-8x7B", "meta-llama/Llama-3-70b"]
-            }
-        }
+        # Общая таблица провайдеров (её же использует маршрутизатор backend_router)
+        self.models_config = copy.deepcopy(llm_providers.MODELS_CONFIG)
         
         # Загрузка сохраненной конфигурации, если она существует
         self.config_file = "llm_config.json"
@@ -209,7 +167,7 @@ class DependencyManager:
 from crewai_tools import BaseTool
 import subprocess
 import os
-import requests
+import resilience
 import sqlite3
 from bs4 import BeautifulSoup
 from PyPDF2 import PdfReader
@@ -303,7 +261,7 @@ class HTMLScraperTool(BaseTool):
 
     def _run(self, url: str):
         try:
-            response = requests.get(url)
+            response = resilience.request("GET", url)
             soup = BeautifulSoup(response.text, 'html.parser')
             return soup.get_text()[:3000]
         except Exception as e:
@@ -337,13 +295,13 @@ class APITool(BaseTool):
     def _run(self, url: str, method="GET", headers=None, data=None, params=None):
         try:
             if method.upper() == "GET":
-                response = requests.get(url, headers=headers, params=params)
+                response = resilience.request("GET", url, headers=headers, params=params)
             elif method.upper() == "POST":
-                response = requests.post(url, headers=headers, json=data, params=params)
+                response = resilience.request("POST", url, headers=headers, json=data, params=params)
             elif method.upper() == "PUT":
-                response = requests.put(url, headers=headers, json=data, params=params)
+                response = resilience.request("PUT", url, headers=headers, json=data, params=params)
             elif method.upper() == "DELETE":
-                response = requests.delete(url, headers=headers, params=params)
+                response = resilience.request("DELETE", url, headers=headers, params=params)
             else:
                 return f"Неподдерживаемый метод: {method}"
             
@@ -398,7 +356,7 @@ class ImageTool(BaseTool):
     def _run(self, action: str, url=None, path=None, width=None, height=None):
         try:
             if action == "download" and url:
-                response = requests.get(url)
+                response = resilience.request("GET", url)
                 img = Image.open(BytesIO(response.content))
                 save_path = path or f"image_{int(time.time())}.jpg"
                 img.save(save_path)
@@ -451,6 +409,8 @@ class CSVTool(BaseTool):
 from crewai import Agent, Task, Crew
 from dotenv import load_dotenv
 import os
+import llm_metrics
+import response_cache
 
 class AIAgent:
     def __init__(self, model_manager):
@@ -552,15 +512,43 @@ class AIAgent:
         )
     
     def run_task(self, task_description):
-        """Запускает выполнение задачи."""
+        """Запускает выполнение задачи.
+
+        Параметры сэмплирования CrewAI неизвестны, поэтому результат берётся
+        из кэша ответов только в принудительном режиме (LLM_CACHE_FORCE=1).
+        """
+        payload = {
+            "model": f"crew:{self.model_manager.current_provider}:{self.model_manager.current_model}",
+            "messages": [{"role": "user", "content": task_description}]
+        }
+        return response_cache.cached_call(payload, lambda: self._run_crew(task_description))
+    
+    def _run_crew(self, task_description):
+        """Выполняет задачу через CrewAI и возвращает текст результата."""
         task = self.create_task(task_description)
         crew = Crew(
             agents=[self.agent],
             tasks=[task]
         )
         
-        result = crew.kickoff()
-        return result
+        # Замеры времени выполнения задачи (см. llm_metrics)
+        metrics = llm_metrics.RequestMetrics(
+            self.model_manager.current_model, "main.AIAgent",
+            prompt_chars=len(task_description)
+        )
+        try:
+            result = crew.kickoff()
+        except Exception as e:
+            metrics.finish(error=type(e).__name__)
+            raise
+        
+        # CrewAI собирает статистику токенов по всем вызовам модели
+        usage = getattr(crew, "usage_metrics", None) or {}
+        if not isinstance(usage, dict):
+            usage = vars(usage)
+        metrics.prompt_tokens = usage.get("prompt_tokens", 0)
+        metrics.finish(completion_tokens=usage.get("completion_tokens"))
+        return str(result)
 
 def display_menu():
     """Отображает главное меню с доступными опциями."""
@@ -0,0 +1,162 @@
+"""Каталог моделей серверов с длиной контекста.
+
+Список моделей каждого сервера (GET /models) кэшируется на CATALOG_TTL
+секунд. Устаревший список сразу отдаётся из кэша, а обновляется в фоновом
+потоке; синхронно сервер опрашивается только при первом обращении.
+
+После получения списка каталог узнаёт реальную длину контекста:
+- LM Studio: GET /api/v0/models (loaded_context_length или max_context_length);
+- ollama: POST /api/show (num_ctx из parameters или <arch>.context_length).
+При первом опросе сервера ответ ждут до DISCOVERY_WAIT секунд, чтобы
+длина контекста выбранной при запуске модели уже была от сервера; при
+обновлениях списка запросы идут в фоне. Пока ответа нет (или сервер
+этого не умеет), длина берётся из таблицы шаблонов имён. Результат для
+каждой модели вычисляется один раз, поэтому context_length() — поиск
+в словаре.
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+
+# Сколько секунд список моделей сервера считается свежим
+CATALOG_TTL = 300.0
+# Таймаут запросов о длине контекста, сек
+DISCOVERY_TIMEOUT = 3.0
+# Сколько ждать длину контекста при первом опросе сервера, сек
+DISCOVERY_WAIT = 2.0
+
+_NUM_CTX = re.compile(r'^\s*num_ctx\s+(\d+)', re.MULTILINE)
+
+
+def server_root(base_url):
+    """Адрес сервера без OpenAI-совместимого префикса /v1."""
+    base_url = base_url.rstrip('/')
+    return base_url[:-3] if base_url.endswith('/v1') else base_url
+
+
+def discover_lm_studio(base_url, api_key=None):
+    """Длины контекста моделей LM Studio: {модель: токенов}."""
+    response = llm_client.get(f"{server_root(base_url)}/api/v0/models", api_key=api_key,
+                              timeout=DISCOVERY_TIMEOUT)
+    response.raise_for_status()
+    lengths = {}
+    for model in response.json().get("data", []):
+        # Загруженная модель работает с заданным при загрузке контекстом
+        length = model.get("loaded_context_length") or model.get("max_context_length")
+        if length:
+            lengths[model["id"]] = int(length)
+    return lengths
+
+
+def discover_ollama(base_url, model, api_key=None):
+    """Длина контекста модели ollama или None."""
+    response = llm_client.post(f"{server_root(base_url)}/api/show", {"model": model},
+                               api_key=api_key, timeout=DISCOVERY_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    # num_ctx из Modelfile — контекст, с которым модель реально запускается
+    match = _NUM_CTX.search(data.get("parameters") or "")
+    if match:
+        return int(match.group(1))
+    for key, value in (data.get("model_info") or {}).items():
+        if key.endswith(".context_length"):
+            return int(value)
+    return None
+
+
+class ModelCatalog:
+    """Модели серверов маршрутизатора и их длина контекста."""
+
+    def __init__(self, router, context_lengths, ttl=CATALOG_TTL):
+        self.router = router
+        # Таблица «шаблон имени -> длина контекста» с ключом 'default'
+        self.context_lengths = context_lengths
+        self.ttl = ttl
+        self._fetched = {}
+        self._discovered = {}
+        self._lengths = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def models(self):
+        """Модели доступных серверов.
+
+        При первом обращении серверы опрашиваются синхронно, потом список
+        берётся из кэша, а устаревшие серверы обновляются в фоне.
+        """
+        now = time.monotonic()
+        missing = [b for b in self.router.backends if b.name not in self._fetched]
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                list(pool.map(lambda backend: self._refresh(backend, DISCOVERY_WAIT), missing))
+        for backend in self.router.backends:
+            fetched = self._fetched.get(backend.name)
+            if fetched is not None and now - fetched > self.ttl:
+                self._refresh_in_background(backend)
+        return self.router.models()
+
+    def _refresh_in_background(self, backend):
+        with self._lock:
+            if backend.name in self._refreshing:
+                return
+            self._refreshing.add(backend.name)
+        threading.Thread(target=self._refresh, args=(backend,), daemon=True).start()
+
+    def _refresh(self, backend, wait=None):
+        """Обновляет список моделей сервера; wait — сколько ждать длину контекста."""
+        try:
+            ok = self.router.probe(backend)
+            self._fetched[backend.name] = time.monotonic()
+            if ok:
+                for model in list(backend.models):
+                    self.context_length(model)
+                # Для ollama это запрос на каждую модель — список ждёт не дольше wait
+                discovery = threading.Thread(target=self._discover, args=(backend,), daemon=True)
+                discovery.start()
+                if wait:
+                    discovery.join(wait)
+        finally:
+            with self._lock:
+                self._refreshing.discard(backend.name)
+
+    def _discover(self, backend):
+        """Узнаёт длину контекста моделей сервера (LM Studio, затем ollama)."""
+        try:
+            lengths = discover_lm_studio(backend.base_url, backend.api_key)
+        except Exception:
+            lengths = {}
+            for model in sorted(backend.models):
+                try:
+                    length = discover_ollama(backend.base_url, model, backend.api_key)
+                except Exception:
+                    # Не ollama и не LM Studio — остаётся таблица
+                    break
+                if length:
+                    lengths[model] = length
+        if lengths:
+            with self._lock:
+                # Пересчитываем только модели, для которых пришли данные
+                for model, length in lengths.items():
+                    self._discovered[model.lower()] = length
+                    self._lengths.pop(model.lower(), None)
+
+    def context_length(self, model):
+        """Длина контекста модели (от сервера, иначе из таблицы)."""
+        key = (model or "").lower()
+        length = self._lengths.get(key)
+        if length is None:
+            with self._lock:
+                length = self._lengths[key] = self._lookup(key)
+        return length
+
+    def _lookup(self, key):
+        discovered = self._discovered.get(key)
+        if discovered:
+            return discovered
+        for pattern, length in self.context_lengths.items():
+            if pattern != 'default' and pattern.lower() in key:
+                return length
+        return self.context_lengths['default']
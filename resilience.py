@@ -0,0 +1,250 @@
+"""Устойчивость HTTP-вызовов: автоматы защиты, повторы с паузой, сроки.
+
+Для каждого адреса сервера (схема + хост + порт) ведётся автомат защиты
+(circuit breaker). После FAILURE_THRESHOLD ошибок подряд он «открывается»:
+запросы к серверу сразу завершаются CircuitOpenError, а не ждут таймаута.
+Через RESET_TIMEOUT секунд пропускается один пробный запрос; если и он
+не удался, пауза удваивается (не больше MAX_RESET_TIMEOUT).
+
+Ответы 429/5xx и ошибки соединения повторяются с экспоненциальной паузой
+со случайным разбросом (full jitter); заголовок Retry-After учитывается.
+Deadline задаёт общий срок операции: таймауты и паузы между повторами
+не выходят за него.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+import llm_client
+
+# Ошибок подряд, после которых автомат открывается
+FAILURE_THRESHOLD = 3
+# Через сколько секунд пропустить пробный запрос
+RESET_TIMEOUT = 30.0
+# Предел паузы при повторных неудачных пробах
+MAX_RESET_TIMEOUT = 300.0
+# Повторов запроса после первой попытки
+RETRIES = 2
+# Пауза перед первым повтором и её предел, сек
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+# Методы, которые можно безопасно повторять
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# Таймаут ожидания данных для инструментов агентов, сек
+TOOL_READ_TIMEOUT = 15.0
+
+CLOSED = "закрыт"
+OPEN = "открыт"
+HALF_OPEN = "пробный запрос"
+
+
+class CircuitOpenError(Exception):
+    """Автомат защиты сервера открыт — запрос не отправлялся."""
+
+    def __init__(self, name, retry_in=0.0):
+        super().__init__(f"{name} недоступен, повторная попытка через {retry_in:.0f} с")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(TimeoutError):
+    """Общий срок операции истёк."""
+
+
+class Deadline:
+    """Момент, к которому операция должна завершиться."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, limit=None):
+        """Таймаут очередного шага: не больше limit и оставшегося срока."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"срок {self.seconds:g} с истёк")
+        return remaining if limit is None else min(limit, remaining)
+
+
+def limit_timeout(timeout, deadline=None):
+    """Таймаут с учётом срока (deadline может быть None)."""
+    return timeout if deadline is None else deadline.timeout(timeout)
+
+
+class CircuitBreaker:
+    """Автомат защиты одного сервера."""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 max_reset_timeout=MAX_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.opened_until = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._open = False
+        self._pause = reset_timeout
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if not self._open:
+            return CLOSED
+        return OPEN if time.monotonic() < self.opened_until else HALF_OPEN
+
+    @property
+    def available(self):
+        """Можно ли сейчас отправлять запросы (без учёта занятости пробы)."""
+        return self.state != OPEN
+
+    def retry_in(self):
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def allow(self):
+        """Разрешает запрос; в пробном режиме — только один за раз."""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            now = time.monotonic()
+            if state == HALF_OPEN and (self._trial_started is None
+                                       or now - self._trial_started > self._pause):
+                # Проба, которая не отчиталась (например, прервана), не держит автомат вечно
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Как allow(), но при отказе бросает CircuitOpenError."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._open = False
+            self._pause = self.reset_timeout
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._open:
+                # Неудачная проба: ждём вдвое дольше
+                self._pause = min(self.max_reset_timeout, self._pause * 2)
+            elif self.failures < self.failure_threshold:
+                return
+            self._open = True
+            self.opened_until = time.monotonic() + self._pause
+            self._trial_started = None
+            self.opens += 1
+
+    def describe(self):
+        state = self.state
+        text = f"{self.name}: {state}, ошибок подряд {self.failures}"
+        if state == OPEN:
+            text += f", проба через {self.retry_in():.0f} с"
+        if self.opens or self.rejected:
+            text += f", открывался {self.opens} раз, отклонено запросов {self.rejected}"
+        return text
+
+
+def endpoint_key(url):
+    """Адрес сервера для автомата защиты: схема, хост и порт."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else url
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url, **options):
+    """Автомат защиты сервера (общий для всех запросов к нему)."""
+    key = endpoint_key(url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(key, **options)
+    return breaker
+
+
+def describe_breakers():
+    """Состояние всех автоматов защиты для команды «статистика»."""
+    with _breakers_lock:
+        breakers = sorted(_breakers.values(), key=lambda b: b.name)
+    if not breakers:
+        return "Автоматы защиты: запросов еще не было"
+    return "Автоматы защиты:\n" + "\n".join(b.describe() for b in breakers)
+
+
+def retry_after(response):
+    """Пауза из заголовка Retry-After (секунды или дата) или None."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, hint=None, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Пауза перед повтором номер attempt (с нуля): случайная в [0, base * 2^attempt]."""
+    if hint is not None:
+        return min(cap, hint)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def request(method, url, deadline=None, retries=RETRIES, timeout=TOOL_READ_TIMEOUT, **kwargs):
+    """HTTP-запрос через общий пул с автоматом защиты и повторами.
+
+    Повторяются только идемпотентные методы. Если повторы не помогли,
+    возвращается последний ответ (или бросается последняя ошибка).
+    """
+    method = method.upper()
+    breaker = get_breaker(url)
+    attempts = retries + 1 if method in IDEMPOTENT_METHODS else 1
+    for attempt in range(attempts):
+        breaker.check()
+        response, error = None, None
+        try:
+            response = llm_client.get_session().request(
+                method, url, timeout=llm_client.make_timeout(limit_timeout(timeout, deadline)), **kwargs
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if response is not None and response.status_code not in RETRYABLE_STATUS:
+            breaker.record_success()
+            return response
+        breaker.record_failure()
+        delay = backoff_delay(attempt, retry_after(response))
+        last = attempt + 1 == attempts or (deadline is not None and deadline.remaining() <= delay)
+        if last:
+            if error is not None:
+                raise error
+            return response
+        time.sleep(delay)
@@ -0,0 +1,229 @@
+"""Кэш ответов модели для детерминированных запросов.
+
+Ключ — SHA-256 от модели, сообщений и параметров сэмплирования. Перед
+SQLite-хранилищем на диске стоит LRU-кэш в памяти. Записи живут TTL
+секунд, при превышении MAX_DISK_BYTES удаляются давно не использованные.
+
+Кэш включается явно (LLM_CACHE=1 или команда «кэш вкл»). Запросы с
+temperature > 0 не кэшируются, если не включён принудительный режим
+(LLM_CACHE_FORCE=1 или «кэш всегда»).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_FILE = "llm_cache.sqlite3"
+DEFAULT_TTL = 7 * 24 * 3600
+MAX_MEMORY_ENTRIES = 256
+MAX_DISK_BYTES = 50 * 1024 * 1024
+
+# Параметры запроса, влияющие на ответ модели
+SAMPLING_KEYS = (
+    "temperature", "top_p", "top_k", "repetition_penalty", "max_tokens",
+    "presence_penalty", "frequency_penalty", "seed", "stop"
+)
+
+# Разбиение закэшированного ответа на фрагменты для «потокового» вывода
+_REPLAY_PIECE = re.compile(r'\S+\s*|\s+')
+
+
+def make_key(payload):
+    """Считает ключ кэша по модели, сообщениям и параметрам сэмплирования."""
+    material = {
+        "model": payload.get("model"),
+        "messages": [
+            {"role": m.get("role"), "content": m.get("content")}
+            for m in payload.get("messages", [])
+        ],
+        "params": {k: payload[k] for k in SAMPLING_KEYS if k in payload}
+    }
+    raw = json.dumps(material, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Двухуровневый кэш ответов: LRU в памяти + SQLite на диске."""
+
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL,
+                 max_memory_entries=MAX_MEMORY_ENTRIES, max_disk_bytes=MAX_DISK_BYTES,
+                 enabled=False, force=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self.force = force
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)"
+            )
+        return self._conn
+
+    def is_cacheable(self, payload, force=None):
+        """Можно ли брать ответ на этот запрос из кэша.
+
+        Запрос без явного temperature считается недетерминированным.
+        """
+        if not self.enabled:
+            return False
+        if force if force is not None else self.force:
+            return True
+        temperature = payload.get("temperature")
+        return temperature is not None and temperature <= 0
+
+    def get(self, key):
+        """Возвращает закэшированный ответ или None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._memory[key]
+
+            try:
+                db = self._db()
+                row = db.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                response, created = row
+                if now - created > self.ttl:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    db.commit()
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Ошибка чтения кэша ответов: {e}")
+                self.misses += 1
+                return None
+
+            self._remember(key, response, created)
+            self.hits += 1
+            return response
+
+    def put(self, key, response):
+        """Сохраняет ответ в памяти и на диске."""
+        if not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, response, len(response.encode('utf-8')), now, now)
+                )
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Ошибка записи кэша ответов: {e}")
+
+    def _remember(self, key, response, created):
+        self._memory[key] = (response, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, db, now):
+        """Удаляет устаревшие записи и самые старые, пока не влезем в лимит."""
+        db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        rows = db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+
+    def clear(self):
+        """Полностью очищает кэш."""
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._db()
+                db.execute("DELETE FROM responses")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Ошибка очистки кэша ответов: {e}")
+
+    def status(self):
+        """Краткое описание состояния кэша."""
+        if not self.enabled:
+            state = "выключен"
+        elif self.force:
+            state = "включен (всегда, даже при temperature > 0)"
+        else:
+            state = "включен (только при temperature = 0)"
+        return f"Кэш ответов {state}. Попаданий: {self.hits}, промахов: {self.misses}"
+
+
+def cached_call(payload, fn, cache=None):
+    """Возвращает ответ из кэша или вызывает fn() и сохраняет результат."""
+    cache = cache or get_cache()
+    if not cache.is_cacheable(payload):
+        return fn()
+    key = make_key(payload)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    result = fn()
+    if isinstance(result, str):
+        cache.put(key, result)
+    return result
+
+
+async def replay_tokens(text):
+    """Отдаёт закэшированный ответ по словам — как потоковый ответ модели."""
+    for match in _REPLAY_PIECE.finditer(text):
+        yield match.group()
+        # Отдаём управление циклу, чтобы вывод и озвучка шли параллельно
+        await asyncio.sleep(0)
+
+
+_cache = None
+
+
+def get_cache():
+    """Возвращает общий кэш ответов (настройки берутся из окружения)."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            enabled=os.getenv("LLM_CACHE", "0") == "1",
+            force=os.getenv("LLM_CACHE_FORCE", "0") == "1"
+        )
+    return _cache
@@ -3,11 +3,14 @@ import sys
 import subprocess
 from dotenv import load_dotenv
 from crewai import Agent, Task, Crew
+import response_cache
+import llm_providers
+import backend_router
 from tools import FileTool, TerminalTool, WebSearchTool, PDFReaderTool, GitTool, SQLiteTool, HTMLScraperTool
 
 # Настройка переменных окружения для удаленной модели
 os.environ["OPENAI_API_KEY"] = "lm-studio"
-os.environ["OPENAI_API_BASE"] = "http://26.224.68.101:1234/v1"
+os.environ["OPENAI_API_BASE"] = llm_providers.default_base_url()
 
 def check_dependencies():
     """Проверяет наличие необходимых зависимостей."""
@@ -48,45 +51,9 @@ def check_dependencies():
     
     return True
 
-def run_agent():
-    """Создает и запускает агента с удаленной моделью."""
-    # Инициализация инструментов
-    tools = [
-        FileTool(), TerminalTool(), WebSearchTool(),
-        PDFReaderTool(), GitTool(), SQLiteTool(), HTMLScraperTool()
-    ]
-    
-    # Создание агента
-    agent = Agent(
-        role="Full-Stack Autonomous Agent",
-        goal="Выполнять различные задачи по запросу пользователя",
-        backstory="Ты универсальный автономный агент, способный работать с файлами, кодом, данными, API и многим другим.",
-        tools=tools,
-        verbose=True
-    )
-    
-    # Меню выбора задачи
-    print("\n" + "="*50)
-    print("АВТОНОМНЫЙ AI-АГЕНТ".center(50))
-    print("="*50)
-    print(f"\nИспользуется модель: LM Studio (remote)")
-    print(f"URL: http://26.224.68.101:1234/v1")
-    print("\nВыберите задачу:")
-    print("1. Создать консольную адресную книгу на Python с базой SQLite")
-    print("2. Создать Telegram-бота для сохранения и анализа ссылок")
-    print("3. Анализ данных из CSV файла и создание отчета")
-    print("4. Своя задача (ввести описание)")
-    print("0. Выход")
-    print("="*50)
-    
-    choice = input("\nВаш выбор: ")
-    
-    if choice == "0":
-        print("Выход из программы...")
-        return
-    
-    elif choice == "1":
-        task_description = """
+# Готовые задачи меню (номер -> описание)
+TASK_PRESETS = {
+    "1": """
         Создай консольную адресную книгу на Python с базой SQLite и CLI интерфейсом.
         Программа должна уметь:
         1. Добавлять контакты (имя, телефон, email)
@@ -96,10 +63,8 @@ def run_agent():
         5. Сохранять данные в SQLite базу
         
         Создай файл address_book.py с полным кодом программы.
-        """
-    
-    elif choice == "2":
-        task_description = """
+        """,
+    "2": """
         Создай Telegram-бота на Python с использованием библиотеки python-telegram-bot.
         Бот должен:
         1. Сохранять ссылки, которые отправляет пользователь, в базу данных SQLite
@@ -108,10 +73,8 @@ def run_agent():
         4. Иметь команду для поиска по сохраненным ссылкам
         
         Создай все необходимые файлы, включая telegram_bot.py и schema.sql.
-        """
-    
-    elif choice == "3":
-        task_description = """
+        """,
+    "3": """
         Выполни следующие задачи:
         
         1. Создай CSV файл с данными о 5 городах (название, население, страна)
@@ -122,7 +85,98 @@ def run_agent():
         6. Скачай изображение города с наибольшим населением
         
         Все результаты сохрани в папку 'results'.
-        """
+        """,
+}
+
+def configure_backend(backend=None):
+    """Направляет агентов на сервер (по умолчанию — самый быстрый доступный).
+    
+    crewai берёт адрес сервера из переменных окружения, поэтому сервер
+    один на весь процесс. Возвращает выбранный сервер или None.
+    """
+    if backend is None:
+        backend = backend_router.select_backend()
+    if backend is not None:
+        os.environ["OPENAI_API_KEY"] = backend.api_key or os.environ["OPENAI_API_KEY"]
+        os.environ["OPENAI_API_BASE"] = backend.base_url
+    return backend
+
+def create_tools():
+    """Создает набор инструментов агента."""
+    return [
+        FileTool(), TerminalTool(), WebSearchTool(),
+        PDFReaderTool(), GitTool(), SQLiteTool(), HTMLScraperTool()
+    ]
+
+def create_agent(tools=None, verbose=True):
+    """Создает универсального агента."""
+    return Agent(
+        role="Full-Stack Autonomous Agent",
+        goal="Выполнять различные задачи по запросу пользователя",
+        backstory="Ты универсальный автономный агент, способный работать с файлами, кодом, данными, API и многим другим.",
+        tools=create_tools() if tools is None else tools,
+        verbose=verbose
+    )
+
+def crew_model(agent):
+    """Сервер и модель, которыми отвечает агент (входят в ключ кэша ответов)."""
+    llm = getattr(agent, "llm", None)
+    model = (getattr(llm, "model", None) or getattr(llm, "model_name", None)
+             or (llm if isinstance(llm, str) else None) or os.getenv("OPENAI_MODEL_NAME", ""))
+    return f"crew:{os.environ.get('OPENAI_API_BASE', '')}:{model}"
+
+def run_task(task_description, agent=None):
+    """Выполняет задачу агентом и возвращает результат строкой."""
+    agent = agent or create_agent()
+    task = Task(
+        description=task_description,
+        expected_output="Результат выполнения задачи",
+        agent=agent
+    )
+    
+    crew = Crew(
+        agents=[agent],
+        tasks=[task]
+    )
+    
+    # Повторяющиеся задачи можно брать из кэша ответов (LLM_CACHE=1 LLM_CACHE_FORCE=1);
+    # ответ другого сервера или модели из кэша не берется
+    payload = {
+        "model": crew_model(agent),
+        "messages": [{"role": "user", "content": task_description}]
+    }
+    return response_cache.cached_call(payload, lambda: str(crew.kickoff()))
+
+def run_agent():
+    """Создает и запускает агента с удаленной моделью."""
+    # Выбираем самый быстрый доступный сервер из таблицы провайдеров
+    configure_backend()
+    
+    # Создание агента
+    agent = create_agent()
+    
+    # Меню выбора задачи
+    print("\n" + "="*50)
+    print("АВТОНОМНЫЙ AI-АГЕНТ".center(50))
+    print("="*50)
+    print(f"\nИспользуется модель: LM Studio (remote)")
+    print(f"URL: {os.environ['OPENAI_API_BASE']}")
+    print("\nВыберите задачу:")
+    print("1. Создать консольную адресную книгу на Python с базой SQLite")
+    print("2. Создать Telegram-бота для сохранения и анализа ссылок")
+    print("3. Анализ данных из CSV файла и создание отчета")
+    print("4. Своя задача (ввести описание)")
+    print("0. Выход")
+    print("="*50)
+    
+    choice = input("\nВаш выбор: ")
+    
+    if choice == "0":
+        print("Выход из программы...")
+        return
+    
+    elif choice in TASK_PRESETS:
+        task_description = TASK_PRESETS[choice]
     
     elif choice == "4":
         print("\nВведите описание своей задачи:")
@@ -135,18 +189,7 @@ def run_agent():
     # Создание и запуск задачи
     print(f"\nЗапуск выполнения задачи с удаленной моделью LM Studio...")
     try:
-        task = Task(
-            description=task_description,
-            expected_output="Результат выполнения задачи",
-            agent=agent
-        )
-        
-        crew = Crew(
-            agents=[agent],
-            tasks=[task]
-        )
-        
-        result = crew.kickoff()
+        result = run_task(task_description, agent)
         print("\n" + "="*50)
         print("РЕЗУЛЬТАТ ВЫПОЛНЕНИЯ:".center(50))
         print("="*50)
@@ -155,7 +198,7 @@ def run_agent():
         
     except Exception as e:
         print(f"Произошла ошибка при выполнении задачи: {str(e)}")
-        print(f"Проверьте, доступен ли сервер LM Studio по адресу: http://26.224.68.101:1234")
+        print(f"Проверьте, доступен ли сервер LM Studio по адресу: {os.environ['OPENAI_API_BASE']}")
 
 if __name__ == "__main__":
     if check_dependencies():
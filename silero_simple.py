@@ -1,5 +1,6 @@
 import torch
 import sounddevice as sd
+import tts_model_store
 
 def main():
     print("Инициализация Silero TTS...")
@@ -17,11 +18,7 @@ def main():
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"Используется устройство: {device}")
         
-        model, _ = torch.hub.load(repo_or_dir='snakers4/silero-models',
-                                model='silero_tts',
-                                language='ru',
-                                speaker='v3_1_ru')
-        model.to(device)
+        model = tts_model_store.load_model('v3_1_ru', device)
         
         while True:
             print("\nВыберите голос:")
@@ -1,5 +1,6 @@
 import torch
 import sounddevice as sd
+import tts_model_store
 import time
 
 def main():
@@ -17,11 +18,7 @@ def main():
         
         print(f"Используется устройство: {device}")
         
-        model, _ = torch.hub.load(repo_or_dir='snakers4/silero-models',
-                                model='silero_tts',
-                                language=language,
-                                speaker=model_id)
-        model.to(device)
+        model = tts_model_store.load_model(model_id, device)
         
         print("\nДоступные голоса:")
         print("1. aidar (мужской)")
@@ -3,9 +3,13 @@ import sys
 import subprocess
 import importlib.util
 
+import llm_metrics
+import llm_providers
+import response_cache
+
 # Настройка переменных окружения для удаленной модели
 os.environ["OPENAI_API_KEY"] = "lm-studio"
-os.environ["OPENAI_API_BASE"] = "http://26.224.68.101:1234/v1"
+os.environ["OPENAI_API_BASE"] = llm_providers.default_base_url()
 
 def check_package(package_name):
     """Проверяет, установлен ли пакет."""
@@ -32,10 +36,39 @@ def check_and_install_dependencies():
     
     return True
 
+def request_completion(client, payload):
+    """Отправляет непотоковый запрос к модели и записывает его метрики."""
+    # Запрос непотоковый: TTFT = полное время ответа
+    metrics = llm_metrics.RequestMetrics(
+        payload["model"], "simple_run",
+        prompt_chars=sum(len(m["content"]) for m in payload["messages"])
+    )
+    try:
+        response = client.chat.completions.create(**payload)
+    except Exception as e:
+        metrics.finish(error=type(e).__name__)
+        raise
+    
+    metrics.mark_connected()
+    metrics.on_tokens(0)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        metrics.prompt_tokens = usage.prompt_tokens
+    metrics.finish(completion_tokens=usage.completion_tokens if usage is not None else None)
+    
+    return response.choices[0].message.content
+
 def run_simple_agent():
     """Запускает простого агента с использованием только OpenAI API."""
     try:
         import openai
+        import backend_router
+        
+        # Выбираем самый быстрый доступный сервер из таблицы провайдеров
+        backend = backend_router.select_backend("saiga_mistral_7b_gguf")
+        if backend is not None:
+            os.environ["OPENAI_API_KEY"] = backend.api_key or os.environ["OPENAI_API_KEY"]
+            os.environ["OPENAI_API_BASE"] = backend.base_url
         
         # Настройка клиента OpenAI для работы с удаленной моделью
         client = openai.OpenAI(
@@ -46,7 +79,7 @@ def run_simple_agent():
         print("\n" + "="*50)
         print("ПРОСТОЙ AI-АГЕНТ".center(50))
         print("="*50)
-        print(f"\nИспользуется модель: LM Studio (remote)")
+        print(f"\nИспользуется сервер: {backend.title if backend is not None else 'LM Studio (remote)'}")
         print(f"URL: {os.environ['OPENAI_API_BASE']}")
         print("\nВыберите задачу:")
         print("1. Создать консольную адресную книгу на Python")
@@ -111,17 +144,18 @@ def run_simple_agent():
         # Отправка запроса к модели
         print(f"\nЗапуск выполнения задачи с удаленной моделью LM Studio...")
         
-        response = client.chat.completions.create(
-            model="saiga_mistral_7b_gguf",  # Используем модель saiga_mistral_7b_gguf
-            messages=[
+        payload = {
+            "model": "saiga_mistral_7b_gguf",  # Используем модель saiga_mistral_7b_gguf
+            "messages": [
                 {"role": "system", "content": "Ты универсальный автономный агент, способный работать с файлами, кодом, данными, API и многим другим. Твоя задача - выполнить запрос пользователя и предоставить подробное решение."},
                 {"role": "user", "content": task_description}
             ],
-            temperature=0.7,
-            max_tokens=4000
-        )
+            "temperature": 0.7,
+            "max_tokens": 4000
+        }
         
-        result = response.choices[0].message.content
+        # Повторяющиеся задачи можно брать из кэша ответов (LLM_CACHE=1)
+        result = response_cache.cached_call(payload, lambda: request_completion(client, payload))
         
         print("\n" + "="*50)
         print("РЕЗУЛЬТАТ ВЫПОЛНЕНИЯ:".center(50))
@@ -0,0 +1,201 @@
+"""Очередь озвучки с одним потоком синтеза.
+
+Фразы озвучиваются строго по порядку одним долгоживущим потоком:
+модель TTS не делят между собой несколько потоков, а воспроизведение
+одной фразы не обрывает другую.
+
+Очередь ограничена (maxsize фраз). Что делать, когда она заполнена,
+задаёт политика:
+- merge — новая фраза дописывается к последней ожидающей (ничего не
+  теряется, число синтезов уменьшается); если и та уже длинная,
+  выбрасывается самая старая фраза;
+- drop — выбрасывается самая старая ожидающая фраза: голос догоняет
+  текст, пропуская устаревшее;
+- block — put() ждёт освобождения места до put_timeout секунд
+  (обратное давление: поставщик текста замедляется до темпа речи),
+  затем фраза выбрасывается.
+Кроме того, поток синтеза забирает сразу несколько коротких фраз подряд
+(не длиннее merge_chars вместе) и озвучивает их одним вызовом.
+
+Фоновая работа для модели (when_idle, например заготовка звука частых
+фраз) выполняется тем же потоком, но только когда фраз в очереди нет,
+по одной задаче между фразами — озвучку она не задерживает.
+
+Счётчики (status): глубина очереди, принятые, озвученные, слитые и
+выброшенные фразы, время ожидания в очереди и время озвучки.
+"""
+import threading
+import time
+from collections import deque
+
+# Сколько фраз может ждать озвучки
+MAX_PENDING = 8
+# Фразы короче этого (вместе) озвучиваются одним вызовом синтеза
+MERGE_CHARS = 300
+# Сколько put() ждёт места в очереди при политике block, сек
+PUT_TIMEOUT = 5.0
+
+MERGE = "merge"
+DROP = "drop"
+BLOCK = "block"
+POLICIES = (MERGE, DROP, BLOCK)
+
+
+class SpeechQueue:
+    """Ограниченная упорядоченная очередь фраз и поток, который их озвучивает.
+
+    handler(text) озвучивает одну фразу и выполняется в потоке синтеза.
+    """
+
+    def __init__(self, handler=None, maxsize=MAX_PENDING, policy=MERGE,
+                 merge_chars=MERGE_CHARS, put_timeout=PUT_TIMEOUT):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика очереди озвучки: {policy}")
+        self.handler = handler
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.merge_chars = merge_chars
+        self.put_timeout = put_timeout
+        # Элемент очереди: [текст, время постановки]
+        self._items = deque()
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = False
+        self.enqueued = 0
+        self.spoken = 0
+        self.merged = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.speak_total = 0.0
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    def active(self):
+        """Есть ли ожидающие или озвучиваемые фразы (без блокировки)."""
+        return bool(self._items) or self._busy
+
+    def put(self, text):
+        """Ставит фразу в очередь; возвращает False, если она выброшена."""
+        text = text.strip()
+        if not text:
+            return False
+        with self._cond:
+            self.enqueued += 1
+            if len(self._items) >= self.maxsize and not self._make_room(text):
+                self.dropped += 1
+                return False
+            if len(self._items) < self.maxsize:
+                self._items.append([text, time.monotonic()])
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._wake()
+        return True
+
+    def when_idle(self, task):
+        """Выполняет task() в потоке синтеза, когда озвучивать нечего."""
+        with self._cond:
+            self._idle.append(task)
+            self._wake()
+
+    def _wake(self):
+        """Будит поток синтеза, при первом вызове запускает его (под блокировкой)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _make_room(self, text):
+        """Освобождает место по политике (вызывается под блокировкой)."""
+        if self.policy == BLOCK:
+            deadline = time.monotonic() + self.put_timeout
+            while len(self._items) >= self.maxsize:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+        if self.policy == MERGE:
+            last = self._items[-1]
+            if len(last[0]) + len(text) <= self.merge_chars:
+                last[0] += " " + text
+                self.merged += 1
+                return True
+        self._items.popleft()
+        self.dropped += 1
+        return True
+
+    def _take(self):
+        """Забирает первую фразу и идущие за ней короткие (под блокировкой)."""
+        text, queued = self._items.popleft()
+        waited = time.monotonic() - queued
+        while self._items and len(text) + len(self._items[0][0]) < self.merge_chars:
+            text += " " + self._items.popleft()[0]
+            self.merged += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return text
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._idle:
+                    self._cond.wait()
+                if not self._items:
+                    task = self._idle.popleft()
+                else:
+                    task = None
+                    text = self._take()
+                    self._busy = True
+                    self._cond.notify_all()
+            if task is not None:
+                try:
+                    task()
+                except Exception as e:
+                    print(f"Ошибка фоновой задачи озвучки: {e}")
+                continue
+            started = time.monotonic()
+            try:
+                if self.handler is not None:
+                    self.handler(text)
+            except Exception as e:
+                print(f"Ошибка при озвучивании текста: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self.spoken += 1
+                    self.speak_total += time.monotonic() - started
+                    self._cond.notify_all()
+
+    def clear(self):
+        """Выбрасывает ожидающие фразы (текущая договаривается); возвращает их число."""
+        with self._cond:
+            count = len(self._items)
+            self._items.clear()
+            self.dropped += count
+            self._cond.notify_all()
+        return count
+
+    def join(self, timeout=None):
+        """Ждёт, пока очередь опустеет и текущая фраза будет озвучена."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._items or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def status(self):
+        """Счётчики очереди для команды «статистика»."""
+        with self._cond:
+            calls = self.spoken or 1
+            return (f"Озвучка: в очереди {len(self._items)} (максимум {self.max_depth} из {self.maxsize}, "
+                    f"политика {self.policy}), принято {self.enqueued}, вызовов синтеза {self.spoken}, "
+                    f"слито {self.merged}, выброшено {self.dropped}; "
+                    f"ожидание в среднем {self.wait_total / calls:.2f} с (максимум {self.wait_max:.2f} с), "
+                    f"озвучка {self.speak_total / calls:.2f} с")
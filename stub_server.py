@@ -0,0 +1,278 @@
+"""Локальный OpenAI-совместимый сервер-заглушка для тестов без GPU.
+
+Отвечает на GET /v1/models и POST /v1/chat/completions (потоково и
+обычно). Текст ответа берётся из записанного SSE-потока (--replay, например
+сохранённый вывод curl -N) или из встроенного образца. Скорость, разброс
+задержек, число токенов в событии и ошибки настраиваются:
+
+    python stub_server.py --port 8765 --rate 40 --jitter 0.3 --chunk 1 \\
+        --ttft 0.2 --error-rate 0.05 --drop-rate 0.02
+
+GET /_stub/last возвращает время отправки каждого события последнего
+потокового ответа — по нему bench_stream.py считает задержку клиента, —
+и общее число токенов, отправленных с запуска заглушки.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = ("saiga_mistral_7b_gguf", "stub-model")
+
+SAMPLE_TEXT = (
+    "Конечно, давайте разберёмся. Сначала создайте виртуальное окружение командой "
+    "python -m venv venv и активируйте его. Затем установите зависимости из файла "
+    "requirements.txt. После этого запустите сервер и откройте адрес в браузере! "
+    "Если появится ошибка импорта, проверьте, что окружение активировано. "
+    "Для работы с базой данных используйте SQLite: она не требует отдельного сервера. "
+    "Таблицы удобно описывать через SQLAlchemy, а миграции выполнять через Alembic. "
+    "Хотите, я покажу пример структуры проекта? "
+)
+
+_TOKEN = re.compile(r'\S+\s*|\s+')
+
+
+def load_replay(path):
+    """Читает текст ответа из записанного SSE-потока."""
+    parts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith('data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == '[DONE]':
+                break
+            try:
+                choices = json.loads(payload).get('choices') or [{}]
+            except ValueError:
+                continue
+            parts.append((choices[0].get('delta') or {}).get('content') or "")
+    return [part for part in parts if part]
+
+
+class StubConfig:
+    """Параметры поведения сервера-заглушки."""
+
+    def __init__(self, rate=50.0, jitter=0.0, chunk_size=1, ttft=0.0,
+                 error_rate=0.0, error_status=500, drop_rate=0.0,
+                 tokens=None, models=DEFAULT_MODELS, seed=None):
+        # Токенов в секунду (0 — без пауз)
+        self.rate = rate
+        # Относительный разброс паузы между событиями (0.3 — ±30%)
+        self.jitter = jitter
+        # Токенов в одном SSE-событии
+        self.chunk_size = max(1, chunk_size)
+        # Задержка перед первым событием, сек
+        self.ttft = ttft
+        # Доля запросов, на которые сразу отвечать ошибкой error_status
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Доля потоков, обрываемых на середине
+        self.drop_rate = drop_rate
+        self.tokens = tokens or _TOKEN.findall(SAMPLE_TEXT * 4)
+        self.models = list(models)
+        self.random = random.Random(seed)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: соединения остаются открытыми, как у настоящего сервера
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ("/v1/models", "/models"):
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": name, "object": "model", "owned_by": "stub"} for name in self.config.models]
+            })
+        elif self.path == "/_stub/last":
+            self._send_json(200, {"sent": self.server.last_sent, "tokens": self.server.tokens_sent})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+        if self.path.rstrip('/') not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.config
+        if config.random.random() < config.error_rate:
+            self._send_json(config.error_status, {"error": {"message": "injected error"}})
+            return
+
+        tokens = config.tokens[:payload.get("max_tokens") or len(config.tokens)]
+        model = payload.get("model") or config.models[0]
+        if payload.get("stream"):
+            self._stream(model, tokens)
+        else:
+            self._complete(model, tokens, payload)
+
+    def _pause(self, count):
+        config = self.config
+        if config.rate <= 0:
+            return
+        delay = count / config.rate
+        if config.jitter:
+            delay *= 1 + config.random.uniform(-config.jitter, config.jitter)
+        time.sleep(max(0.0, delay))
+
+    def _complete(self, model, tokens, payload):
+        time.sleep(self.config.ttft)
+        # Обычный запрос ждет генерации всего ответа
+        self._pause(len(tokens))
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in payload.get("messages", []))
+        self.server.count_tokens(len(tokens))
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_chars // 4 + len(tokens)
+            }
+        })
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, model, tokens):
+        config = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        drop_at = None
+        if config.random.random() < config.drop_rate:
+            drop_at = config.random.randrange(max(1, len(tokens)))
+        sent = []
+        self.server.last_sent = sent
+        time.sleep(config.ttft)
+        created = int(time.time())
+        for start in range(0, len(tokens), config.chunk_size):
+            if drop_at is not None and start >= drop_at:
+                # Обрыв соединения посреди ответа
+                self.close_connection = True
+                return
+            if start:
+                self._pause(config.chunk_size)
+            event = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": "".join(tokens[start:start + config.chunk_size])},
+                    "finish_reason": None
+                }]
+            }
+            self._write_chunk(b"data: " + json.dumps(event, ensure_ascii=False).encode('utf-8') + b"\n\n")
+            sent.append(time.time())
+            self.server.count_tokens(len(tokens[start:start + config.chunk_size]))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+class StubServer(ThreadingHTTPServer):
+    """Сервер-заглушка; start() запускает его в фоновом потоке."""
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), StubHandler)
+        self.config = config or StubConfig()
+        self.last_sent = []
+        self.tokens_sent = 0
+        self._count_lock = threading.Lock()
+
+    def count_tokens(self, count):
+        with self._count_lock:
+            self.tokens_sent += count
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение (например, прервал поток) — это не ошибка сервера
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-совместимый сервер-заглушка")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 — любой свободный порт")
+    parser.add_argument("--rate", type=float, default=50.0, help="токенов в секунду (0 — без пауз)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс паузы, доля")
+    parser.add_argument("--chunk", type=int, default=1, help="токенов в одном событии")
+    parser.add_argument("--ttft", type=float, default=0.0, help="задержка первого события, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="доля оборванных потоков")
+    parser.add_argument("--replay", help="файл с записанным SSE-потоком")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        rate=args.rate, jitter=args.jitter, chunk_size=args.chunk, ttft=args.ttft,
+        error_rate=args.error_rate, error_status=args.error_status, drop_rate=args.drop_rate,
+        tokens=load_replay(args.replay) if args.replay else None, seed=args.seed
+    )
+    server = StubServer(config, args.host, args.port)
+    # Первая строка вывода — адрес; по ней bench_stream.py находит сервер
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
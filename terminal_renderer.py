@@ -0,0 +1,92 @@
+"""Вывод в терминал кадрами с фиксированной частотой.
+
+Каждый print(..., flush=True) — отдельный системный вызов, а консоль
+Windows перерисовывается на каждый из них. Поэтому текст копится в буфере
+и выводится одной записью не чаще FRAME_RATE раз в секунду. Если консоль
+не успевает, следующий кадр просто получается больше — вывод не отстаёт.
+
+Эффект «печатания» (type_text) укладывается в MAX_TYPING_SECONDS при
+любой длине текста: за кадр выводится сразу несколько символов.
+"""
+import math
+import sys
+import threading
+import time
+
+FRAME_RATE = 30
+# Дольше этого «печатание» не длится, сколько бы ни было текста
+MAX_TYPING_SECONDS = 1.0
+
+
+class TerminalRenderer:
+    """Буферизованный вывод в терминал с ограничением частоты кадров."""
+
+    def __init__(self, stream=None, fps=FRAME_RATE):
+        # None — текущий sys.stdout (учитывает его подмену)
+        self.stream = stream
+        self.interval = 1.0 / fps
+        self.frames = 0
+        self._parts = []
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._last_frame = 0.0
+        self._thread = None
+
+    def write(self, text):
+        """Добавляет текст в буфер; он появится на экране со следующим кадром."""
+        if not text:
+            return
+        with self._lock:
+            self._parts.append(text)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+        self._pending.set()
+
+    def _loop(self):
+        while True:
+            self._pending.wait()
+            delay = self._last_frame + self.interval - time.monotonic()
+            if delay > 0:
+                # Пока ждём кадра, в буфер успевают прийти новые токены
+                time.sleep(delay)
+            self.flush()
+
+    def flush(self):
+        """Сразу выводит накопленный текст одной записью."""
+        with self._lock:
+            self._pending.clear()
+            if not self._parts:
+                return
+            text = ''.join(self._parts)
+            self._parts.clear()
+            stream = self.stream or sys.stdout
+            stream.write(text)
+            stream.flush()
+            self._last_frame = time.monotonic()
+            self.frames += 1
+
+    def type_text(self, text, char_delay=0.01, max_duration=MAX_TYPING_SECONDS):
+        """Выводит текст с эффектом печатания (не дольше max_duration секунд)."""
+        self.flush()
+        if not text:
+            return
+        duration = min(len(text) * char_delay, max_duration)
+        frames = max(1, int(duration / self.interval))
+        step = math.ceil(len(text) / frames)
+        for start in range(0, len(text), step):
+            if start:
+                time.sleep(self.interval)
+            self.write(text[start:start + step])
+            self.flush()
+
+
+_renderer = None
+
+
+def get_renderer():
+    """Возвращает общий объект вывода в терминал."""
+    global _renderer
+    if _renderer is None:
+        _renderer = TerminalRenderer()
+    return _renderer
@@ -1,15 +1,17 @@
-import requests
 import json
 
+import llm_client
+import llm_providers
+
 # URL для проверки подключения
-base_url = "http://26.224.68.101:1234/v1"
+base_url = llm_providers.default_base_url()
 models_url = f"{base_url}/models"
 
 print(f"Проверка подключения к серверу LM Studio по адресу: {base_url}")
 
 try:
     # Проверка доступности API
-    response = requests.get(models_url)
+    response = llm_client.get(models_url)
     
     if response.status_code == 200:
         print("Подключение успешно!")
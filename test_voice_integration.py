@@ -7,7 +7,8 @@ def main():
     # Инициализируем голосовой менеджер
     voice_manager = VoiceManager()
     
-    if not voice_manager.enabled:
+    # Модель загружается в фоне; ждем ее перед проверками
+    if not voice_manager.wait_ready():
         print("Не удалось инициализировать голосовой движок")
         return
     
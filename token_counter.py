@@ -0,0 +1,160 @@
+"""Подсчёт токенов для разных моделей.
+
+Токенизатор выбирается по имени модели (по тем же шаблонам, что и
+MODEL_CONTEXT_LENGTHS в cmd_assistant.py) и загружается только из
+локальных файлов каталога tokenizers/:
+
+- tokenizers/<имя>.json — tokenizer.json от HuggingFace (нужен пакет tokenizers);
+- tiktoken:<кодировка> — кодировка tiktoken; BPE-файлы берутся из
+  tokenizers/tiktoken (переменная TIKTOKEN_CACHE_DIR), а если файла там
+  нет, используется оценка — в сеть счётчик не ходит.
+
+Если токенизатор недоступен, используется быстрая оценка по классам
+символов: кириллица занимает заметно больше токенов на символ, чем
+латиница, и прежняя формула len(text) // 4 сильно её недооценивала.
+
+Число токенов кэшируется в самом сообщении истории (ключ "_tokens"),
+поэтому повторный подсчёт на каждом ходу стоит O(1).
+"""
+import hashlib
+import os
+import re
+
+TOKENIZERS_DIR = "tokenizers"
+
+# Шаблон имени модели -> источник токенизатора
+TOKENIZER_SOURCES = {
+    'deepseek-coder': 'deepseek-coder.json',
+    'mistral-nemo': 'mistral-nemo.json',
+    'mathstral': 'mistral.json',
+    'saiga_mistral': 'mistral.json',
+    'mixtral': 'mistral.json',
+    'mistral': 'mistral.json',
+    'llama3': 'llama3.json',
+    'gpt-4': 'tiktoken:cl100k_base',
+    'gpt-3.5-turbo': 'tiktoken:cl100k_base',
+}
+
+# Символов на токен для оценки без токенизатора (по семействам словарей).
+# sentencepiece (Llama/Mistral) разбивает числа по одной цифре.
+ESTIMATOR_PROFILES = {
+    'sentencepiece': {'latin': 3.8, 'cyrillic': 2.4, 'digit': 1.0, 'other': 1.0},
+    'bpe': {'latin': 4.2, 'cyrillic': 2.8, 'digit': 3.0, 'other': 1.3},
+}
+
+_LATIN = re.compile(r'[A-Za-z]+')
+_CYRILLIC = re.compile(r'[А-Яа-яЁё]+')
+_DIGITS = re.compile(r'[0-9]+')
+_OTHER = re.compile(r'[^\sA-Za-zА-Яа-яЁё0-9]')
+
+CACHE_KEY = "_tokens"
+
+# Откуда tiktoken скачивает кодировки; в кэше файл назван SHA-1 от адреса
+TIKTOKEN_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+
+class TokenCounter:
+    """Базовый счётчик: оценка по классам символов и кэш результата в сообщении.
+
+    Подклассы с настоящим токенизатором переопределяют count().
+    """
+
+    name = "base"
+    profile = ESTIMATOR_PROFILES['sentencepiece']
+
+    def count(self, text):
+        text = str(text)
+        if not text:
+            return 0
+        p = self.profile
+        latin = sum(map(len, _LATIN.findall(text)))
+        cyrillic = sum(map(len, _CYRILLIC.findall(text)))
+        digits = sum(map(len, _DIGITS.findall(text)))
+        other = len(_OTHER.findall(text))
+        estimate = (latin / p['latin'] + cyrillic / p['cyrillic']
+                    + digits / p['digit'] + other / p['other'])
+        return max(1, int(estimate + 0.5))
+
+    def count_message(self, message):
+        """Считает токены сообщения, используя кэш в самом сообщении."""
+        cached = message.get(CACHE_KEY)
+        if cached and cached[0] == self.name:
+            return cached[1]
+        tokens = self.count(message.get("content") or "")
+        message[CACHE_KEY] = [self.name, tokens]
+        return tokens
+
+
+class EstimatingCounter(TokenCounter):
+    """Оценка числа токенов по классам символов."""
+
+    def __init__(self, profile='sentencepiece'):
+        self.profile = ESTIMATOR_PROFILES[profile]
+        self.name = f"estimate:{profile}"
+
+
+class HFTokenizerCounter(TokenCounter):
+    """Точный подсчёт по tokenizer.json (пакет tokenizers)."""
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(path)
+        self.name = f"hf:{os.path.basename(path)}"
+
+    def count(self, text):
+        return len(self.tokenizer.encode(str(text), add_special_tokens=False).ids)
+
+
+class TiktokenCounter(TokenCounter):
+    """Точный подсчёт кодировкой tiktoken (файлы из локального кэша)."""
+
+    def __init__(self, encoding_name):
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(TOKENIZERS_DIR, "tiktoken"))
+        # Без файла в кэше tiktoken пошёл бы скачивать кодировку из сети
+        url = TIKTOKEN_URL.format(encoding_name)
+        path = os.path.join(os.environ["TIKTOKEN_CACHE_DIR"], hashlib.sha1(url.encode()).hexdigest())
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"нет локального файла кодировки {encoding_name}: {path}")
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken:{encoding_name}"
+
+    def count(self, text):
+        return len(self.encoding.encode(str(text), disallowed_special=()))
+
+
+def _find_source(model_name):
+    model = (model_name or "").lower()
+    for pattern, source in TOKENIZER_SOURCES.items():
+        if pattern in model:
+            return source
+    return None
+
+
+def _load_counter(source):
+    """Загружает токенизатор; при любой ошибке возвращает оценку."""
+    if source and source.startswith("tiktoken:"):
+        try:
+            return TiktokenCounter(source.split(":", 1)[1])
+        except Exception:
+            return EstimatingCounter('bpe')
+    if source:
+        path = os.path.join(TOKENIZERS_DIR, source)
+        if os.path.exists(path):
+            try:
+                return HFTokenizerCounter(path)
+            except Exception as e:
+                print(f"Не удалось загрузить токенизатор {path}: {e}")
+    return EstimatingCounter('sentencepiece')
+
+
+_counters = {}
+
+
+def get_counter(model_name):
+    """Возвращает счётчик токенов для модели (загружается один раз)."""
+    source = _find_source(model_name)
+    counter = _counters.get(source)
+    if counter is None:
+        counter = _counters[source] = _load_counter(source)
+    return counter
@@ -1,7 +1,7 @@
 from crewai_tools import BaseTool
 import subprocess
 import os
-import requests
+import resilience
 import sqlite3
 from bs4 import BeautifulSoup
 from PyPDF2 import PdfReader
@@ -88,7 +88,7 @@ class HTMLScraperTool(BaseTool):
 
     def _run(self, url: str):
         try:
-            response = requests.get(url)
+            response = resilience.request("GET", url)
             soup = BeautifulSoup(response.text, 'html.parser')
             return soup.get_text()[:3000]
         except Exception as e:
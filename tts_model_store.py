@@ -0,0 +1,244 @@
+"""Локальное хранилище моделей Silero TTS.
+
+torch.hub.load('snakers4/silero-models', ...) при каждом запуске
+разрешает репозиторий на GitHub, импортирует его hubconf и только потом
+скачивает (или берёт из кэша hub) файл модели. Модели Silero v3 — это
+файлы torch.package, и hub лишь открывает их через PackageImporter. Здесь
+файл модели скачивается один раз в STORE_DIR и дальше открывается
+напрямую: без git, GitHub и сети.
+
+Контрольная сумма SHA-256 каждого файла закрепляется в models.lock.json
+при первой загрузке (или при импорте файла, принесённого на флешке) и
+проверяется при каждом открытии. Чтобы не хешировать десятки мегабайт
+на каждом запуске, полная проверка повторяется, только если изменились
+размер или время изменения файла.
+
+Для машин без сети: на машине с сетью
+    python tts_model_store.py download v3_1_ru
+и перенести папку tts_models целиком (вместе с models.lock.json), либо на
+целевой машине
+    python tts_model_store.py import v3_1_ru путь/к/v3_1_ru.pt [sha256]
+LLM_TTS_OFFLINE=1 запрещает загрузку из сети, LLM_TTS_MODELS задаёт папку.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+# Папка хранилища моделей
+STORE_DIR = os.getenv("LLM_TTS_MODELS", "tts_models")
+LOCK_FILE = "models.lock.json"
+# Без сети: модель должна уже лежать в хранилище
+OFFLINE = os.getenv("LLM_TTS_OFFLINE", "0") == "1"
+# Откуда скачивать модели (те же файлы, что берёт hub silero-models)
+MODEL_URLS = {
+    "v3_1_ru": "https://models.silero.ai/models/tts/ru/v3_1_ru.pt",
+    "ru_v3": "https://models.silero.ai/models/tts/ru/ru_v3.pt",
+    "v4_ru": "https://models.silero.ai/models/tts/ru/v4_ru.pt",
+}
+# Имя модели по умолчанию
+DEFAULT_MODEL = "v3_1_ru"
+# Размер куска при скачивании и хешировании
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60.0
+
+
+class ModelStoreError(Exception):
+    """Модель нельзя получить из хранилища."""
+
+
+class ChecksumMismatch(ModelStoreError):
+    """Файл модели не совпадает с закреплённой контрольной суммой."""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """Папка с файлами моделей и закреплёнными контрольными суммами."""
+
+    def __init__(self, root=STORE_DIR, offline=OFFLINE):
+        self.root = root
+        self.offline = offline
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.root, f"{name}.pt")
+
+    def _lock_path(self):
+        return os.path.join(self.root, LOCK_FILE)
+
+    def pins(self):
+        """Закреплённые модели: {имя: {sha256, size, mtime_ns, url}}."""
+        try:
+            with open(self._lock_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            raise ModelStoreError(f"Не удалось прочитать {self._lock_path()}: {e}")
+
+    def _save_pins(self, pins):
+        os.makedirs(self.root, exist_ok=True)
+        temp = self._lock_path() + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(pins, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(temp, self._lock_path())
+
+    def _pin(self, name, path, sha256, url=None):
+        stat = os.stat(path)
+        pins = self.pins()
+        entry = pins.get(name, {})
+        entry.update(sha256=sha256, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        if url:
+            entry["url"] = url
+        pins[name] = entry
+        self._save_pins(pins)
+
+    def verify(self, name, full=False):
+        """Проверяет файл модели по закреплённой сумме; возвращает путь.
+
+        Если размер и время изменения совпадают с проверенными ранее,
+        файл не хешируется заново (full=True — хешировать всегда).
+        """
+        path = self.path(name)
+        pin = self.pins().get(name)
+        if pin is None:
+            raise ModelStoreError(f"Модель {name} не закреплена в {self._lock_path()}; "
+                                  f"добавьте файл командой: python tts_model_store.py import {name} {path}")
+        stat = os.stat(path)
+        if not full and stat.st_size == pin.get("size") and stat.st_mtime_ns == pin.get("mtime_ns"):
+            return path
+        actual = file_sha256(path)
+        if actual != pin["sha256"]:
+            raise ChecksumMismatch(f"{path}: SHA-256 {actual}, ожидалась {pin['sha256']}")
+        # Содержимое то же (например, файл скопирован заново) — запоминаем новое время
+        self._pin(name, path, actual)
+        return path
+
+    def download(self, name, url=None):
+        """Скачивает модель в хранилище и закрепляет её сумму; возвращает путь."""
+        if self.offline:
+            raise ModelStoreError(f"Модели {name} нет в {self.root}, а загрузка из сети запрещена (LLM_TTS_OFFLINE=1)")
+        url = url or MODEL_URLS.get(name)
+        if url is None:
+            raise ModelStoreError(f"Неизвестная модель {name}; известные: {', '.join(MODEL_URLS)}")
+        import resilience
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(name)
+        partial = path + ".part"
+        print(f"Загрузка модели {name} из {url}...")
+        response = resilience.request("GET", url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        try:
+            if response.status_code != 200:
+                raise ModelStoreError(f"Не удалось скачать {url}: HTTP {response.status_code}")
+            digest = hashlib.sha256()
+            with open(partial, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+        finally:
+            response.close()
+        sha256 = digest.hexdigest()
+        pinned = self.pins().get(name, {}).get("sha256")
+        if pinned and pinned != sha256:
+            os.remove(partial)
+            raise ChecksumMismatch(f"{url}: SHA-256 {sha256}, закреплена {pinned}")
+        os.replace(partial, path)
+        self._pin(name, path, sha256, url)
+        print(f"Модель {name} сохранена в {path} (SHA-256 {sha256})")
+        return path
+
+    def import_file(self, name, source, sha256=None):
+        """Копирует файл модели в хранилище (для машин без сети) и закрепляет сумму."""
+        actual = file_sha256(source)
+        expected = sha256 or self.pins().get(name, {}).get("sha256")
+        if expected and actual != expected:
+            raise ChecksumMismatch(f"{source}: SHA-256 {actual}, ожидалась {expected}")
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(name)
+        shutil.copyfile(source, path)
+        self._pin(name, path, actual)
+        return path
+
+    def ensure(self, name):
+        """Путь к проверенному файлу модели; при необходимости скачивает её."""
+        with self._lock:
+            if os.path.exists(self.path(name)):
+                return self.verify(name)
+            return self.download(name)
+
+    def load(self, name=DEFAULT_MODEL, device=None):
+        """Открывает модель из локального файла torch.package."""
+        path = self.ensure(name)
+        from torch.package import PackageImporter
+        importer = PackageImporter(path)
+        model = importer.load_pickle("tts_models", "model")
+        if device is not None:
+            model.to(device)
+        return model
+
+
+_store = None
+
+
+def get_store():
+    """Возвращает общее хранилище моделей."""
+    global _store
+    if _store is None:
+        _store = ModelStore()
+    return _store
+
+
+def load_model(name=DEFAULT_MODEL, device=None):
+    """Загружает модель Silero TTS из локального хранилища (замена torch.hub.load)."""
+    return get_store().load(name, device)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальное хранилище моделей Silero TTS")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="модели в хранилище и их суммы")
+    download = commands.add_parser("download", help="скачать модель и закрепить сумму")
+    download.add_argument("name", nargs="?", default=DEFAULT_MODEL)
+    verify = commands.add_parser("verify", help="полностью перепроверить суммы")
+    verify.add_argument("name", nargs="*")
+    imported = commands.add_parser("import", help="добавить файл модели без сети")
+    imported.add_argument("name")
+    imported.add_argument("file")
+    imported.add_argument("sha256", nargs="?")
+    args = parser.parse_args()
+
+    store = get_store()
+    try:
+        if args.command == "list":
+            pins = store.pins()
+            if not pins:
+                print(f"В {store.root} нет моделей")
+            for name, pin in sorted(pins.items()):
+                state = "есть" if os.path.exists(store.path(name)) else "нет файла"
+                print(f"{name}: {state}, {pin['size'] / 1024 / 1024:.1f} МБ, SHA-256 {pin['sha256']}")
+        elif args.command == "download":
+            store.download(args.name)
+        elif args.command == "verify":
+            for name in args.name or sorted(store.pins()):
+                store.verify(name, full=True)
+                print(f"{name}: OK")
+        elif args.command == "import":
+            path = store.import_file(args.name, args.file, args.sha256)
+            print(f"Модель {args.name} добавлена: {path}")
+    except (ModelStoreError, OSError) as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
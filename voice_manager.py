@@ -3,6 +3,7 @@ import os
 import threading
 import sounddevice as sd
 import numpy as np
+import tts_model_store
 
 class VoiceManager:
     def __init__(self):
@@ -21,13 +22,7 @@ class VoiceManager:
         """Инициализирует голосовой движок"""
         try:
             print("Инициализация Silero TTS...")
-            self.model, _ = torch.hub.load(
-                repo_or_dir='snakers4/silero-models',
-                model='silero_tts',
-                language='ru',
-                speaker='v3_1_ru'
-            )
-            self.model.to(self.device)
+            self.model = tts_model_store.load_model('v3_1_ru', self.device)
             self.enabled = True
             print(f"Голосовой движок инициализирован (устройство: {self.device})")
             return True